@@ -0,0 +1,105 @@
+"""
+Checks that crawler/html_cleaner.clean_html() keeps the same text as the BeautifulSoup based soup_cleanse() and
+benchmarks both on synthetic Guardian-like article bodies.
+
+Run from the repository root with
+
+    python -m benchmarks.bench_cleaner [n_bodies] [seed]
+"""
+import random
+import sys
+import time
+from html.parser import HTMLParser
+
+from crawler.html_cleaner import bs4_cleanse, clean_html, clean_many
+
+WORDS = ['Qatar', 'World', 'Cup', 'fans', 'stadium', 'human', 'rights', 'Fifa', 'England', 'said', 'the', 'migrant',
+         'workers', 'armband', '&amp;', '&pound;220bn', '&nbsp;', '"quoted"', "it's", '<', '>']
+INLINE = ['a', 'strong', 'em', 'span', 'time', 's', 'sup', 'b', 'i', 'abbr']
+BLOCK = ['p', 'p', 'p', 'h2', 'blockquote', 'ul', 'figure', 'aside', 'div', 'table']
+
+
+class _TextExtractor(HTMLParser):
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+
+    def handle_data(self, data):
+        self.parts.append(data)
+
+
+def extract_text(html):
+    """The text of an HTML string with entities resolved and runs of whitespace collapsed to single spaces."""
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return ' '.join(''.join(extractor.parts).split())
+
+
+def _text(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n)).replace(' < ', ' &lt; ').replace(' > ', ' &gt; ')
+
+
+def _inline(rng, depth=0):
+    tag = rng.choice(INLINE)
+    attrs = {'a': ' href="https://www.theguardian.com/football?x=1&amp;y=2" data-link-name="in body link"',
+             'time': ' datetime="2022-11-20T16:00:00Z"',
+             'span': ' class="  element-image__caption  "'}.get(tag, '')
+    inner = _text(rng, rng.randint(1, 6))
+    if depth < 2 and rng.random() < 0.3:
+        inner += ' ' + _inline(rng, depth + 1)
+    return f'<{tag}{attrs}>{inner}</{tag}>'
+
+
+def make_body(rng):
+    """A random article body with the tags, attributes and entities of the Guardian API's body field."""
+    parts = []
+    for _ in range(rng.randint(5, 40)):
+        tag = rng.choice(BLOCK)
+        if tag == 'ul':
+            items = ''.join(f'<li>{_text(rng, 8)}</li>' for _ in range(rng.randint(1, 4)))
+            parts.append(f'<ul>{items}</ul>')
+        elif tag == 'figure':
+            parts.append('<figure class="element element-image"><img src="https://i.guim.co.uk/img/a.jpg" alt="A '
+                         '&quot;fan&quot;" width="1000"><figcaption><span>Photograph: Getty</span></figcaption>'
+                         '</figure>')
+        elif tag == 'table':
+            parts.append(f'<table><tr><td headers=" a  b ">{_text(rng, 3)}</td></tr></table>')
+        else:
+            content = ' '.join(_inline(rng) if rng.random() < 0.4 else _text(rng, rng.randint(5, 25))
+                               for _ in range(rng.randint(1, 6)))
+            parts.append(f'<{tag}>{content}</{tag}>')
+        if rng.random() < 0.1:
+            parts.append('<br>')
+        if rng.random() < 0.05:
+            parts.append('<p>unclosed paragraph <strong>bold')
+    return '\n'.join(parts)
+
+
+def main(n_bodies=3000, seed=0):
+    rng = random.Random(seed)
+    bodies = [make_body(rng) for _ in range(n_bodies)]
+    print(f"{n_bodies} bodies, {sum(map(len, bodies)) / 1e6:.1f} MB of HTML")
+
+    start = time.perf_counter()
+    expected = [bs4_cleanse(body) for body in bodies]
+    bs4_time = time.perf_counter() - start
+    start = time.perf_counter()
+    cleaned = [clean_html(body) for body in bodies]
+    single_pass_time = time.perf_counter() - start
+    start = time.perf_counter()
+    parallel = clean_many(bodies)
+    parallel_time = time.perf_counter() - start
+
+    mismatches = [i for i, (a, b) in enumerate(zip(expected, cleaned)) if extract_text(a) != extract_text(b)]
+    assert not mismatches, f"the text of {len(mismatches)} bodies differs from soup_cleanse, first: {mismatches[0]}"
+    assert parallel == cleaned
+    print(f"soup_cleanse: {bs4_time:.2f}s, clean_html: {single_pass_time:.2f}s "
+          f"({bs4_time / single_pass_time:.1f}x), clean_many: {parallel_time:.2f}s "
+          f"({bs4_time / parallel_time:.1f}x)")
+    return {'bs4': bs4_time, 'clean_html': single_pass_time, 'clean_many': parallel_time}
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3000, int(sys.argv[2]) if len(sys.argv) > 2 else 0)
@@ -0,0 +1,79 @@
+"""
+Benchmarks the per-document stages of preprocessing._preprocess_documents() (with pos_aware=False) followed by the
+rare token filter of preprocess() against the list-based chain preprocess() used before, on the articles of
+sun_articles.json, and checks that both give the same lemmas and lemmatised text.
+
+Run from the repository root with
+
+    python -m benchmarks.bench_filter [articles.json] [n_articles]
+"""
+import sys
+import time
+from collections import Counter
+from string import punctuation
+
+import nltk
+import pandas as pd
+from nltk.corpus import stopwords
+from nltk.stem import WordNetLemmatizer
+from nltk.tokenize import word_tokenize
+
+from get_playernames import fetch_playerlist
+from preprocessing import _drop_lemmas, _preprocess_documents, find_rare_tokens
+
+
+def legacy_filter(df, playerlist):
+    """
+        The chain of the old preprocess(): one pass over the column per stage, list membership tests and
+        nltk.pos_tag() per article. Like the old preprocess(), 'lemmatised_text' is joined before rare tokens are
+        removed.
+    """
+    df['sentences'] = df['content'].apply(lambda x: nltk.sent_tokenize(x))
+    df['tokens'] = df['content'].apply(lambda x: [word.lower() for word in word_tokenize(x) if word not in punctuation])
+    stopwords_list = stopwords.words('english')
+    df['tokens'] = df['tokens'].apply(lambda x: [word for word in x if word not in stopwords_list])
+    df['tokens'] = df['tokens'].apply(lambda x: [word for word in x if word.isalpha()])
+    df['pos_tags'] = df['tokens'].apply(lambda x: nltk.pos_tag(x))
+    lemmatiser = WordNetLemmatizer()
+    df['lemmas'] = df['tokens'].apply(lambda x: [lemmatiser.lemmatize(token) for token in x])
+    df['lemmas'] = df['lemmas'].apply(lambda x: [token for token in x if token not in playerlist])
+    df['lemmatised_text'] = df['lemmas'].apply(lambda x: ' '.join(x))
+    token_counts = Counter(token for doc in df['lemmas'] for token in doc)
+    rare_tokens = [token for token, count in token_counts.items() if count < 10]
+    df['lemmas'] = [[token for token in doc if token not in rare_tokens] for doc in df['lemmas']]
+    return df[df['lemmas'].map(len) > 0]
+
+
+def fused_filter(df, playerlist):
+    """The stages of the new preprocess(): _preprocess_documents() and the rare token filter."""
+    df, _, _ = _preprocess_documents(df, playerlist, pos_aware=False)
+    rare_tokens, _ = find_rare_tokens(df['lemmas'])
+    df = _drop_lemmas(df, rare_tokens)
+    return df[df['lemmas'].map(len) > 0]
+
+
+def main(json_file='sun_articles.json', n_articles=None):
+    df = pd.read_json(json_file)
+    if n_articles is not None:
+        df = df.iloc[:n_articles]
+    playerlist = fetch_playerlist()
+    print(f"{len(df)} articles")
+
+    timings = {}
+    results = {}
+    for name, function in (('legacy', legacy_filter), ('fused', fused_filter)):
+        start = time.perf_counter()
+        results[name] = function(df[['content']].copy(), playerlist)
+        timings[name] = time.perf_counter() - start
+        print(f"{name}: {timings[name]:.2f}s")
+
+    for column in ('lemmas', 'lemmatised_text'):
+        assert results['legacy'][column].tolist() == results['fused'][column].tolist(), \
+            f"'{column}' of _preprocess_documents() differs from the legacy chain"
+    print(f"speedup: {timings['legacy'] / timings['fused']:.1f}x")
+    return timings
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else 'sun_articles.json',
+         int(sys.argv[2]) if len(sys.argv) > 2 else None)
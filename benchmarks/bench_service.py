@@ -0,0 +1,189 @@
+"""
+Load test of the term query service (term_service.py): <connections> clients send a mix of rank, months, top and
+prefix queries over keep-alive connections as fast as the service answers, and the p50/p99 latency of every query type
+and the throughput are reported. The terms are drawn from the service's own vocabulary (via /prefix), so most of them
+occur in at least one newspaper.
+
+Run from the repository root with
+
+    python -m benchmarks.bench_service [--url 127.0.0.1:8765] [--connections 32] [--requests 20000] [--spawn]
+
+--spawn starts the service (python term_service.py) in a separate process first and stops it afterwards.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUERIES = ('rank', 'months', 'top', 'prefix')
+
+
+class Client:
+    """One keep-alive HTTP/1.1 connection to the service."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def get(self, target):
+        """Sends a GET request and returns the status and the decoded JSON answer."""
+        self.writer.write(f"GET {target} HTTP/1.1\r\nHost: {self.host}\r\n\r\n".encode())
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    def close(self):
+        self.writer.close()
+
+
+async def vocabulary_sample(client, n_terms, rng):
+    """Returns up to n_terms terms of the service's vocabularies, collected with prefix queries per letter."""
+    terms = set()
+    for letter in 'abcdefghijklmnopqrstuvwxyz':
+        _, answer = await client.get(f"/prefix?q={letter}&limit=200")
+        for entries in answer['terms'].values():
+            terms.update(term for term, _ in entries)
+    terms = sorted(terms)
+    rng.shuffle(terms)
+    return terms[:n_terms]
+
+
+def make_requests(terms, n_requests, rng):
+    """Returns n_requests (query type, target) pairs, an equal mix of the query types."""
+    requests = []
+    for i in range(n_requests):
+        kind, term = QUERIES[i % len(QUERIES)], rng.choice(terms)
+        target = f"/prefix?q={term[:2]}&limit=20" if kind == 'prefix' else f"/{kind}?term={term}"
+        requests.append((kind, target))
+    rng.shuffle(requests)
+    return requests
+
+
+async def run_load(host, port, connections, requests):
+    """Sends the requests over <connections> concurrent connections and returns the latencies by query type."""
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+    latencies = {kind: [] for kind in QUERIES}
+    errors = []
+
+    async def worker():
+        client = Client(host, port)
+        await client.connect()
+        try:
+            while not queue.empty():
+                kind, target = queue.get_nowait()
+                start = time.perf_counter()
+                status, _ = await client.get(target)
+                latencies[kind].append(time.perf_counter() - start)
+                if status != 200:
+                    errors.append((target, status))
+        finally:
+            client.close()
+
+    await asyncio.gather(*(worker() for _ in range(connections)))
+    return latencies, errors
+
+
+def report(latencies, seconds):
+    """Prints and returns the p50/p99 latency in milliseconds of every query type and of all queries."""
+    results = {}
+    everything = np.concatenate([np.asarray(values) for values in latencies.values() if values])
+    for kind, values in list(latencies.items()) + [('all', everything)]:
+        if len(values) == 0:
+            continue
+        p50, p99 = np.percentile(np.asarray(values) * 1000, [50, 99])
+        results[kind] = {'requests': len(values), 'p50_ms': p50, 'p99_ms': p99}
+        print(f"{kind:8s} {len(values):8d} requests   p50 {p50:7.2f} ms   p99 {p99:7.2f} ms")
+    results['throughput'] = len(everything) / seconds
+    print(f"{len(everything)} requests in {seconds:.2f}s, {results['throughput']:.0f} requests/s")
+    return results
+
+
+async def wait_for_service(host, port, timeout):
+    """Polls /stats until the service answers with at least one loaded newspaper."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            client = Client(host, port)
+            await client.connect()
+            _, answer = await client.get('/stats')
+            client.close()
+            if answer:
+                return answer
+        except OSError:
+            pass
+        await asyncio.sleep(0.5)
+    raise TimeoutError(f"the service on {host}:{port} did not start within {timeout}s")
+
+
+async def benchmark(host, port, connections, n_requests, n_terms, seed):
+    rng = random.Random(seed)
+    client = Client(host, port)
+    await client.connect()
+    terms = await vocabulary_sample(client, n_terms, rng)
+    client.close()
+    if not terms:
+        sys.exit("the service has an empty vocabulary")
+
+    requests = make_requests(terms, n_requests, rng)
+    # warm-up, so connection setup and first-touch costs are not measured
+    await run_load(host, port, connections, requests[:connections * 4])
+    start = time.perf_counter()
+    latencies, errors = await run_load(host, port, connections, requests)
+    seconds = time.perf_counter() - start
+    if errors:
+        print(f"{len(errors)} requests failed, e.g. {errors[0]}")
+    return report(latencies, seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_service')
+    parser.add_argument('--url', default='127.0.0.1:8765', help='host:port of the service')
+    parser.add_argument('--connections', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--terms', type=int, default=2000, help='number of distinct terms queried')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--spawn', action='store_true', help='start the service in a separate process')
+    parser.add_argument('--startup-timeout', type=float, default=600, help='seconds to wait for --spawn')
+    args = parser.parse_args(argv)
+
+    host, _, port = args.url.rpartition(':')
+    port = int(port)
+    process = None
+    if args.spawn:
+        process = subprocess.Popen([sys.executable, 'term_service.py', '--host', host, '--port', str(port),
+                                    '--reload-interval', '0'], cwd=ROOT)
+    try:
+        if process is not None:
+            stats = asyncio.run(wait_for_service(host, port, args.startup_timeout))
+            print(', '.join(f"{newspaper}: {index['documents']} documents, {index['terms']} terms"
+                            for newspaper, index in stats.items()))
+        asyncio.run(benchmark(host, port, args.connections, args.requests, args.terms, args.seed))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Cold start benchmark: imports each module in a fresh interpreter several times and reports the median import time and
+the heavy dependencies it loaded. It fails (exit code 1) if a module loads a dependency it should only load on first
+use (see LAZY), or if its median import time got slower than the baseline by more than --threshold and --slack.
+With --preload, the time nltk_resources.preload() takes to load the NLTK models in a fresh process is reported too.
+
+Run from the repository root with
+
+    python -m benchmarks.bench_startup [--runs 7] [--baseline benchmarks/startup_baseline.json] [--save]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCHMARK_DIR)
+# the top-level packages every module must not load at import time
+LAZY = {
+    'methods': ('sklearn', 'matplotlib', 'IPython', 'nltk'),
+    'preprocessing': ('sklearn', 'matplotlib', 'IPython', 'nltk', 'requests', 'bs4', 'scipy'),
+    'lemmatisation': ('nltk',),
+    'get_playernames': ('requests', 'bs4'),
+    'nltk_resources': ('nltk',),
+    'topics': ('sklearn', 'matplotlib', 'IPython', 'nltk'),
+}
+CHILD = ("import json, sys, time\n"
+         "start = time.perf_counter()\n"
+         "{statement}\n"
+         "seconds = time.perf_counter() - start\n"
+         "print(json.dumps({{'seconds': seconds, 'modules': sorted({{name.split('.')[0] for name in sys.modules}})}}))")
+
+
+def cold_start(statement, runs=7):
+    """
+        Runs a statement in <runs> fresh interpreters.
+
+        Returns:
+            tuple: The median seconds the statement took and the top-level modules loaded afterwards.
+    """
+    times, modules = [], set()
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', CHILD.format(statement=statement)], cwd=ROOT, check=True,
+                                capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        times.append(result['seconds'])
+        modules.update(result['modules'])
+    return statistics.median(times), modules
+
+
+def run(runs=7, preload=False):
+    """Returns the median import seconds and the eagerly loaded lazy dependencies of every module in LAZY."""
+    results = {}
+    for module, lazy in LAZY.items():
+        seconds, modules = cold_start(f"import {module}", runs)
+        results[module] = {'seconds': seconds, 'loaded': sorted(set(lazy) & modules)}
+        loaded = f"  LOADS {', '.join(results[module]['loaded'])}" if results[module]['loaded'] else ''
+        print(f"import {module:20s} {seconds * 1000:8.1f} ms{loaded}")
+    if preload:
+        seconds, _ = cold_start("import nltk_resources; nltk_resources.preload()", runs)
+        results['nltk_resources.preload()'] = {'seconds': seconds, 'loaded': []}
+        print(f"{'nltk_resources.preload()':27s} {seconds * 1000:8.1f} ms")
+    return results
+
+
+def regressions(results, baseline, threshold=0.25, slack=0.02):
+    """
+        Returns the names of the entries which load a lazy dependency, or whose time exceeds the baseline by more than
+        the relative threshold and the absolute slack (in seconds), which absorbs the noise of fast imports.
+    """
+    failed = [name for name, result in results.items() if result['loaded']]
+    for name, result in results.items():
+        before = baseline.get(name, {}).get('seconds')
+        if before is not None and result['seconds'] > before * (1 + threshold) and result['seconds'] - before > slack:
+            print(f"{name}: {before * 1000:.1f} ms -> {result['seconds'] * 1000:.1f} ms  REGRESSION")
+            failed.append(name)
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_startup')
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--baseline', default=os.path.join(BENCHMARK_DIR, 'startup_baseline.json'))
+    parser.add_argument('--save', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25, help='relative slowdown counted as a regression')
+    parser.add_argument('--slack', type=float, default=0.02, help='absolute slowdown in seconds always tolerated')
+    parser.add_argument('--preload', action='store_true', help='also time loading the NLTK models')
+    args = parser.parse_args(argv)
+
+    results = run(args.runs, args.preload)
+    baseline = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    failed = regressions(results, baseline, args.threshold, args.slack)
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"wrote {args.baseline}")
+    if failed:
+        print(f"cold start regressed: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""
+Benchmarks loading a preprocessed corpus from Parquet (corpus_store.load_corpus) against the CSV + eval() path
+get_vocab_from_csv() used before.
+
+Run from the repository root with
+
+    python -m benchmarks.bench_storage [preprocessed.csv]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from corpus_store import LIST_COLUMNS, load_corpus, read_corpus, save_corpus
+
+
+def _time(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def legacy_load(csv_file, columns=None):
+    """The old way of reading a preprocessed CSV: read every column, then eval() the list columns."""
+    df = pd.read_csv(csv_file)
+    for column in LIST_COLUMNS:
+        if column in df.columns and (columns is None or column in columns):
+            df[column] = df[column].apply(eval)
+    return df if columns is None else df[columns]
+
+
+def main(csv_file='sun.csv'):
+    df = read_corpus(csv_file)
+    with tempfile.TemporaryDirectory() as directory:
+        parquet_file = os.path.join(directory, 'corpus.parquet')
+        save_corpus(df, parquet_file)
+        print(f"csv: {os.path.getsize(csv_file) / 1e6:.1f} MB, parquet: {os.path.getsize(parquet_file) / 1e6:.1f} MB")
+
+        timings = {}
+        for columns in (None, ['lemmas'], ['lemmatised_text']):
+            label = 'all columns' if columns is None else ', '.join(columns)
+            timings[('csv', label)], legacy = _time(legacy_load, csv_file, columns)
+            timings[('parquet', label)], loaded = _time(load_corpus, parquet_file, columns)
+            assert legacy.reset_index(drop=True).equals(loaded), f"loaded corpora differ ({label})"
+            print(f"{label}: csv + eval {timings[('csv', label)]:.2f}s, "
+                  f"parquet {timings[('parquet', label)]:.2f}s")
+    return timings
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else 'sun.csv')
@@ -0,0 +1,223 @@
+"""
+Benchmark suite of the analysis pipeline on a synthetic corpus (see benchmarks/synthetic.py). Every stage - loading
+the JSON, the per-document preprocessing stages, rare token removal, DTM and TF-IDF, the monthly TF-IDF cube and its
+lookups, and the co-occurrence matrix - is timed and, unless --no-memory is given, run a second time under tracemalloc
+to measure its peak memory. Results are written as JSON, and 'compare' reports stages that got slower between two runs.
+
+The suite runs offline: the player list is synthetic and NLTK's data (punkt, stopwords, wordnet, omw-1.4,
+averaged_perceptron_tagger) is read from --nltk-data (default: $NLTK_DATA or benchmarks/nltk_data), e.g. populated once
+with `python -m nltk.downloader -d benchmarks/nltk_data punkt stopwords wordnet omw-1.4 averaged_perceptron_tagger`.
+
+Run from the repository root with
+
+    python -m benchmarks.run [--articles 1000 10000] [--seed 0] [--workers 1] [--output benchmarks/results]
+    python -m benchmarks.run compare old.json new.json [--threshold 0.1]
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+NLTK_RESOURCES = ('tokenizers/punkt', 'corpora/stopwords', 'corpora/wordnet', 'corpora/omw-1.4',
+                  'taggers/averaged_perceptron_tagger')
+SOURCES = ('guardian', 'mail', 'times', 'sun')
+TERMS = ['qatar', 'armband', 'lgbt', 'boycott', 'alcohol', 'migrant']
+
+
+def use_local_nltk_data(directory):
+    """Makes NLTK read its data from <directory> only and checks that every resource the pipeline needs is there."""
+    import nltk
+
+    nltk.data.path[:] = [directory]
+    missing = []
+    for resource in NLTK_RESOURCES:
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            missing.append(resource.split('/')[1])
+    if missing:
+        sys.exit(f"NLTK data missing from {directory}: {', '.join(missing)}\n"
+                 f"populate it with: python -m nltk.downloader -d {directory} {' '.join(missing)}")
+
+
+def measure(name, function, *args, memory=True, items=None, **kwargs):
+    """
+        Runs function(*args, **kwargs), timing it, and if memory is True runs it again under tracemalloc for its peak
+        memory.
+
+        Returns:
+            tuple: The stage result as a dict (name, seconds, cpu_seconds, peak_bytes, items) and the return value of
+                   the function.
+    """
+    gc.collect()
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = function(*args, **kwargs)
+    stage = {'name': name, 'seconds': time.perf_counter() - wall, 'cpu_seconds': time.process_time() - cpu,
+             'peak_bytes': None, 'items': items}
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        function(*args, **kwargs)
+        stage['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    peak = '' if stage['peak_bytes'] is None else f", peak {stage['peak_bytes'] / 1e6:.1f} MB"
+    print(f"  {name}: {stage['seconds']:.3f}s{peak}")
+    return stage, result
+
+
+def run_suite(n_articles, seed=0, workers=1, memory=True, directory=None):
+    """
+        Generates a synthetic corpus of n_articles and benchmarks every pipeline stage on it.
+
+        Returns:
+            dict: The run's metadata and the list of stage results.
+    """
+    # imported here, so that 'compare' works without the pipeline's dependencies
+    import pandas as pd
+    from cooccurrence import CooccurrenceMatrix
+    from corpus_store import save_corpus
+    from methods import TfidfCube, _fit_tfidf, df_to_dtm, monthly_tfidf_table
+    from preprocessing import _run_document_stages, remove_rare_tokens
+    from benchmarks.synthetic import ArticleGenerator, write_corpus
+
+    with tempfile.TemporaryDirectory(dir=directory) as work_dir:
+        start = time.perf_counter()
+        files = write_corpus(n_articles, work_dir, seed)
+        print(f"{n_articles} articles: generated in {time.perf_counter() - start:.1f}s")
+
+        # a synthetic player list of vocabulary words, so the player filter removes something
+        playerlist = frozenset(ArticleGenerator(seed).vocabulary[100:600])
+        stages = []
+        parquet_files = {}
+        for source in SOURCES:
+            print(f"{source}:")
+            stage, df = measure(f'{source}/read_json', pd.read_json, files[source], memory=memory)
+            stages.append(stage)
+            df = df.drop(columns=['author'], errors='ignore')
+            stage, (df, counts, _) = measure(f'{source}/document_stages', _run_document_stages, df, playerlist,
+                                             workers=workers, memory=memory, items=len(df))
+            stages.append(stage)
+            stage, (filtered, _, n_tokens) = measure(f'{source}/remove_rare_tokens', remove_rare_tokens,
+                                                     df['lemmas'], memory=memory, items=counts['without_players'])
+            stages.append(stage)
+            df['lemmas'] = filtered
+            df = df[df['lemmas'].map(len) > 0].reset_index(drop=True)
+            # the cube reads the preprocessed file from disk like the analysis does
+            parquet_files[source.capitalize()] = os.path.join(work_dir, f'{source}.parquet')
+            save_corpus(df, parquet_files[source.capitalize()])
+
+            for name, function in (('df_to_dtm', df_to_dtm), ('tfidf', lambda df: _fit_tfidf(df['lemmatised_text'])),
+                                   ('monthly_tfidf_table', monthly_tfidf_table),
+                                   ('cooccurrence', lambda df: CooccurrenceMatrix.from_contexts(df['lemmas'],
+                                                                                                min_freq=5))):
+                stage, _ = measure(f'{source}/{name}', function, df, memory=memory, items=len(df))
+                stages.append(stage)
+
+        print("cube:")
+        stage, cube = measure('cube/build', _build_cube, TfidfCube, parquet_files, memory=memory)
+        stages.append(stage)
+        stage, _ = measure('cube/lookup', _lookup_terms, cube, TERMS, memory=memory, items=len(TERMS))
+        stages.append(stage)
+
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'n_articles': n_articles,
+        'seed': seed,
+        'workers': workers,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'commit': _git_commit(),
+        'stages': stages,
+    }
+
+
+def _build_cube(cube_class, files):
+    cube = cube_class(files, cache_dir=None)
+    for newspaper in files:
+        cube.table(newspaper)
+    return cube
+
+
+def _lookup_terms(cube, terms):
+    return {newspaper: cube.lookup(terms, newspaper) for newspaper in cube.files}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=BENCHMARK_DIR).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(old_file, new_file, threshold=0.1):
+    """
+        Compares the stage timings of two result files.
+
+        Parameters:
+            old_file (str): The baseline results.
+            new_file (str): The results to check.
+            threshold (float, optional): Relative slowdown above which a stage counts as a regression. Defaults to 0.1.
+
+        Returns:
+            list of str: The names of the stages which got slower by more than threshold.
+    """
+    with open(old_file) as f:
+        old = {stage['name']: stage for stage in json.load(f)['stages']}
+    with open(new_file) as f:
+        new = {stage['name']: stage for stage in json.load(f)['stages']}
+
+    regressions = []
+    for name in sorted(old.keys() & new.keys()):
+        before, after = old[name]['seconds'], new[name]['seconds']
+        change = (after - before) / before if before else 0.0
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:40s} {before:9.3f}s -> {after:9.3f}s ({change:+.1%}){flag}")
+    return regressions
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == 'compare':
+        parser = argparse.ArgumentParser(prog='python -m benchmarks.run compare')
+        parser.add_argument('old')
+        parser.add_argument('new')
+        parser.add_argument('--threshold', type=float, default=0.1)
+        args = parser.parse_args(argv[1:])
+        return 1 if compare(args.old, args.new, args.threshold) else 0
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run')
+    parser.add_argument('--articles', type=int, nargs='+', default=[1000],
+                        help='corpus sizes to benchmark, from 1000 up to 1000000 articles')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--no-memory', action='store_true', help='only time the stages, without tracemalloc runs')
+    parser.add_argument('--nltk-data', default=os.environ.get('NLTK_DATA', os.path.join(BENCHMARK_DIR, 'nltk_data')))
+    parser.add_argument('--output', default=os.path.join(BENCHMARK_DIR, 'results'))
+    parser.add_argument('--tmp', default=None, help='directory for the synthetic corpora')
+    args = parser.parse_args(argv)
+
+    use_local_nltk_data(args.nltk_data)
+    os.makedirs(args.output, exist_ok=True)
+    for n_articles in args.articles:
+        results = run_suite(n_articles, args.seed, args.workers, not args.no_memory, args.tmp)
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{n_articles}.json"
+        with open(os.path.join(args.output, name), 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"wrote {os.path.join(args.output, name)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
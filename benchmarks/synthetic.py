@@ -0,0 +1,149 @@
+"""
+Seeded generator of synthetic newspaper articles for the benchmarks. Articles look like the crawler output of the four
+newspapers: a title, the date in the source's format and the content, with words drawn from a Zipfian vocabulary of
+made-up words mixed with English stopwords, punctuation, numbers and some World Cup terms, so every preprocessing
+stage has work to do. The same seed always gives the same corpus, and the articles are streamed to the JSON files,
+so corpora of up to a million articles can be written without holding them in memory.
+
+Run from the repository root with
+
+    python -m benchmarks.synthetic [n_articles] [directory] [seed]
+"""
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+START = datetime(2022, 9, 1, tzinfo=timezone.utc)
+END = datetime(2023, 3, 1, tzinfo=timezone.utc)
+# share of the articles of every source, roughly the sizes of the crawled corpora
+SOURCES = {'guardian': 0.45, 'mail': 0.27, 'times': 0.14, 'sun': 0.14}
+# the date format every crawler writes
+DATE_FORMATS = {
+    'guardian': lambda date: date.strftime('%Y-%m-%dT%H:%M:%SZ'),
+    'mail': lambda date: date.strftime('%Y-%m-%dT%H:%M:%S+0000'),
+    'times': lambda date: date.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+    'sun': lambda date: f"{date.day} {date.strftime('%b %Y')}",
+}
+
+STOPWORDS = ('the', 'of', 'and', 'a', 'to', 'in', 'is', 'that', 'it', 'was', 'for', 'on', 'with', 'he', 'as', 'they',
+             'at', 'be', 'this', 'have', 'from', 'or', 'by', 'but', 'not', 'what', 'all', 'were', 'we', 'when')
+TOPIC_WORDS = ('qatar', 'world', 'cup', 'football', 'fifa', 'england', 'stadium', 'fans', 'migrant', 'workers',
+               'human', 'rights', 'armband', 'lgbt', 'boycott', 'alcohol', 'corruption', 'protest', 'played', 'goals',
+               'Messi', 'Southgate', 'Kane', 'Doha', 'Argentina', 'France')
+PUNCTUATION = (',', ',', '.', ';', ':', '--', '!', '?', "'s", '"')
+SYLLABLES = ('ba', 'ce', 'di', 'fo', 'gu', 'ha', 'je', 'ki', 'lo', 'mu', 'na', 'pe', 'ri', 'so', 'tu', 'va', 'we',
+             'xi', 'yo', 'za', 'ar', 'en', 'il', 'or', 'ul', 'st', 'tr', 'ng')
+
+
+def make_vocabulary(size, rng):
+    """Returns <size> distinct made-up lowercase words of two to four syllables."""
+    words = set()
+    while len(words) < size:
+        n_syllables = rng.integers(2, 5, size=size)
+        picks = rng.integers(0, len(SYLLABLES), size=(size, 4))
+        words.update(''.join(SYLLABLES[i] for i in pick[:n]) for pick, n in zip(picks, n_syllables))
+    # sorted first, since the iteration order of a set of strings changes between interpreter runs
+    return list(rng.permutation(sorted(words))[:size])
+
+
+class ArticleGenerator:
+    """
+        Generates synthetic articles. Content words follow a Zipf distribution with exponent <zipf> over a vocabulary of
+        <vocabulary_size> made-up words; about 40% of the tokens are stopwords, 5% topic words and 10% punctuation or
+        numbers. Article lengths are log-normal around <median_length> words, dates uniform between Sep 2022 and
+        Feb 2023.
+    """
+
+    def __init__(self, seed=0, vocabulary_size=50_000, zipf=1.1, median_length=320):
+        self.rng = np.random.default_rng(seed)
+        self.vocabulary = np.asarray(make_vocabulary(vocabulary_size, self.rng), dtype=object)
+        ranks = np.arange(1, vocabulary_size + 1, dtype=np.float64)
+        self.cumulative = np.cumsum(ranks ** -zipf)
+        self.cumulative /= self.cumulative[-1]
+        self.median_length = median_length
+        self.kinds = np.array([0.45, 0.40, 0.05, 0.10]).cumsum()
+        self.fillers = np.asarray(STOPWORDS + TOPIC_WORDS + PUNCTUATION, dtype=object)
+        self.filler_ranges = ((0, len(STOPWORDS)), (len(STOPWORDS), len(STOPWORDS) + len(TOPIC_WORDS)),
+                              (len(STOPWORDS) + len(TOPIC_WORDS), len(self.fillers)))
+
+    def _words(self, n):
+        """Returns n random tokens."""
+        rng = self.rng
+        kinds = np.searchsorted(self.kinds, rng.random(n))
+        words = self.vocabulary[np.searchsorted(self.cumulative, rng.random(n))]
+        for kind, (low, high) in enumerate(self.filler_ranges, start=1):
+            mask = kinds == kind
+            words[mask] = self.fillers[rng.integers(low, high, size=int(mask.sum()))]
+        numbers = (kinds == 3) & (rng.random(n) < 0.3)
+        words[numbers] = rng.integers(1, 2023, size=int(numbers.sum())).astype(str)
+        return words
+
+    def content(self, n_words):
+        """Returns an article text of n_words tokens, split into sentences of about 20 words."""
+        words = self._words(n_words)
+        sentence_ends = np.cumsum(np.maximum(self.rng.poisson(20, size=n_words // 3 + 1), 3))
+        sentence_ends = np.append(sentence_ends[sentence_ends < n_words], n_words)
+        sentences = []
+        for start, end in zip(np.concatenate(([0], sentence_ends[:-1])), sentence_ends):
+            sentence = ' '.join(words[start:end]).replace(' ,', ',').replace(" 's", "'s")
+            sentences.append(sentence[:1].upper() + sentence[1:] + '.')
+        return ' '.join(sentences)
+
+    def article(self, source):
+        """Returns one article of the given source as a dict like the crawlers write it."""
+        n_words = max(20, int(self.rng.lognormal(np.log(self.median_length), 0.6)))
+        date = START + timedelta(seconds=float(self.rng.random() * (END - START).total_seconds()))
+        article = {
+            'title': ' '.join(self._words(int(self.rng.integers(5, 12)))).capitalize(),
+            'date': DATE_FORMATS[source](date),
+            'content': self.content(n_words),
+        }
+        if source == 'sun':
+            article['author'] = 'None'
+        return article
+
+
+def source_sizes(n_articles):
+    """Splits n_articles between the sources in the proportions of SOURCES."""
+    sizes = {source: int(n_articles * share) for source, share in SOURCES.items()}
+    sizes['guardian'] += n_articles - sum(sizes.values())
+    return sizes
+
+
+def write_corpus(n_articles, directory='synthetic', seed=0, **kwargs):
+    """
+        Writes '<source>_articles.json' (JSON arrays, like the crawler output preprocess() reads) for the four sources.
+
+        Parameters:
+            n_articles (int): Total number of articles, split between the sources like SOURCES.
+            directory (str, optional): Directory the files are written to. Defaults to 'synthetic'.
+            seed (int, optional): Random seed. Defaults to 0.
+            **kwargs: Passed on to ArticleGenerator.
+
+        Returns:
+            dict: Maps each source to the path of its file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    generator = ArticleGenerator(seed, **kwargs)
+    files = {}
+    for source, size in source_sizes(n_articles).items():
+        files[source] = os.path.join(directory, f"{source}_articles.json")
+        with open(files[source], 'w', encoding='utf-8') as f:
+            f.write('[')
+            for i in range(size):
+                if i:
+                    f.write(',\n')
+                json.dump(generator.article(source), f, ensure_ascii=False)
+            f.write(']\n')
+    return files
+
+
+if __name__ == '__main__':
+    files = write_corpus(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+                         sys.argv[2] if len(sys.argv) > 2 else 'synthetic',
+                         int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+    for source, path in files.items():
+        print(f"{source}: {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
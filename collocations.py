@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+from cooccurrence import encode_contexts
+
+
+def _bigrams(ids, offsets):
+    """Positions i of all bigrams (ids[i], ids[i + 1]) which do not cross a context boundary."""
+    last_positions = offsets[1:] - 1
+    valid = np.ones(max(len(ids) - 1, 0), dtype=bool)
+    valid[last_positions[(last_positions >= 0) & (last_positions < len(ids) - 1)]] = False
+    return np.flatnonzero(valid)
+
+
+def score_collocations(ids, offsets, terms, min_count=25):
+    """
+        Counts all bigrams of integer-encoded contexts and scores them like quanteda's textstat_collocations() does for
+        two-word collocations: lambda is the log odds ratio of the 2x2 table of the first and second word (with 0.5
+        added to every cell), z is lambda divided by its standard error. The log-likelihood ratio G2 is given as well.
+        Counting and scoring are vectorised over all bigrams, so the cost is linear in the number of tokens.
+
+        Parameters:
+            ids (numpy array): The flat array of term ids.
+            offsets (numpy array): Context i is ids[offsets[i]:offsets[i+1]].
+            terms (sequence of str): The term of every id.
+            min_count (int, optional): Bigrams occurring less often are dropped. Defaults to 25.
+
+        Returns:
+            pandas DataFrame: Columns 'collocation', 'first', 'second' (term ids), 'count', 'lambda', 'z' and 'G2',
+                              sorted by descending z.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    n_terms = len(terms)
+    positions = _bigrams(ids, np.asarray(offsets, dtype=np.int64))
+    first, second = ids[positions], ids[positions + 1]
+    keys, n11 = np.unique(first * n_terms + second, return_counts=True)
+    frequent = n11 >= min_count
+    keys, n11 = keys[frequent], n11[frequent].astype(np.float64)
+    a, b = keys // n_terms, keys % n_terms
+
+    # 2x2 table: first word followed by second word or not, over all bigrams
+    n_bigrams = float(len(positions))
+    n12 = np.bincount(first, minlength=n_terms)[a] - n11
+    n21 = np.bincount(second, minlength=n_terms)[b] - n11
+    n22 = n_bigrams - n11 - n12 - n21
+    cells = [n11 + 0.5, n12 + 0.5, n21 + 0.5, n22 + 0.5]
+    lam = np.log(cells[0]) + np.log(cells[3]) - np.log(cells[1]) - np.log(cells[2])
+    sigma = np.sqrt(sum(1.0 / cell for cell in cells))
+
+    # expected counts under independence for G2
+    row1, row2 = n11 + n12, n21 + n22
+    col1, col2 = n11 + n21, n12 + n22
+    g2 = np.zeros_like(n11)
+    for observed, expected in ((n11, row1 * col1), (n12, row1 * col2), (n21, row2 * col1), (n22, row2 * col2)):
+        expected = expected / n_bigrams
+        positive = observed > 0
+        g2[positive] += observed[positive] * np.log(observed[positive] / expected[positive])
+
+    terms = np.asarray(terms, dtype=object)
+    table = pd.DataFrame({
+        'collocation': terms[a] + ' ' + terms[b],
+        'first': a,
+        'second': b,
+        'count': n11.astype(np.int64),
+        'lambda': lam,
+        'z': lam / sigma,
+        'G2': 2 * g2,
+    })
+    return table.sort_values('z', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def compound_encoded(ids, offsets, pairs, first_new_id):
+    """
+        Joins every occurrence of the given bigrams into one token, scanning left to right like tokens_compound(): in
+        "a b c" with both "a b" and "b c" selected only "a b" is joined. Works on the integer arrays without a Python
+        loop over tokens.
+
+        Parameters:
+            ids (numpy array): The flat array of term ids.
+            offsets (numpy array): Context i is ids[offsets[i]:offsets[i+1]].
+            pairs (numpy array): Shape (n, 2), the (first, second) ids of the bigrams to join.
+            first_new_id (int): The id given to the first compound; compound j gets first_new_id + j.
+
+        Returns:
+            tuple: The new ids and offsets arrays.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if not len(pairs) or len(ids) < 2:
+        return ids.astype(np.int32), offsets
+
+    n_terms = int(max(ids.max(), np.max(pairs))) + 1
+    pair_keys = np.asarray(pairs[:, 0], dtype=np.int64) * n_terms + np.asarray(pairs[:, 1], dtype=np.int64)
+    order = np.argsort(pair_keys)
+    positions = _bigrams(ids, offsets)
+    keys = ids[positions] * n_terms + ids[positions + 1]
+    found = np.searchsorted(pair_keys[order], keys)
+    found[found == len(pair_keys)] = 0
+    selected = pair_keys[order][found] == keys
+
+    starts = np.zeros(len(ids), dtype=bool)
+    starts[positions[selected]] = True
+    compound_of = np.full(len(ids), -1, dtype=np.int64)
+    compound_of[positions[selected]] = order[found[selected]]
+    # in a run of consecutive starts only every other one can be joined, beginning with the first
+    index = np.arange(len(ids))
+    run_begin = np.maximum.accumulate(np.where(starts & ~np.concatenate(([False], starts[:-1])), index, 0))
+    joined = starts & ((index - run_begin) % 2 == 0)
+
+    new_ids = ids.copy()
+    new_ids[joined] = first_new_id + compound_of[joined]
+    removed = np.zeros(len(ids), dtype=bool)
+    removed[np.flatnonzero(joined) + 1] = True
+    context_of = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    removed_per_context = np.bincount(context_of[removed], minlength=len(offsets) - 1)
+    new_offsets = offsets.copy()
+    new_offsets[1:] -= np.cumsum(removed_per_context)
+    return new_ids[~removed].astype(np.int32), new_offsets
+
+
+def _sentences(lemmas, sentence_lengths):
+    """Splits the lemmas of every document into sentences; returns them and the offsets of the documents' sentences."""
+    sentences = []
+    n_sentences = [0]
+    for doc, lengths in zip(lemmas, sentence_lengths):
+        start = 0
+        for length in lengths:
+            sentences.append(doc[start:start + length])
+            start += length
+        n_sentences.append(len(lengths))
+    return sentences, np.cumsum(n_sentences)
+
+
+def compound_collocations(lemmas, min_count=25, top=250, separator='_', sentence_lengths=None):
+    """
+        Finds the top collocations of a corpus and joins them into single tokens, the Python version of
+        textstat_collocations(min_count = 25) and tokens_compound() in rstudio/topic.R.
+
+        Parameters:
+            lemmas (iterable of list of str): The lemmas of every document, e.g. the 'lemmas' column of preprocess().
+            min_count (int, optional): Minimum number of occurrences of a collocation. Defaults to 25.
+            top (int, optional): Number of collocations (by descending z) to join. Defaults to 250.
+            separator (str, optional): Joins the words of a compound, e.g. "world_cup". Defaults to '_'.
+            sentence_lengths (iterable of list of int, optional): The number of lemmas of every sentence of every
+                                                                  document, e.g. the 'sentence_lengths' column of
+                                                                  preprocess(). If given, bigrams are only counted
+                                                                  and joined within a sentence. Defaults to None
+                                                                  (within a document).
+
+        Returns:
+            tuple: The compounded lemmas of every document and the table of the collocations which were joined
+                   (see score_collocations() ).
+    """
+    if sentence_lengths is None:
+        contexts, doc_contexts = list(lemmas), None
+    else:
+        contexts, doc_contexts = _sentences(lemmas, sentence_lengths)
+    ids, offsets, vocabulary = encode_contexts(contexts)
+    terms = list(vocabulary)
+    table = score_collocations(ids, offsets, terms, min_count=min_count).head(top)
+    pairs = table[['first', 'second']].to_numpy()
+    new_ids, new_offsets = compound_encoded(ids, offsets, pairs, len(terms))
+
+    all_terms = np.asarray(terms + [terms[a] + separator + terms[b] for a, b in pairs], dtype=object)
+    tokens = all_terms[new_ids].tolist()
+    # the sentences of a document are consecutive, so its tokens run from its first to its last sentence
+    bounds = new_offsets if doc_contexts is None else new_offsets[doc_contexts]
+    compounded = [tokens[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+    return compounded, table
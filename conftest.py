@@ -0,0 +1,2 @@
+# the tests import the modules like the scripts do, from the repository root; pytest adds the directory of the
+# top-level conftest.py to sys.path
@@ -0,0 +1,210 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from encoded_corpus import tagged_sentences
+
+# significance measures of CooccurrenceMatrix, named like in rstudio/cooccurrence.R
+MEASURES = ('dice', 'mi', 'loglik')
+
+
+def encode_contexts(contexts, vocabulary=None):
+    """
+        Integer-encodes a list of contexts (documents, sentences, ...) given as lists of tokens.
+
+        Parameters:
+            contexts (iterable of list of str): The tokens of every context.
+            vocabulary (dict, optional): Maps terms to ids; new terms are added to it. Defaults to a new dict.
+
+        Returns:
+            tuple: The flat int32 array of token ids, the int64 offsets array (context i is ids[offsets[i]:offsets[i+1]])
+                   and the vocabulary.
+    """
+    vocabulary = {} if vocabulary is None else vocabulary
+    lengths = []
+    ids = []
+    for context in contexts:
+        lengths.append(len(context))
+        ids.extend(vocabulary.setdefault(token, len(vocabulary)) for token in context)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return np.asarray(ids, dtype=np.int32), offsets, vocabulary
+
+
+def sentence_contexts(df):
+    """
+        Splits the lemmas of a preprocessed DataFrame (obtained using preprocess() ) into sentences, using the sentence
+        boundaries preprocess() stores (see encoded_corpus.tagged_sentences() ).
+
+        Parameters:
+            df (pandas DataFrame): A preprocessed DataFrame with 'lemmas', 'lemma_tags' and 'sentence_lengths' columns.
+
+        Returns:
+            list of list of str: The lemmas of every sentence of every article.
+    """
+    return [[lemma for lemma, _ in sentence] for doc in tagged_sentences(df) for sentence in doc]
+
+
+def _xlogx(x):
+    """x * log(x) with 0 * log(0) = 0, element-wise."""
+    x = np.asarray(x, dtype=np.float64)
+    return np.where(x > 0, x * np.log(np.where(x > 0, x, 1.0)), 0.0)
+
+
+class CooccurrenceMatrix:
+    """
+        Sparse term co-occurrence counts and significance measures, the Python counterpart of rstudio/cooccurrence.R.
+        Contexts (documents, sentences or sliding windows) are turned into a binary context-term matrix B, and the
+        co-occurrence counts are B^T B, computed as a sparse matrix product. Dice, mutual information and log-likelihood
+        are computed for all co-occurring pairs at once on the non-zero entries, so nothing is ever densified.
+
+        Attributes:
+            counts (scipy.sparse.csr_matrix): Number of contexts two terms occur in together (diagonal removed).
+            term_counts (numpy array): Number of contexts every term occurs in (ki / kj in the R script).
+            n_contexts (int): Number of contexts (k in the R script).
+            terms (numpy array): The term of every row and column.
+    """
+
+    def __init__(self, counts, term_counts, n_contexts, terms):
+        self.counts = counts
+        self.term_counts = term_counts
+        self.n_contexts = n_contexts
+        self.terms = np.asarray(terms, dtype=object)
+        self.index = {term: i for i, term in enumerate(self.terms)}
+        self._significance = None
+
+    @classmethod
+    def from_encoded(cls, ids, offsets, terms, window=None, min_freq=1):
+        """
+            Counts co-occurrences from integer-encoded contexts.
+
+            Parameters:
+                ids (numpy array): The flat array of term ids.
+                offsets (numpy array): Context i is ids[offsets[i]:offsets[i+1]].
+                terms (sequence of str): The term of every id.
+                window (int, optional): If given, every position starts a context of the next `window` tokens within
+                                        its context (a sliding window); otherwise each context counts as a whole.
+                                        Defaults to None.
+                min_freq (int, optional): Terms occurring in fewer contexts are dropped, like dfm_trim(min_docfreq) in
+                                          the R script. Defaults to 1.
+
+            Returns:
+                CooccurrenceMatrix: The co-occurrence counts.
+        """
+        ids = np.asarray(ids, dtype=np.int32)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        n_terms = len(terms)
+        # context of every token
+        context_of = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+        if window is None:
+            rows, cols, n_contexts = context_of, ids, len(offsets) - 1
+        else:
+            # window starting at position p holds the tokens p .. p+window-1 of the same context
+            ends = offsets[1:][context_of]
+            starts = np.arange(len(ids))
+            rows, cols = [], []
+            for shift in range(window):
+                inside = starts + shift < ends
+                rows.append(starts[inside])
+                cols.append(ids[starts[inside] + shift])
+            rows, cols, n_contexts = np.concatenate(rows), np.concatenate(cols), len(ids)
+
+        binary = sp.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(n_contexts, n_terms))
+        binary.sum_duplicates()
+        binary.data[:] = 1
+        term_counts = np.asarray(binary.sum(axis=0)).ravel()
+
+        keep = np.flatnonzero(term_counts >= min_freq)
+        binary = binary[:, keep]
+        counts = (binary.T @ binary).tocsr()
+        counts.setdiag(0)
+        counts.eliminate_zeros()
+        return cls(counts, term_counts[keep], n_contexts, np.asarray(terms, dtype=object)[keep])
+
+    @classmethod
+    def from_contexts(cls, contexts, window=None, min_freq=1):
+        """
+            Counts co-occurrences from contexts given as lists of tokens, e.g. the 'lemmas' column of a preprocessed
+            DataFrame (document level) or sentence_contexts() (sentence level).
+
+            Parameters:
+                contexts (iterable of list of str): The tokens of every context.
+                window (int, optional): Sliding window size, see from_encoded(). Defaults to None.
+                min_freq (int, optional): Minimum number of contexts a term must occur in. Defaults to 1.
+
+            Returns:
+                CooccurrenceMatrix: The co-occurrence counts.
+        """
+        ids, offsets, vocabulary = encode_contexts(contexts)
+        return cls.from_encoded(ids, offsets, list(vocabulary), window=window, min_freq=min_freq)
+
+    def significance(self):
+        """
+            Computes Dice, mutual information and log-likelihood for every pair of co-occurring terms, with the formulas
+            of rstudio/cooccurrence.R, vectorised over the non-zero entries of the count matrix.
+
+            Returns:
+                dict: Maps 'dice', 'mi' and 'loglik' to a sparse matrix with the same non-zero entries as counts.
+        """
+        if self._significance is None:
+            coo = self.counts.tocoo()
+            k = float(self.n_contexts)
+            kij = coo.data.astype(np.float64)
+            ki = self.term_counts[coo.row].astype(np.float64)
+            kj = self.term_counts[coo.col].astype(np.float64)
+            scores = {
+                'dice': 2 * kij / (ki + kj),
+                'mi': np.log(k * kij / (ki * kj)),
+                'loglik': 2 * (_xlogx(k) - _xlogx(ki) - _xlogx(kj) + _xlogx(kij) + _xlogx(k - ki - kj + kij)
+                               + _xlogx(ki - kij) + _xlogx(kj - kij) - _xlogx(k - ki) - _xlogx(k - kj)),
+            }
+            shape = self.counts.shape
+            self._significance = {measure: sp.csr_matrix((values, (coo.row, coo.col)), shape=shape)
+                                  for measure, values in scores.items()}
+        return self._significance
+
+    def top(self, term, k=10, measure='loglik'):
+        """
+            Returns the k terms most significantly co-occurring with a term.
+
+            Parameters:
+                term (str): The term to get the neighbours of.
+                k (int, optional): The number of neighbours. Defaults to 10.
+                measure (str, optional): One of 'dice', 'mi', 'loglik' or 'count'. Defaults to 'loglik'.
+
+            Raises:
+                KeyError: If the term is not in the matrix.
+                ValueError: If the measure is unknown.
+
+            Returns:
+                pandas Series: The scores of the neighbours indexed by term, highest first.
+        """
+        if measure == 'count':
+            matrix = self.counts
+        elif measure in MEASURES:
+            matrix = self.significance()[measure]
+        else:
+            raise ValueError(f"measure must be 'count' or one of {MEASURES}.")
+        row = matrix.getrow(self.index[term])
+        order = np.argsort(-row.data, kind='stable')[:k]
+        return pd.Series(row.data[order], index=self.terms[row.indices[order]], name=measure)
+
+    def overview(self, term, k=10):
+        """
+            Returns the result overview table of rstudio/cooccurrence.R for a term: the top k neighbours by frequency,
+            MI, Dice and log-likelihood side by side.
+
+            Parameters:
+                term (str): The term to get the neighbours of.
+                k (int, optional): The number of neighbours. Defaults to 10.
+
+            Returns:
+                pandas DataFrame: Columns "Freq-terms", "Freq", "MI-terms", "MI", "Dice-Terms", "Dice", "LL-Terms", "LL".
+        """
+        columns = {}
+        for measure, name, term_name in (('count', 'Freq', 'Freq-terms'), ('mi', 'MI', 'MI-terms'),
+                                         ('dice', 'Dice', 'Dice-Terms'), ('loglik', 'LL', 'LL-Terms')):
+            neighbours = self.top(term, k, measure)
+            columns[term_name] = pd.Series(neighbours.index)
+            columns[name] = pd.Series(neighbours.values)
+        return pd.DataFrame(columns)
@@ -0,0 +1,321 @@
+import ast
+import os
+import shutil
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# columns preprocess() fills with (nested) Python lists
+LIST_COLUMNS = ('sentences', 'tokens', 'pos_tags', 'lemmas', 'lemma_tags', 'sentence_lengths')
+# Arrow types of the columns written by preprocess(), fixed so that chunks with only empty lists still fit together
+COLUMN_TYPES = {
+    'title': pa.string(),
+    'content': pa.string(),
+    'sentences': pa.list_(pa.string()),
+    'tokens': pa.list_(pa.string()),
+    'article_length': pa.int64(),
+    'pos_tags': pa.list_(pa.list_(pa.string())),
+    'lemmas': pa.list_(pa.string()),
+    'lemma_tags': pa.list_(pa.string()),
+    'sentence_lengths': pa.list_(pa.int32()),
+    'lemmatised_text': pa.string(),
+}
+# root directory of the corpus partitioned by newspaper and month, see save_partitioned()
+PARTITION_DIR = 'corpus'
+# month partition of the articles without a date
+UNDATED = 'undated'
+
+
+def _to_table(df, schema=None):
+    """
+        Converts a preprocessed DataFrame into an Arrow table, storing every (token, tag) pair of 'pos_tags' as a two
+        element list, since Arrow has no tuples.
+    """
+    df = df.reset_index(drop=True)
+    if 'pos_tags' in df.columns:
+        df = df.assign(pos_tags=[[list(pair) for pair in doc] for doc in df['pos_tags']])
+    if schema is None:
+        inferred = pa.Schema.from_pandas(df, preserve_index=False)
+        schema = pa.schema([pa.field(name, COLUMN_TYPES.get(name, inferred.field(name).type)) for name in df.columns])
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+def _to_frame(table):
+    """
+        Converts an Arrow table (or record batch) written by save_corpus() back into a DataFrame with the list columns
+        as Python lists and 'pos_tags' as lists of tuples.
+    """
+    list_columns = [column for column in table.column_names if column in LIST_COLUMNS]
+    df = table.select([column for column in table.column_names if column not in list_columns]).to_pandas()
+    if not len(df.columns):
+        df = pd.DataFrame(index=pd.RangeIndex(table.num_rows))
+    for column in list_columns:
+        values = table.column(column).to_pylist()
+        if column == 'pos_tags':
+            values = [[tuple(pair) for pair in doc] for doc in values]
+        df[column] = pd.Series(values, dtype=object)
+    return df[table.column_names]
+
+
+def save_corpus(df, file_path):
+    """
+        Saves a preprocessed DataFrame (obtained using preprocess() ) as a Parquet file. The list columns (see
+        LIST_COLUMNS) are stored as native Arrow list columns instead of Python reprs, so they can be loaded back without
+        eval() and each column can be read on its own.
+
+        Parameters:
+            df (pandas DataFrame): The preprocessed DataFrame.
+            file_path (str): The path of the Parquet file to write.
+    """
+    pq.write_table(_to_table(df), file_path, compression='zstd')
+
+
+class CorpusWriter:
+    """
+        Writes a preprocessed corpus to a Parquet file chunk by chunk, so it never has to be held in memory as a whole.
+        Every chunk becomes one row group; all chunks must have the same columns as the first one.
+
+        Example:
+            with CorpusWriter('sun.parquet') as writer:
+                for chunk in chunks:
+                    writer.write(chunk)
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.rows = 0
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, df):
+        """
+            Appends a chunk of the corpus.
+
+            Parameters:
+                df (pandas DataFrame): The preprocessed chunk.
+        """
+        if self._writer is None:
+            table = _to_table(df)
+            self._writer = pq.ParquetWriter(self.file_path, table.schema, compression='zstd')
+        else:
+            table = _to_table(df, self._writer.schema)
+        self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        """Finishes the file. A writer which never got a chunk does not create a file."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def load_corpus(file_path, columns=None):
+    """
+        Loads a preprocessed DataFrame saved with save_corpus(). Only the requested columns are read and decoded.
+
+        Parameters:
+            file_path (str): The path of the Parquet file.
+            columns (list of str, optional): The columns to load. Defaults to None (all columns).
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+            ValueError: If one of the columns does not exist in the file.
+
+        Returns:
+            pandas DataFrame: The DataFrame, with the list columns as Python lists (and 'pos_tags' as lists of tuples).
+    """
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+    if columns is not None:
+        _check_columns(columns, pq.read_schema(file_path).names, file_path)
+
+    return _to_frame(pq.read_table(file_path, columns=columns))
+
+
+def iter_corpus(file_path, columns=None, batch_size=1000):
+    """
+        Reads a Parquet corpus written by save_corpus() or CorpusWriter in chunks of at most batch_size rows.
+
+        Parameters:
+            file_path (str): The path of the Parquet file.
+            columns (list of str, optional): The columns to read. Defaults to None (all columns).
+            batch_size (int, optional): The maximum number of rows per chunk. Defaults to 1000.
+
+        Yields:
+            pandas DataFrame: The next chunk, with the list columns as Python lists.
+    """
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+    parquet_file = pq.ParquetFile(file_path)
+    if columns is not None:
+        _check_columns(columns, parquet_file.schema_arrow.names, file_path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield _to_frame(batch)
+
+
+def read_corpus(file_path, columns=None):
+    """
+        Reads a preprocessed corpus from either a Parquet file written by save_corpus() or a CSV file written by
+        preprocess(csv=True). List columns in CSV files are parsed with ast.literal_eval instead of eval().
+
+        Parameters:
+            file_path (str): The path of the .parquet or .csv file.
+            columns (list of str, optional): The columns to read. Defaults to None (all columns).
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+            ValueError: If one of the columns does not exist in the file.
+
+        Returns:
+            pandas DataFrame: The DataFrame with the list columns as Python lists.
+    """
+    if file_path.endswith('.parquet'):
+        return load_corpus(file_path, columns)
+
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+    if columns is not None:
+        _check_columns(columns, pd.read_csv(file_path, nrows=0).columns, file_path)
+    df = pd.read_csv(file_path, usecols=columns)
+    for column in LIST_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].apply(ast.literal_eval)
+    return df
+
+
+def corpus_file(name):
+    """
+        Returns the Parquet version of a preprocessed corpus file if it exists, else the name unchanged.
+
+        Parameters:
+            name (str): A file name such as 'guardian.csv'.
+
+        Returns:
+            str: 'guardian.parquet' if that file exists, otherwise name.
+    """
+    parquet_file = os.path.splitext(name)[0] + '.parquet'
+    return parquet_file if os.path.isfile(parquet_file) else name
+
+
+def _month(value):
+    """Returns a month such as '2022-11', pd.Timestamp('2022-11-20') or '2022-11-20' as 'YYYY-MM'."""
+    return str(pd.Period(value, freq='M'))
+
+
+def save_partitioned(df, newspaper, root=PARTITION_DIR):
+    """
+        Saves a preprocessed DataFrame with normalised dates (see ingest.normalise_dates() ) partitioned by newspaper and
+        month, one Parquet file per month in a Hive style directory layout:
+
+            <root>/newspaper=<newspaper>/month=<YYYY-MM>/part-0.parquet
+
+        Articles without a date go to the month 'undated'. The months are taken from the UTC dates. The partitions of
+        the newspaper are replaced as a whole; the new ones are written next to the old ones first, so readers never see
+        a half written newspaper.
+
+        Parameters:
+            df (pandas DataFrame): The preprocessed DataFrame with a 'date' column of UTC timestamps.
+            newspaper (str): The name of the newspaper, e.g. 'guardian'.
+            root (str, optional): The root directory of the partitions. Defaults to 'corpus'.
+
+        Returns:
+            list of str: The months written.
+    """
+    newspaper = newspaper.lower()
+    months = pd.to_datetime(df['date'], utc=True).dt.strftime('%Y-%m').fillna(UNDATED).to_numpy()
+    target = os.path.join(root, f'newspaper={newspaper}')
+    staging = f'{target}.staging'
+    shutil.rmtree(staging, ignore_errors=True)
+    written = []
+    for month, rows in df.groupby(months, sort=True).indices.items():
+        directory = os.path.join(staging, f'month={month}')
+        os.makedirs(directory)
+        save_corpus(df.iloc[rows], os.path.join(directory, 'part-0.parquet'))
+        written.append(month)
+    os.makedirs(staging, exist_ok=True)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+    return written
+
+
+def partitions(root=PARTITION_DIR, newspapers=None, start=None, end=None):
+    """
+        Lists the partitions written by save_partitioned() for some newspapers and a range of months. Only the
+        directory names are read, so this is how readers find the files of a range without opening any other file.
+
+        Parameters:
+            root (str, optional): The root directory of the partitions. Defaults to 'corpus'.
+            newspapers (iterable of str, optional): The newspapers to list. Defaults to None (all of them).
+            start (str or date, optional): The first month, e.g. '2022-11'. Defaults to None (from the first month).
+            end (str or date, optional): The last month, inclusive, e.g. '2022-12'. Defaults to None (to the last
+                                         month). The 'undated' partitions are only listed if neither start nor end is
+                                         given.
+
+        Returns:
+            list of tuple: (newspaper, month, file path) of every partition, sorted by newspaper and month.
+    """
+    if not os.path.isdir(root):
+        raise FileNotFoundError(f"Directory not found: {root}")
+    wanted = None if newspapers is None else {newspaper.lower() for newspaper in newspapers}
+    start = None if start is None else _month(start)
+    end = None if end is None else _month(end)
+    found = []
+    for newspaper_dir in sorted(os.listdir(root)):
+        name, _, newspaper = newspaper_dir.partition('=')
+        if name != 'newspaper' or newspaper.endswith('.staging') or (wanted is not None and newspaper not in wanted):
+            continue
+        for month_dir in sorted(os.listdir(os.path.join(root, newspaper_dir))):
+            month = month_dir.partition('=')[2]
+            if month == UNDATED and (start is not None or end is not None):
+                continue
+            if (start is not None and month < start) or (end is not None and month > end):
+                continue
+            found.append((newspaper, month, os.path.join(root, newspaper_dir, month_dir, 'part-0.parquet')))
+    return found
+
+
+def iter_partitions(root=PARTITION_DIR, newspapers=None, start=None, end=None, columns=None):
+    """
+        Reads the partitions of some newspapers and a range of months (see partitions() ) one at a time.
+
+        Parameters:
+            root, newspapers, start, end: See partitions().
+            columns (list of str, optional): The columns to read. Defaults to None (all columns).
+
+        Yields:
+            tuple: The newspaper, the month and the partition's DataFrame.
+    """
+    for newspaper, month, file_path in partitions(root, newspapers, start, end):
+        yield newspaper, month, load_corpus(file_path, columns)
+
+
+def read_partitions(root=PARTITION_DIR, newspapers=None, start=None, end=None, columns=None):
+    """
+        Reads the articles of some newspapers and a range of months from the partitioned corpus, e.g.
+        read_partitions(newspapers=['guardian'], start='2022-11', end='2022-12'). Only the files of those partitions
+        are opened.
+
+        Parameters:
+            root, newspapers, start, end: See partitions().
+            columns (list of str, optional): The columns to read. Defaults to None (all columns).
+
+        Returns:
+            pandas DataFrame: The articles, with the columns plus 'newspaper' and 'month'.
+    """
+    frames = [df.assign(newspaper=newspaper, month=month)
+              for newspaper, month, df in iter_partitions(root, newspapers, start, end, columns)]
+    if not frames:
+        return pd.DataFrame(columns=list(columns or []) + ['newspaper', 'month'])
+    return pd.concat(frames, ignore_index=True)
+
+
+def _check_columns(columns, available, file_path):
+    """Raises a ValueError naming the first requested column missing from a file."""
+    for column in columns:
+        if column not in available:
+            raise ValueError(f"Column '{column}' not found in file {file_path}.")
@@ -0,0 +1,8 @@
+"""
+The crawlers of the four newspapers and their shared frontier, response cache and HTML cleaner. The modules import
+each other and the repository's own modules (e.g. instrumentation.py) from the repository root, so run them from there:
+
+    python -m scrapy runspider crawler/sun.py -o sun_articles.json
+    python -m crawler.guardian
+    python -m crawler.replay sun sun_articles.json sun_hrefList.txt
+"""
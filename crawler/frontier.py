@@ -0,0 +1,141 @@
+import hashlib
+import io
+import sqlite3
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# status of a url in the frontier
+QUEUED = 0
+FETCHED = 1
+
+
+def canonicalise(url):
+    """
+    Canonicalises a URL so that different spellings of the same article map to the same key: lowercases scheme and host,
+    drops the fragment, default ports, utm_* tracking parameters and a trailing slash, and sorts the query parameters.
+
+    :param url: The URL to canonicalise.
+    :return: The canonical URL.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, netloc.rsplit(":", 1)[-1]) in (("http", "80"), ("https", "443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    query = urlencode(sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                             if not key.startswith("utm_")))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+class UrlFrontier:
+    """
+    Persistent URL frontier and dedup store shared by the spiders. Every URL is keyed by a hash of its canonical form
+    (or of a custom key function) in an SQLite table, so the crawl state survives restarts: URLs fetched in an earlier
+    run are skipped, URLs which were queued but never fetched are handed out again. Seen-checks are set lookups; new
+    URLs and status changes are written to the database in batches.
+
+    :param db_path: The SQLite file to keep the frontier in.
+    :param key: A function mapping a URL to the string it is deduplicated by. Defaults to canonicalise().
+    :param batch_size: The number of changes collected before they are written to the database.
+    """
+
+    def __init__(self, db_path, key=canonicalise, batch_size=100):
+        self.key = key
+        self.batch_size = batch_size
+        self._db = sqlite3.connect(db_path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS urls ("
+                         "key TEXT PRIMARY KEY, url TEXT NOT NULL, status INTEGER NOT NULL, added REAL NOT NULL)")
+        self._known = set()
+        self._fetched = set()
+        for digest, status in self._db.execute("SELECT key, status FROM urls"):
+            self._known.add(digest)
+            if status == FETCHED:
+                self._fetched.add(digest)
+        # URLs handed out in this run, so they are not requested twice
+        self._claimed = set()
+        self._new = []
+        self._done = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self._known)
+
+    def _digest(self, url):
+        return hashlib.sha1(self.key(url).encode("utf8")).hexdigest()
+
+    def seen(self, url):
+        """:return: True if the URL (or another spelling of it) is already in the frontier."""
+        return self._digest(url) in self._known
+
+    def is_fetched(self, url):
+        """:return: True if the URL was marked as fetched, in this or an earlier run."""
+        return self._digest(url) in self._fetched
+
+    def claim(self, url):
+        """
+        Decides whether a spider should request a URL: adds it to the frontier if it is new and hands it out once per
+        run unless it has already been fetched.
+
+        :param url: The URL found by the spider.
+        :return: True if the URL should be requested now.
+        """
+        digest = self._digest(url)
+        if digest in self._fetched or digest in self._claimed:
+            return False
+        self._claimed.add(digest)
+        if digest not in self._known:
+            self._known.add(digest)
+            self._new.append((digest, url, QUEUED, time.time()))
+            self._flush_if_full()
+        return True
+
+    def mark_fetched(self, url):
+        """
+        Records that the article at a URL has been scraped, so later runs skip it.
+
+        :param url: The URL as passed to claim().
+        """
+        digest = self._digest(url)
+        if digest in self._fetched:
+            return
+        if digest not in self._known:
+            self._known.add(digest)
+            self._new.append((digest, url, QUEUED, time.time()))
+        self._fetched.add(digest)
+        self._done.append((FETCHED, digest))
+        self._flush_if_full()
+
+    def _flush_if_full(self):
+        if len(self._new) + len(self._done) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes the collected changes to the database."""
+        with self._db:
+            self._db.executemany("INSERT OR IGNORE INTO urls VALUES (?, ?, ?, ?)", self._new)
+            self._db.executemany("UPDATE urls SET status = ? WHERE key = ?", self._done)
+        self._new = []
+        self._done = []
+
+    def export(self, file_path):
+        """
+        Writes all URLs of the frontier, in the order they were found, to a text file (one per line), like the
+        *_hrefList.txt files.
+
+        :param file_path: The text file to write.
+        """
+        self.flush()
+        with io.open(file_path, "w", encoding="utf8") as file:
+            for (url,) in self._db.execute("SELECT url FROM urls ORDER BY added, rowid"):
+                file.write(url + "\n")
+
+    def close(self):
+        """Writes the remaining changes and closes the database."""
+        self.flush()
+        self._db.close()
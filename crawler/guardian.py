@@ -1,73 +1,191 @@
-from TheGuardian_credentials import api_key
+from crawler.TheGuardian_credentials import api_key
 import requests
 import json
+import logging
 import os
-from bs4 import BeautifulSoup
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from crawler.html_cleaner import clean_html
+from instrumentation import metrics
 
+logger = logging.getLogger(__name__)
 
-def soup_cleanse(html):
+
+base_url = "https://content.guardianapis.com/"
+# parameters
+query = 'qatar world cup'
+from_date = '2022-09-01'
+to_date = '2023-02-28'
+page_size = 200
+show_fields = "body"
+# iterating 10 times, 200 articles per page
+pages = range(1, 11)
+# harvested pages are kept here until all of them are done, so an interrupted run can be resumed
+work_dir = "guardian_articles"
+output_file = "guardian_articles.json"
+
+
+class RateLimiter:
     """
-    Cleans up an HTML string by removing specified tags.
+    Spaces out calls from any number of threads so that at most `rate` calls per second start.
 
-    :param html: A string containing HTML code to be cleaned.
-    :return: A string containing the cleaned HTML code.
+    :param rate: The maximum number of calls per second.
     """
-    to_decompose = ['figure', 'span', 'aside']
-    to_unwrap = ['a', 'div', 'time', 'strong', 'em', 'bold', 'br', 'li',
-                 'ol', 'ul', 's', 'sup', 'h2', 'blockquote', 'p']
-    try:
-        soup = BeautifulSoup(html, 'html.parser')
-    except:
-        return ''
 
-    [x.decompose() for tag in to_decompose for x in soup.find_all(tag)]
-    [x.unwrap() for tag in to_unwrap for x in soup.find_all(tag)]
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
 
-    return str(soup)
+    def wait(self):
+        """Blocks until the caller may start its call."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        time.sleep(start - now)
 
 
-if not os.path.exists("guardian_articles"):
-    os.makedirs("guardian_articles")
+def make_session(pool_size=8, retries=5, backoff=0.5):
+    """
+    Creates a requests session which reuses its connections and retries failed requests with exponential backoff
+    (also on 429 and 5xx responses, honouring Retry-After).
 
-base_url = "https://content.guardianapis.com/"
-# parameters
-query = 'qatar%20world%20cup'
-from_date = '2022-09-01'
-to_date = '2023-02-28'
-page_size = 200
-show_fields = "body"
+    :param pool_size: The number of connections kept open per host.
+    :param retries: The maximum number of retries per request.
+    :param backoff: The backoff factor in seconds between retries.
+    :return: The session.
+    """
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=frozenset(['GET']))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
-json_list = []
 
-# iterating 10 times, 200 articles per page
-for page_number in range(1, 11):
-    final_url = f"{base_url}search?page-size={page_size}&page={page_number}" \
-                f"&from-date={from_date}&to-date={to_date}&q={query}&show-fields={show_fields}&api-key={api_key}"
+def fetch_page(session, page_number, limiter, base_url=base_url, api_key=api_key, timeout=30):
+    """
+    Requests one result page of the Guardian content API search.
+
+    :param session: The session to send the request with.
+    :param page_number: The number of the result page, starting at 1.
+    :param limiter: The RateLimiter shared by all requests.
+    :param base_url: The URL of the API (or of a stand-in server).
+    :param api_key: The Guardian API key.
+    :param timeout: Seconds to wait for the server.
+    :return: The list of result dictionaries of the page.
+    """
+    params = {
+        "page-size": page_size,
+        "page": page_number,
+        "from-date": from_date,
+        "to-date": to_date,
+        "q": query,
+        "show-fields": show_fields,
+        "api-key": api_key,
+    }
+    limiter.wait()
+    with metrics.stage("guardian/fetch_page", page=page_number) as stage:
+        r = session.get(f"{base_url}search", params=params, timeout=timeout)
+        r.raise_for_status()
+        results = r.json()["response"]["results"]
+        stage.items_out(articles=len(results), bytes=len(r.content))
+    logger.info(f"fetched page {page_number}")
+    return results
+
+
+def clean_results(results):
+    """
+    Cleans the article bodies of one result page and keeps title, date and content of every article.
 
-    # perform the request and print the query
-    r = requests.get(url=final_url, params={})
-    print(final_url, '\t')
+    :param results: The result dictionaries of a page as returned by fetch_page().
+    :return: A list of dictionaries with the keys "title", "date" and "content".
+    """
+    return [{
+        "title": article["webTitle"],
+        "date": article["webPublicationDate"],
+        "content": clean_html(article["fields"]["body"]),
+    } for article in results]
 
-    # output the responses to a file
-    Guardian = json.loads(r.text)
 
-    for i in range(len(Guardian['response']['results'])):
-        Guardian['response']['results'][i]['fields']['body'] = soup_cleanse(
-            Guardian['response']['results'][i]['fields']['body'])
+def _page_file(work_dir, page_number):
+    return os.path.join(work_dir, f"page_{page_number:04d}.json")
 
-    json_list.append(Guardian["response"]["results"])
 
-json_object = json.loads(json.dumps(json_list))
+def _write_page(work_dir, page_number, articles):
+    """Writes the cleaned articles of a page; the page only counts as done once the file is complete."""
+    tmp_file = _page_file(work_dir, page_number) + ".tmp"
+    with open(tmp_file, "w") as outfile:
+        json.dump(articles, outfile)
+    os.replace(tmp_file, _page_file(work_dir, page_number))
 
-new_dict_list = []
-for item in json_object:
-    for article in item:
-        new_dict = {
-            "title": article["webTitle"],
-            "date": article["webPublicationDate"],
-            "content": article["fields"]["body"]
-        }
-        new_dict_list.append(new_dict)
 
-with open("../../DH-Proj/guardian_articles.json", "w") as outfile:
-    json.dump(new_dict_list, outfile, indent=4)
+def harvest(pages=pages, base_url=base_url, api_key=api_key, work_dir=work_dir, output_file=output_file,
+            concurrency=4, rate=5.0, cleaners=None, session=None):
+    """
+    Harvests the result pages of the Guardian API concurrently. Pages are fetched over one pooled session by at most
+    `concurrency` threads, at most `rate` requests per second and with retries, while the article bodies are cleaned
+    in a separate process pool. Every cleaned page is written to `work_dir` as soon as it is done, and pages already
+    there are skipped, so an interrupted or partly failed run continues where it stopped. Once all pages are done the
+    articles are written to `output_file` in page order.
+
+    :param pages: The page numbers to harvest.
+    :param base_url: The URL of the API (or of a stand-in server serving canned responses).
+    :param api_key: The Guardian API key.
+    :param work_dir: Directory the harvested pages are kept in.
+    :param output_file: The JSON file to write all articles to.
+    :param concurrency: The maximum number of requests in flight.
+    :param rate: The maximum number of requests started per second.
+    :param cleaners: The number of processes cleaning article bodies (defaults to the number of CPUs).
+    :param session: A requests session to use instead of make_session().
+    :return: The page numbers which failed; empty if output_file was written.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    todo = [page for page in pages if not os.path.exists(_page_file(work_dir, page))]
+    logger.info(f"{len(pages) - len(todo)} pages already harvested, fetching {len(todo)}.")
+    session = session or make_session(pool_size=concurrency)
+    limiter = RateLimiter(rate)
+    failed = []
+
+    with ThreadPoolExecutor(max_workers=concurrency) as fetchers, ProcessPoolExecutor(max_workers=cleaners) as cleaner:
+        pending = {fetchers.submit(fetch_page, session, page, limiter, base_url, api_key): ("fetch", page)
+                   for page in todo}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                step, page = pending.pop(future)
+                try:
+                    result = future.result()
+                except (requests.RequestException, ValueError, KeyError) as error:
+                    logger.warning(f"page {page} failed: {error}")
+                    failed.append(page)
+                    continue
+                if step == "fetch":
+                    pending[cleaner.submit(clean_results, result)] = ("clean", page)
+                else:
+                    _write_page(work_dir, page, result)
+
+    if failed:
+        logger.error(f"pages {sorted(failed)} failed, run again to resume.")
+        return sorted(failed)
+
+    with metrics.stage("guardian/write", pages=len(pages)) as stage:
+        new_dict_list = []
+        for page in pages:
+            with open(_page_file(work_dir, page)) as infile:
+                new_dict_list.extend(json.load(infile))
+        with open(output_file, "w") as outfile:
+            json.dump(new_dict_list, outfile, indent=4)
+        stage.items_out(articles=len(new_dict_list))
+    logger.info(f"wrote {len(new_dict_list)} articles to {output_file}.")
+    return []
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    harvest()
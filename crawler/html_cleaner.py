@@ -0,0 +1,75 @@
+from concurrent.futures import ProcessPoolExecutor
+
+# tags removed together with everything inside them
+TO_DECOMPOSE = ('figure', 'span', 'aside')
+# tags removed while keeping what is inside them
+TO_UNWRAP = ('a', 'div', 'time', 'strong', 'em', 'bold', 'br', 'li',
+             'ol', 'ul', 's', 'sup', 'h2', 'blockquote', 'p')
+
+
+def clean_html(html):
+    """
+    Cleans up an HTML string by removing the figure, span and aside elements with their contents and unwrapping the
+    inline and block tags listed in TO_UNWRAP. Parses with lxml's libxml2 HTML parser instead of BeautifulSoup; the
+    markup it writes can differ from the BeautifulSoup based soup_cleanse() (see bs4_cleanse()) in attribute order,
+    quoting and how malformed nesting is repaired, but the text it keeps is the same.
+
+    :param html: A string containing HTML code to be cleaned.
+    :return: A string containing the cleaned HTML code, or '' if html is not a string.
+    """
+    # imported here, so that importing this module does not load lxml
+    import lxml.html
+
+    if isinstance(html, bytes):
+        html = html.decode('utf-8')
+    if not isinstance(html, str) or not html.strip():
+        return ''
+    body = lxml.html.document_fromstring(f'<html><body>{html}</body></html>').body
+    for element in list(body.iter(*TO_DECOMPOSE)):
+        element.drop_tree()
+    for element in list(body.iter(*TO_UNWRAP)):
+        element.drop_tag()
+    return (body.text or '') + ''.join(lxml.html.tostring(child, encoding='unicode') for child in body)
+
+
+def _clean_chunk(bodies):
+    return [clean_html(body) for body in bodies]
+
+
+def clean_many(bodies, workers=None, chunksize=256):
+    """
+    Cleans many article bodies with clean_html() across processes.
+
+    :param bodies: The HTML strings to clean.
+    :param workers: The number of processes (defaults to the number of CPUs); 1 cleans in this process.
+    :param chunksize: The number of bodies handed to a process at a time.
+    :return: The cleaned bodies, in the order of the input.
+    """
+    bodies = list(bodies)
+    if workers == 1:
+        return _clean_chunk(bodies)
+    chunks = [bodies[i:i + chunksize] for i in range(0, len(bodies), chunksize)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [body for chunk in pool.map(_clean_chunk, chunks) for body in chunk]
+
+
+def bs4_cleanse(html):
+    """
+    The original BeautifulSoup implementation of the cleaner, kept as the reference clean_html() is checked against.
+
+    :param html: A string containing HTML code to be cleaned.
+    :return: A string containing the cleaned HTML code, or '' if html is not a string.
+    """
+    from bs4 import BeautifulSoup
+
+    to_decompose = ['figure', 'span', 'aside']
+    to_unwrap = ['a', 'div', 'time', 'strong', 'em', 'bold', 'br', 'li',
+                 'ol', 'ul', 's', 'sup', 'h2', 'blockquote', 'p']
+    if not isinstance(html, (str, bytes)):
+        return ''
+    soup = BeautifulSoup(html, 'html.parser')
+
+    [x.decompose() for tag in to_decompose for x in soup.find_all(tag)]
+    [x.unwrap() for tag in to_unwrap for x in soup.find_all(tag)]
+
+    return str(soup)
@@ -2,8 +2,14 @@ import scrapy
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from scrapy.selector import Selector
-import os
-import io
+from crawler.frontier import UrlFrontier
+from crawler.response_cache import ResponseCache
+from instrumentation import metrics
+
+
+def article_id(url):
+    """the same Daily Mail article shows up under different paths, so links are deduplicated by their last part"""
+    return url.rstrip("/").split("/")[-1]
 
 
 class MailSpider(scrapy.Spider):
@@ -21,46 +27,67 @@ class MailSpider(scrapy.Spider):
     def __init__(self, **kwargs):
         """initialise selenium webdriver"""
         super().__init__(**kwargs)
+        # python -m scrapy runspider crawler/mail.py -a metrics_file=mail_metrics.json records the time spent per page
+        if getattr(self, "metrics_file", None):
+            metrics.enable()
         chrome_options = Options()
         chrome_options.add_argument("--headless")  # comment line to make browser visible
         self.driver = webdriver.Chrome(options=chrome_options)
+        # remembers found and scraped articles across runs
+        self.frontier = UrlFrontier("mail_frontier.sqlite", key=article_id)
+        # raw pages, so articles can be re-extracted offline with replay.py
+        self.cache = ResponseCache("mail_cache")
 
     def parse(self, response, **kwargs):
-        """parses raw response to get all href links, also writes a txt file containing them."""
-        self.driver.get(response.url)
-        sel = Selector(text=self.driver.page_source)
-        article_links = sel.css("h3.sch-res-title a::attr(href)").getall()
-        if os.path.isfile("mail_hrefList.txt"):
-            with open("mail_hrefList.txt", "r") as f:
-                linklist = f.readlines()
-        else:
-            linklist = []
+        """parses raw response to get all href links not scraped yet and adds them to the frontier."""
+        with metrics.stage("mail/search_page") as stage:
+            self.driver.get(response.url)
+            page_source = self.driver.page_source
+            self.cache.put(response.url, page_source, kind="search")
+            links = self.extract_links(page_source)
+            stage.items_out(links=len(links))
 
         # duplicate article handling
-        for link in article_links:
-            link_last_part = link.split("/")[-1]
-            if any(link_last_part + "\n" == existing_link.split("/")[-1] for existing_link in linklist):
-                continue
-            else:
-                linklist.append("https://www.dailymail.co.uk" + link + "\n")
-                yield scrapy.Request("https://www.dailymail.co.uk" + link, callback=self.parse_article)
-        with io.open("mail_hrefList.txt", "w", encoding="utf8") as file:
-            [file.write(link) for link in linklist]
+        for url in links:
+            if self.frontier.claim(url):
+                yield scrapy.Request(url, callback=self.parse_article, meta={"frontier_url": url})
+
+    @staticmethod
+    def extract_links(page_source):
+        """returns the URLs of all articles linked from a search result page."""
+        sel = Selector(text=page_source)
+        links = sel.css("h3.sch-res-title a::attr(href)").getall()
+        return ["https://www.dailymail.co.uk" + link for link in links]
 
     def parse_article(self, response):
-        """parses an article for metadata and yields a dictionary containing them as key value pairs."""
+        """caches the raw article and yields a dictionary containing its metadata as key value pairs."""
+        with metrics.stage("mail/article", bytes=len(response.body)):
+            self.cache.put(response.url, response.body, kind="article", encoding=response.encoding)
+            item = self.extract_article(response)
+        yield item
+        # only marked once the article was extracted and handed on, so a page which failed is fetched next run
+        self.frontier.mark_fetched(response.meta.get("frontier_url", response.url))
+
+    @staticmethod
+    def extract_article(response):
+        """parses an article for metadata and returns a dictionary containing them as key value pairs."""
         title = response.css("div#js-article-text h2::text").get()
         date = response.css("time::attr(datetime)").get()
 
         content = " ".join(response.css('div p.mol-para-with-font::text').getall())
 
-        yield {
+        return {
             "title": title,
             "date": date,
             "content": content,
         }
 
     def closed(self, reason):
-        """closes webdriver"""
+        """closes webdriver, writes the txt file of all href links, saves frontier and cache and writes metrics"""
         self.driver.quit()
+        self.frontier.export("mail_hrefList.txt")
+        self.frontier.close()
+        self.cache.close()
+        if getattr(self, "metrics_file", None):
+            metrics.to_json(self.metrics_file)
 
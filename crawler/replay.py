@@ -0,0 +1,92 @@
+import importlib
+import json
+import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from scrapy.http import HtmlResponse
+from crawler.response_cache import ResponseCache, load_body
+
+logger = logging.getLogger(__name__)
+
+# spider name -> (module, class, cache directory)
+SPIDERS = {
+    "sun": ("crawler.sun", "SunSpider", "sun_cache"),
+    "mail": ("crawler.mail", "MailSpider", "mail_cache"),
+    "times": ("crawler.times", "TimesSpider", "times_cache"),
+}
+
+
+def _replay_chunk(spider, cache_dir, entries):
+    """
+    Runs the link extraction (parse) of a spider over the cached search pages and the article extraction
+    (parse_article) over the cached article pages of a chunk.
+
+    :param spider: The spider name, a key of SPIDERS.
+    :param cache_dir: The directory of the cache.
+    :param entries: A list of (kind, url, digest, encoding, rendered digest or None) tuples.
+    :return: A tuple of the extracted links and the extracted items, in the order of the entries.
+    """
+    module, class_name, _ = SPIDERS[spider]
+    spider_class = getattr(importlib.import_module(module), class_name)
+    links = []
+    items = []
+    for kind, url, digest, encoding, rendered_digest in entries:
+        if kind == "search":
+            links.extend(spider_class.extract_links(load_body(cache_dir, digest).decode(encoding)))
+            continue
+        response = HtmlResponse(url=url, body=load_body(cache_dir, digest), encoding=encoding)
+        extras = [] if rendered_digest is None else [load_body(cache_dir, rendered_digest).decode("utf-8")]
+        item = spider_class.extract_article(response, *extras)
+        if item is not None:
+            items.append(item)
+    return links, items
+
+
+def replay(spider, cache_dir=None, output_file=None, links_file=None, workers=None, chunksize=200):
+    """
+    Re-runs a spider's extraction over its response cache, without network access and in parallel: extract_links() on
+    every cached search page and extract_article() on every cached article page. Useful after changing a selector in
+    the spider.
+
+    :param spider: The spider name, one of "sun", "mail" or "times".
+    :param cache_dir: The directory of the cache; defaults to the spider's "<name>_cache".
+    :param output_file: A JSON file to write the articles to, like `scrapy runspider -o`.
+    :param links_file: A text file to write the article links to (one per line), like the *_hrefList.txt files.
+    :param workers: The number of processes; defaults to the number of CPUs.
+    :param chunksize: The number of pages handed to a process at a time.
+    :return: A tuple of the article links found on the search pages, without duplicates, and the list of extracted
+             articles, both in the order the pages were fetched.
+    """
+    cache_dir = cache_dir or SPIDERS[spider][2]
+    with ResponseCache(cache_dir) as cache:
+        rendered = {url: digest for url, digest, _ in cache.entries(kind="rendered")}
+        entries = [("search", url, digest, encoding, None) for url, digest, encoding in cache.entries(kind="search")]
+        entries += [("article", url, digest, encoding, rendered.get(url))
+                    for url, digest, encoding in cache.entries(kind="article")]
+    chunks = [entries[i:i + chunksize] for i in range(0, len(entries), chunksize)]
+
+    links = {}
+    items = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk_links, chunk_items in pool.map(_replay_chunk, [spider] * len(chunks), [cache_dir] * len(chunks),
+                                                 chunks):
+            links.update(dict.fromkeys(chunk_links))
+            items.extend(chunk_items)
+    links = list(links)
+    logger.info(f"replayed {len(entries)} cached pages, found {len(links)} links and extracted {len(items)} articles.")
+
+    if output_file:
+        with open(output_file, "w", encoding="utf8") as outfile:
+            json.dump(items, outfile, indent=4)
+    if links_file:
+        with open(links_file, "w", encoding="utf8") as outfile:
+            for link in links:
+                outfile.write(link + "\n")
+    return links, items
+
+
+if __name__ == "__main__":
+    # python -m crawler.replay sun sun_articles.json sun_hrefList.txt
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    replay(sys.argv[1], output_file=sys.argv[2] if len(sys.argv) > 2 else None,
+           links_file=sys.argv[3] if len(sys.argv) > 3 else None)
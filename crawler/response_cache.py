@@ -0,0 +1,106 @@
+import hashlib
+import os
+import sqlite3
+import time
+import zlib
+
+
+def load_body(cache_dir, digest):
+    """
+    Reads and decompresses a cached body. Works without opening the index, so it can be used from worker processes.
+
+    :param cache_dir: The directory of the cache.
+    :param digest: The SHA-256 hex digest of the body.
+    :return: The body as bytes.
+    """
+    with open(os.path.join(cache_dir, "objects", digest[:2], digest[2:]), "rb") as file:
+        return zlib.decompress(file.read())
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of raw responses. Every body is stored once, zlib-compressed, under the SHA-256 of
+    its content; an SQLite index maps (url, kind) to the body, so identical pages are only stored once and a page can
+    be looked up by its URL. `kind` tells search result pages, article pages and pages rendered by Selenium apart.
+
+    :param cache_dir: The directory to keep the cache in.
+    :param commit_every: The number of new entries collected before the index is committed.
+    """
+
+    def __init__(self, cache_dir, commit_every=50):
+        self.cache_dir = cache_dir
+        self.commit_every = commit_every
+        os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"))
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses (url TEXT NOT NULL, kind TEXT NOT NULL, "
+                         "digest TEXT NOT NULL, encoding TEXT NOT NULL, fetched REAL NOT NULL, PRIMARY KEY (url, kind))")
+        self._uncommitted = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def put(self, url, body, kind="article", encoding="utf-8"):
+        """
+        Stores a response body.
+
+        :param url: The URL of the page.
+        :param body: The body as bytes, or as str which is encoded with `encoding`.
+        :param kind: The kind of page, e.g. "search", "article" or "rendered".
+        :param encoding: The encoding of the body.
+        :return: The digest the body is stored under.
+        """
+        if isinstance(body, str):
+            body = body.encode(encoding)
+        digest = hashlib.sha256(body).hexdigest()
+        path = os.path.join(self.cache_dir, "objects", digest[:2], digest[2:])
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as file:
+                file.write(zlib.compress(body, 6))
+            os.replace(path + ".tmp", path)
+        self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                         (url, kind, digest, encoding, time.time()))
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.commit()
+        return digest
+
+    def get(self, url, kind="article"):
+        """
+        Looks up a cached page.
+
+        :param url: The URL of the page.
+        :param kind: The kind of page.
+        :return: A tuple (body as bytes, encoding), or None if the page is not cached.
+        """
+        row = self._db.execute("SELECT digest, encoding FROM responses WHERE url = ? AND kind = ?",
+                               (url, kind)).fetchone()
+        if row is None:
+            return None
+        return load_body(self.cache_dir, row[0]), row[1]
+
+    def entries(self, kind="article"):
+        """
+        Lists the cached pages of a kind in the order they were fetched.
+
+        :param kind: The kind of page.
+        :return: A list of (url, digest, encoding) tuples.
+        """
+        return self._db.execute("SELECT url, digest, encoding FROM responses WHERE kind = ? ORDER BY fetched, rowid",
+                                (kind,)).fetchall()
+
+    def commit(self):
+        """Writes the new index entries to disk."""
+        self._db.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        """Commits and closes the index."""
+        self.commit()
+        self._db.close()
@@ -2,8 +2,9 @@ import scrapy
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from scrapy.selector import Selector
-import os
-import io
+from crawler.frontier import UrlFrontier
+from crawler.response_cache import ResponseCache
+from instrumentation import metrics
 
 
 class SunSpider(scrapy.Spider):
@@ -14,38 +15,58 @@ class SunSpider(scrapy.Spider):
     for i in range(2, 128):
         start_urls.append(f"https://www.thesun.co.uk/page/{i}/?s=qatar+world+cup%2F")
 
-    try:
-        os.remove("sun_hrefList.txt")
-    except OSError:
-        pass
-
     def __init__(self, **kwargs):
         """initialise selenium webdriver"""
         super().__init__(**kwargs)
+        # python -m scrapy runspider crawler/sun.py -a metrics_file=sun_metrics.json records the time spent per page
+        if getattr(self, "metrics_file", None):
+            metrics.enable()
         chrome_options = Options()
         chrome_options.add_argument("--headless")  # comment line to make browser visible
         self.driver = webdriver.Chrome(options=chrome_options)
+        # remembers found and scraped articles across runs
+        self.frontier = UrlFrontier("sun_frontier.sqlite")
+        # raw pages, so articles can be re-extracted offline with replay.py
+        self.cache = ResponseCache("sun_cache")
 
     def parse(self, response, **kwargs):
-        """parses raw response to get all href links, also writes a txt file containing them."""
-        self.driver.get(response.url)
-        sel = Selector(text=self.driver.page_source)
-        article_links = sel.css("a.teaser-anchor--search::attr(href)").getall()
+        """parses raw response to get all href links not scraped yet and adds them to the frontier."""
+        with metrics.stage("sun/search_page") as stage:
+            self.driver.get(response.url)
+            page_source = self.driver.page_source
+            self.cache.put(response.url, page_source, kind="search")
+            links = self.extract_links(page_source)
+            stage.items_out(links=len(links))
+
+        for link in links:
+            if self.frontier.claim(link):
+                yield scrapy.Request(link, callback=self.parse_article, meta={"frontier_url": link})
 
-        for link in article_links:
-            with io.open("sun_hrefList.txt", "a", encoding="utf8") as file:
-                file.write(link + "\n")
-            yield scrapy.Request(link, callback=self.parse_article)
+    @staticmethod
+    def extract_links(page_source):
+        """returns all article href links of a search result page."""
+        sel = Selector(text=page_source)
+        return sel.css("a.teaser-anchor--search::attr(href)").getall()
 
     def parse_article(self, response):
-        """parses an article for metadata and yields a dictionary containing them as key value pairs."""
+        """caches the raw article and yields a dictionary containing its metadata as key value pairs."""
+        with metrics.stage("sun/article", bytes=len(response.body)):
+            self.cache.put(response.url, response.body, kind="article", encoding=response.encoding)
+            item = self.extract_article(response)
+        yield item
+        # only marked once the article was extracted and handed on, so a page which failed is fetched next run
+        self.frontier.mark_fetched(response.meta.get("frontier_url", response.url))
+
+    @staticmethod
+    def extract_article(response):
+        """parses an article for metadata and returns a dictionary containing them as key value pairs."""
         title = response.css("h1.article__headline::text").get()
         author = response.css("a.article__author-link::text").get()
         date = response.css("span.article__timestamp::text").get()
 
         content = " ".join(response.css("div.article__content p::text").getall())
 
-        yield {
+        return {
             "title": title,
             #"author": author,
             "date": date,
@@ -53,5 +74,10 @@ class SunSpider(scrapy.Spider):
         }
 
     def closed(self, reason):
-        """closes webdriver"""
+        """closes webdriver, writes the txt file of all href links, saves frontier and cache and writes metrics"""
         self.driver.quit()
+        self.frontier.export("sun_hrefList.txt")
+        self.frontier.close()
+        self.cache.close()
+        if getattr(self, "metrics_file", None):
+            metrics.to_json(self.metrics_file)
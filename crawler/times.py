@@ -1,5 +1,3 @@
-import os
-import io
 import time
 from datetime import datetime
 import scrapy
@@ -9,6 +7,9 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from crawler.frontier import UrlFrontier
+from crawler.response_cache import ResponseCache
+from instrumentation import metrics
 
 
 class TimesSpider(scrapy.Spider):
@@ -19,17 +20,19 @@ class TimesSpider(scrapy.Spider):
     for i in range(2, 149):
         start_urls.append(f"https://www.thetimes.co.uk/search?filter=past_year&p={i}&q=qatar%20world%20cup&source=search-page")
 
-    try:
-        os.remove("times_hreflist.txt")
-    except OSError:
-        pass
-
     def __init__(self, **kwargs):
         """initialise selenium webdriver"""
         super().__init__(**kwargs)
+        # python -m scrapy runspider crawler/times.py -a metrics_file=times_metrics.json records the time spent per page
+        if getattr(self, "metrics_file", None):
+            metrics.enable()
         chrome_options = Options()
         chrome_options.add_argument("--headless")  # comment line to make browser visible
         self.driver = webdriver.Chrome(options=chrome_options)
+        # remembers found and scraped articles across runs
+        self.frontier = UrlFrontier("times_frontier.sqlite")
+        # raw pages, so articles can be re-extracted offline with replay.py
+        self.cache = ResponseCache("times_cache")
         self.driver.get("https://account.thetimes.co.uk/login?state=hKFo2SBHUkR1MnAtT245NWJwQU9McFJVX3lZRE4wcUVtRl96RaFupWxvZ2luo3RpZNkgckdZdGNrMlQwdGluQ1JIUmlRbEdlZXZUX0NiaWxwVVOjY2lk2SBEbXNVM0JCbXltb1VYT1JuWG9xcXJxaUJMTEtJNkl2Sg&client=DmsU3BBmymoUXORnXoqqrqiBLLKI6IvJ&protocol=oauth2&prompt=login&scope=openid%20profile%20email&response_type=code&redirect_uri=https%3A%2F%2Flogin.thetimes.co.uk%2Foidc%2Frp%2Fcallback&nustate=eyJyZXR1cm5fdXJsIjoiaHR0cHM6Ly93d3cudGhldGltZXMuY28udWsvIiwic2lnblVwTGluayI6Imh0dHBzOi8vam9pbi50aGV0aW1lcy5jby51ay8ifQ%3D%3D")
         email = WebDriverWait(self.driver, 10).until(EC.visibility_of_element_located((By.ID, "1-email")))
         password = WebDriverWait(self.driver, 10).until(EC.visibility_of_element_located((By.NAME, "password")))
@@ -43,47 +46,77 @@ class TimesSpider(scrapy.Spider):
         login.click()
 
     def parse(self, response, **kwargs):
-        """parses raw response to get all href links, also writes a txt file containing them."""
-        self.driver.get(response.url)
-        sel = Selector(text=self.driver.page_source)
-        article_links = sel.css("ul.SearchResultList>li>div>h2>a::attr(href)").getall()
+        """parses raw response to get all href links not scraped yet and adds them to the frontier."""
+        with metrics.stage("times/search_page") as stage:
+            self.driver.get(response.url)
+            page_source = self.driver.page_source
+            self.cache.put(response.url, page_source, kind="search")
+            links = self.extract_links(page_source)
+            stage.items_out(links=len(links))
+
+        for url in links:
+            if self.frontier.claim(url):
+                yield scrapy.Request(url, callback=self.parse_article, meta={"frontier_url": url})
 
-        for link in article_links:
-            with io.open("times_hrefList.txt", "a", encoding="utf8") as file:
-                file.write("https://www.thetimes.co.uk" + link + "\n")
-            yield scrapy.Request("https://www.thetimes.co.uk" + link, callback=self.parse_article)
+    @staticmethod
+    def extract_links(page_source):
+        """returns the URLs of all articles linked from a search result page."""
+        sel = Selector(text=page_source)
+        links = sel.css("ul.SearchResultList>li>div>h2>a::attr(href)").getall()
+        return ["https://www.thetimes.co.uk" + link for link in links]
 
     def parse_article(self, response):
-        """parses an article for metadata and yields a dictionary containing them as key value pairs."""
+        """renders the article with selenium, caches both versions and yields its metadata if it is in the timespan."""
+        with metrics.stage("times/article", bytes=len(response.body)):
+            self.driver.get(response.url)
+            try:
+                # Wait for the page to load completely
+                WebDriverWait(self.driver, 10).until(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, ".responsive__Paragraph-sc-1pktst5-0"))
+                )
+            except:
+                pass
+            rendered = self.driver.page_source
+            self.cache.put(response.url, response.body, kind="article", encoding=response.encoding)
+            self.cache.put(response.url, rendered, kind="rendered")
+
+            item = self.extract_article(response, rendered)
+        if item is not None:
+            yield item
+        # only marked once the article was extracted and handed on, so a page which failed is fetched next run
+        self.frontier.mark_fetched(response.meta.get("frontier_url", response.url))
+
+    @staticmethod
+    def extract_article(response, rendered=""):
+        """
+        parses an article for metadata and returns a dictionary containing them as key value pairs, or None if it is
+        not within September 2022 to February 2023. The content is taken from the page as rendered by selenium.
+        """
         date_str = response.css("div.tc-text__TcText-sc-15igzev-0 time::attr(datetime)").get()
-        # check if date is within September 2022 to February 2023
         title = response.css("title::text").get()
         author = response.css("meta[name='author']::attr(content)").get()
 
-        self.driver.get(response.url)
-        content = ""
-        try:
-            # Wait for the page to load completely
-            WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".responsive__Paragraph-sc-1pktst5-0"))
-            )
-            # Extract the text content of all p elements with the given class
-            paragraphs = self.driver.execute_script(
-                "return [...document.querySelectorAll('.responsive__Paragraph-sc-1pktst5-0')].map(x => x.textContent)")
-            content = " ".join(paragraphs)
-        except:
-            pass
+        # Extract the text content of all p elements with the given class
+        paragraphs = Selector(text=rendered or "<html></html>").css(".responsive__Paragraph-sc-1pktst5-0")
+        content = " ".join(paragraphs.xpath("string()").getall())
 
+        # check if date is within September 2022 to February 2023
         if date_str is not None:
             date = datetime.strptime(date_str, '%Y-%m-%dT%H:%M:%S.%fZ')
             if date.year == 2022 and date.month >= 9 or date.year == 2023 and date.month <= 2:
-                yield {
+                return {
                     "title": title,
                     "author": author,
                     "date": date_str,
                     "content": content,
                 }
+        return None
 
     def closed(self, reason):
-        """closes webdriver"""
+        """closes webdriver, writes the txt file of all href links, saves frontier and cache and writes metrics"""
         self.driver.quit()
+        self.frontier.export("times_hrefList.txt")
+        self.frontier.close()
+        self.cache.close()
+        if getattr(self, "metrics_file", None):
+            metrics.to_json(self.metrics_file)
@@ -0,0 +1,311 @@
+import hashlib
+import os
+import re
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+# words of the 'content' text that make up the shingles; lemma lists are used as they are
+WORD_PATTERN = re.compile(r"\w+")
+MODES = ('mark', 'collapse')
+# the shingles and signatures of the other newspapers' article files, see cached_signatures()
+SIGNATURE_DIR = '.dedup_signatures'
+
+
+def _word_id(word):
+    """A non-zero 63-bit id of a word which is the same in every process and run, so shingle hashes can be stored."""
+    return int.from_bytes(hashlib.blake2b(word.encode('utf8'), digest_size=8).digest(), 'little') >> 1 | 1
+
+
+def _words(document):
+    """Returns the lowercased words of a text, or a list of lemmas unchanged."""
+    if isinstance(document, str):
+        return WORD_PATTERN.findall(document.lower())
+    # missing content is read as None or NaN
+    return [] if document is None or isinstance(document, float) else list(document)
+
+
+def shingle_hashes(documents, k=5):
+    """
+        Hashes the k-word shingles (overlapping word k-grams) of every document to 64-bit integers. Every word gets a
+        stable 63-bit id (computed once per distinct word) and a shingle is hashed as a polynomial of its word ids, so
+        the hashes of separate calls can be compared; documents shorter than k words are one shingle.
+
+        Parameters:
+            documents (iterable of str or list of str): 'content' texts or 'lemmas' lists.
+            k (int, optional): The number of words per shingle. Defaults to 5.
+
+        Returns:
+            tuple: The sorted, unique uint64 shingle hashes of all documents, concatenated, and the offsets of the
+                   documents in them (document i is hashes[offsets[i]:offsets[i+1]]).
+    """
+    vocabulary = {}
+    powers = np.uint64(0x9E3779B97F4A7C15) ** np.arange(k, dtype=np.uint64)
+    parts, offsets = [], [0]
+    for document in documents:
+        ids = np.fromiter((vocabulary.get(word) or vocabulary.setdefault(word, _word_id(word))
+                           for word in _words(document)), dtype=np.uint64)
+        if len(ids) >= k:
+            hashes = np.lib.stride_tricks.sliding_window_view(ids, k) @ powers
+        else:
+            hashes = ids @ powers[:len(ids)] if len(ids) else ids
+        hashes = np.unique(hashes)
+        parts.append(hashes)
+        offsets.append(offsets[-1] + len(hashes))
+    hashes = np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint64)
+    return hashes.astype(np.uint64, copy=False), np.asarray(offsets, dtype=np.int64)
+
+
+def minhash_signatures(hashes, offsets, num_perm=128, seed=1, block_size=1 << 15):
+    """
+        Computes the MinHash signature of every document: for each of num_perm random multiply-shift hash functions, the
+        minimum hash of the document's shingles. The share of equal signature entries of two documents estimates the
+        Jaccard similarity of their shingle sets. Documents are processed in blocks of about block_size shingles, so
+        memory stays at num_perm x block_size hashes.
+
+        Parameters:
+            hashes (numpy array): The shingle hashes, see shingle_hashes().
+            offsets (numpy array): Document i is hashes[offsets[i]:offsets[i+1]].
+            num_perm (int, optional): The number of hash functions. Defaults to 128.
+            seed (int, optional): Random seed of the hash functions. Defaults to 1.
+            block_size (int, optional): The number of shingles hashed at once. Defaults to 32768.
+
+        Returns:
+            numpy array: The documents x num_perm uint32 signatures; documents without shingles are all 2**32 - 1.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, np.iinfo(np.uint64).max, size=(num_perm, 1), dtype=np.uint64, endpoint=True) | np.uint64(1)
+    b = rng.integers(0, np.iinfo(np.uint64).max, size=(num_perm, 1), dtype=np.uint64, endpoint=True)
+    signatures = np.full((len(offsets) - 1, num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+    nonempty = np.flatnonzero(np.diff(offsets) > 0)
+    ends = offsets[nonempty + 1]
+    start = 0
+    while start < len(nonempty):
+        end = max(start + 1, int(np.searchsorted(ends, offsets[nonempty[start]] + block_size, side='right')))
+        documents = nonempty[start:end]
+        low, high = offsets[documents[0]], offsets[documents[-1] + 1]
+        permuted = ((a * hashes[low:high] + b) >> np.uint64(32)).astype(np.uint32)
+        signatures[documents] = np.minimum.reduceat(permuted, offsets[documents] - low, axis=1).T
+        start = end
+    return signatures
+
+
+def lsh_parameters(num_perm, threshold):
+    """
+        Chooses the number of bands and rows per band of the LSH index so that (1 / bands) ** (1 / rows), where the
+        probability of becoming a candidate pair rises most steeply, is closest to the Jaccard threshold.
+
+        Returns:
+            tuple: bands and rows, with bands * rows <= num_perm.
+    """
+    options = [(num_perm // rows, rows) for rows in range(1, num_perm + 1)]
+    return min(options, key=lambda option: abs((1 / option[0]) ** (1 / option[1]) - threshold))
+
+
+def lsh_candidates(signatures, bands, rows, seed=1, max_bucket=64):
+    """
+        Finds the candidate pairs of LSH banding: the signatures are cut into bands of rows entries, and documents whose
+        entries agree on a whole band (same bucket) become candidates. Every band is hashed to one 64-bit key and the
+        buckets are found by sorting. A document is paired with the next max_bucket - 1 documents of its bucket, which
+        are all the others in buckets of up to max_bucket documents; in larger buckets (boilerplate, many copies of one
+        story) the pairs form overlapping windows, which keep the group connected without pairing everything with
+        everything. The cost is O(documents * bands * max_bucket). Documents without shingles are left out.
+
+        Returns:
+            numpy array: The candidate pairs (i, j), i < j, one per row.
+    """
+    documents = np.flatnonzero((signatures != np.iinfo(np.uint32).max).any(axis=1))
+    weights = np.random.default_rng(seed).integers(0, np.iinfo(np.uint64).max, size=rows, dtype=np.uint64,
+                                                   endpoint=True) | np.uint64(1)
+    first, second = [], []
+    for band in range(bands):
+        keys = signatures[documents, band * rows:(band + 1) * rows].astype(np.uint64) @ weights
+        # stable, so the documents of a bucket stay in ascending order
+        order = np.argsort(keys, kind='stable')
+        keys, members = keys[order], documents[order]
+        for distance in range(1, max_bucket):
+            same = np.flatnonzero(keys[distance:] == keys[:-distance])
+            if not len(same):
+                break
+            first.append(members[same])
+            second.append(members[same + distance])
+    if not first:
+        return np.zeros((0, 2), dtype=np.int64)
+    pairs = np.unique(np.concatenate(first).astype(np.int64) * len(signatures) + np.concatenate(second))
+    return np.column_stack([pairs // len(signatures), pairs % len(signatures)])
+
+
+def shingle_signatures(documents, k=5, num_perm=128, seed=1):
+    """
+        Computes the shingle hashes and MinHash signatures of documents, the input of group_duplicates().
+
+        Returns:
+            tuple: The shingle hashes, their offsets and the signatures, see shingle_hashes() and minhash_signatures().
+    """
+    hashes, offsets = shingle_hashes(documents, k)
+    return hashes, offsets, minhash_signatures(hashes, offsets, num_perm, seed)
+
+
+def _concat_signatures(parts):
+    """Concatenates the (hashes, offsets, signatures) of several sets of documents into one."""
+    hashes = np.concatenate([part[0] for part in parts]).astype(np.uint64, copy=False)
+    starts = np.cumsum([0] + [part[1][-1] for part in parts[:-1]])
+    offsets = np.concatenate([[0]] + [part[1][1:] + start for part, start in zip(parts, starts)]).astype(np.int64)
+    return hashes, offsets, np.concatenate([part[2] for part in parts])
+
+
+def cached_signatures(json_file, column='content', k=5, num_perm=128, seed=1, cache_dir=SIGNATURE_DIR):
+    """
+        Returns the shingle signatures (see shingle_signatures() ) of the articles of a JSON file. They are stored in
+        cache_dir together with the size and modification time of the file, and only computed again, from the file,
+        when it changed or other parameters are asked for.
+
+        Parameters:
+            json_file (str): The article file, e.g. 'times_articles.json'.
+            column (str, optional): The column to compare. Defaults to 'content'.
+            k, num_perm, seed: See shingle_signatures().
+            cache_dir (str, optional): The directory of the stored signatures. Defaults to SIGNATURE_DIR.
+
+        Returns:
+            tuple: The shingle hashes, their offsets and the signatures of the articles, in file order.
+    """
+    stat = os.stat(json_file)
+    fingerprint = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+    cache_file = os.path.join(cache_dir, f"{os.path.basename(json_file)}.{column}.{k}.{num_perm}.{seed}.npz")
+    if os.path.isfile(cache_file):
+        with np.load(cache_file) as cached:
+            if np.array_equal(cached['fingerprint'], fingerprint):
+                return cached['hashes'], cached['offsets'], cached['signatures']
+
+    hashes, offsets, signatures = shingle_signatures(pd.read_json(json_file, convert_dates=False)[column], k,
+                                                     num_perm, seed)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_file + '.tmp', 'wb') as file:
+        np.savez(file, fingerprint=fingerprint, hashes=hashes, offsets=offsets, signatures=signatures)
+    os.replace(cache_file + '.tmp', cache_file)
+    return hashes, offsets, signatures
+
+
+def group_duplicates(hashes, offsets, signatures, threshold=0.8, seed=1, max_bucket=64):
+    """
+        Groups near-duplicate documents given their shingle signatures (see shingle_signatures() ): the signatures are
+        banded into LSH buckets, the candidate pairs are checked with the exact Jaccard similarity of their shingle
+        sets, and documents linked by pairs above the threshold form a group.
+
+        Returns:
+            numpy array: The group label of every document; documents without near-duplicates have a label of their own.
+    """
+    n_documents = len(offsets) - 1
+    bands, rows = lsh_parameters(signatures.shape[1], threshold)
+    candidates = lsh_candidates(signatures, bands, rows, seed, max_bucket)
+
+    duplicates = []
+    for i, j in candidates:
+        first, second = hashes[offsets[i]:offsets[i + 1]], hashes[offsets[j]:offsets[j + 1]]
+        common = len(np.intersect1d(first, second, assume_unique=True))
+        if common / (len(first) + len(second) - common) >= threshold:
+            duplicates.append((i, j))
+    duplicates = np.array(duplicates, dtype=np.int64).reshape(-1, 2)
+    graph = coo_matrix((np.ones(len(duplicates)), (duplicates[:, 0], duplicates[:, 1])),
+                       shape=(n_documents, n_documents))
+    return connected_components(graph, directed=False)[1]
+
+
+def find_duplicates(documents, threshold=0.8, k=5, num_perm=128, seed=1, max_bucket=64):
+    """
+        Groups near-duplicate documents: MinHash signatures of the shingles are banded into LSH buckets, the candidate
+        pairs are checked with the exact Jaccard similarity of their shingle sets, and documents linked by pairs above
+        the threshold form a group.
+
+        Parameters:
+            documents (iterable of str or list of str): 'content' texts or 'lemmas' lists.
+            threshold (float, optional): The minimum Jaccard similarity of near-duplicates. Defaults to 0.8.
+            k (int, optional): The number of words per shingle. Defaults to 5.
+            num_perm (int, optional): The MinHash signature length. Defaults to 128.
+            seed (int, optional): Random seed. Defaults to 1.
+            max_bucket (int, optional): The number of following bucket members a document is paired with, plus one,
+                                        see lsh_candidates(). Defaults to 64.
+
+        Returns:
+            numpy array: The group label of every document; documents without near-duplicates have a label of their own.
+    """
+    return group_duplicates(*shingle_signatures(documents, k, num_perm, seed), threshold, seed, max_bucket)
+
+
+def _check_mode(mode):
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}, not {mode!r}")
+
+
+def deduplicate(df, column='content', threshold=0.8, mode='collapse', **kwargs):
+    """
+        Finds the near-duplicates within one newspaper, such as the same article found on overlapping search pages or
+        updated versions of it, and keeps the longest version of each.
+
+        Parameters:
+            df (pandas DataFrame): The articles.
+            column (str, optional): The column to compare, 'content' or 'lemmas'. Defaults to 'content'.
+            threshold (float, optional): The minimum Jaccard similarity of near-duplicates. Defaults to 0.8.
+            mode (str, optional): 'collapse' drops the other versions, 'mark' keeps them and adds a 'duplicate_of'
+                                  column with the index label of the kept version (-1 for kept articles).
+                                  Defaults to 'collapse'.
+            **kwargs: Passed on to find_duplicates().
+
+        Returns:
+            tuple: The DataFrame and the number of articles merged into (or marked as duplicates of) another one.
+    """
+    _check_mode(mode)
+    labels = find_duplicates(df[column], threshold, **kwargs)
+    lengths = pd.Series([len(_words(document)) for document in df[column]])
+    # the first of the longest versions of every group
+    kept = lengths.groupby(labels).idxmax().to_numpy()[labels]
+    duplicate = kept != np.arange(len(df))
+    if mode == 'collapse':
+        return df[~duplicate], int(duplicate.sum())
+    return df.assign(duplicate_of=np.where(duplicate, df.index.to_numpy()[kept], -1)), int(duplicate.sum())
+
+
+def deduplicate_across(df, newspaper, frames, column='content', threshold=0.8, mode='mark', k=5, num_perm=128, seed=1,
+                       max_bucket=64):
+    """
+        Finds the articles of one newspaper which have a near-duplicate in another newspaper, such as agency copy.
+
+        Parameters:
+            df (pandas DataFrame): The articles of the newspaper.
+            newspaper (str): Its name, e.g. 'sun'.
+            frames (dict): Maps newspaper names, in order of priority, to DataFrames with the column or to their
+                           signatures (see cached_signatures() ); df takes the place of frames[newspaper], or is
+                           appended if it is missing.
+            column (str, optional): The column to compare, 'content' or 'lemmas'. Defaults to 'content'.
+            threshold (float, optional): The minimum Jaccard similarity of near-duplicates. Defaults to 0.8.
+            mode (str, optional): 'mark' adds a 'syndicated' column with the comma-separated names of the other
+                                  newspapers having a copy, 'collapse' drops the articles of which a newspaper earlier
+                                  in frames has a copy, so every story is kept once across the newspapers.
+                                  Defaults to 'mark'.
+            k, num_perm, seed, max_bucket: See find_duplicates(); stored signatures must have been computed with the
+                                           same k, num_perm and seed.
+
+        Returns:
+            tuple: The DataFrame and the number of its articles which were marked or dropped.
+    """
+    _check_mode(mode)
+    frames = {**frames, newspaper: df}
+    names = list(frames)
+    parts = [shingle_signatures(frame[column], k, num_perm, seed) if isinstance(frame, pd.DataFrame) else frame
+             for frame in frames.values()]
+    sources = np.repeat(np.arange(len(names)), [len(part[1]) - 1 for part in parts])
+    labels = group_duplicates(*_concat_signatures(parts), threshold, seed, max_bucket)
+    own = names.index(newspaper)
+    groups = pd.DataFrame({'label': labels, 'source': sources}).drop_duplicates()
+    own_labels = labels[sources == own]
+
+    if mode == 'collapse':
+        first_source = groups.groupby('label')['source'].min()
+        dropped = first_source.reindex(own_labels).to_numpy() < own
+        return df[~dropped], int(dropped.sum())
+
+    other_papers = (groups[groups['source'] != own].sort_values('source')
+                    .groupby('label')['source'].agg(lambda sources: ','.join(names[source] for source in sources)))
+    syndicated = other_papers.reindex(own_labels).fillna('').to_numpy()
+    return df.assign(syndicated=syndicated), int((syndicated != '').sum())
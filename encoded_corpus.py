@@ -0,0 +1,273 @@
+import json
+import os
+from array import array
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from methods import SparseTermMatrix
+
+# POS tag with id 0, given to lemmas without a tag
+UNKNOWN_TAG = ''
+
+
+def tagged_sentences(df):
+    """
+        Splits the lemmas of a preprocessed DataFrame (obtained using preprocess() ) into sentences of (lemma, tag)
+        pairs, using the 'lemma_tags' and 'sentence_lengths' columns preprocess() keeps aligned with the lemmas through
+        player name and rare token removal and compounding.
+
+        Parameters:
+            df (pandas DataFrame): A preprocessed DataFrame with 'lemmas', 'lemma_tags' and 'sentence_lengths' columns.
+
+        Raises:
+            ValueError: If the DataFrame has no 'lemma_tags' or 'sentence_lengths' column, e.g. because it was
+                        preprocessed by an older version; preprocess it again.
+
+        Yields:
+            list of list of tuple: For every article, the (lemma, tag) pairs of each of its sentences.
+    """
+    if 'lemma_tags' not in df.columns or 'sentence_lengths' not in df.columns:
+        raise ValueError("the DataFrame has no 'lemma_tags' and 'sentence_lengths' columns, preprocess it again")
+    for lemmas, lemma_tags, sentence_lengths in zip(df['lemmas'], df['lemma_tags'], df['sentence_lengths']):
+        doc = []
+        start = 0
+        for length in sentence_lengths:
+            doc.append(list(zip(lemmas[start:start + length], lemma_tags[start:start + length])))
+            start += length
+        yield doc
+
+
+def _frombuffer(values, dtype):
+    """Wraps a filled array.array as a numpy array without copying it."""
+    return np.frombuffer(values, dtype=dtype) if len(values) else np.zeros(0, dtype=dtype)
+
+
+class EncodedCorpus:
+    """
+        A preprocessed corpus with the vocabulary interned once: the lemmas of all documents are one flat int32 array
+        of term ids, and document i is the slice lemma_ids[offsets[i]:offsets[i+1]]. POS tag ids (uint8) run parallel
+        to the lemma ids, and sentence_offsets gives the sentence boundaries in the same CSR style, so a token costs
+        five bytes instead of a Python string per occurrence. Documents, sentences and sub-corpora are numpy views of
+        these arrays, and to_dtm() builds the document-term matrix straight from them without re-tokenising
+        'lemmatised_text'.
+
+        Attributes:
+            terms (numpy array): The term of every id.
+            tags (numpy array): The POS tag of every POS id.
+            lemma_ids (numpy array): The int32 term ids of all documents, concatenated.
+            pos_ids (numpy array or None): The uint8 POS id of every lemma.
+            offsets (numpy array): Document i is lemma_ids[offsets[i]:offsets[i+1]].
+            sentence_offsets (numpy array or None): Sentence j is lemma_ids[sentence_offsets[j]:sentence_offsets[j+1]].
+            doc_sentences (numpy array or None): The sentences of document i are doc_sentences[i]:doc_sentences[i+1].
+            documents (pandas DataFrame): One row of metadata (e.g. 'date') per document.
+    """
+
+    def __init__(self, terms, lemma_ids, offsets, tags=None, pos_ids=None, sentence_offsets=None,
+                 doc_sentences=None, documents=None):
+        self.terms = np.asarray(terms, dtype=object)
+        self.tags = np.asarray([] if tags is None else tags, dtype=object)
+        self.lemma_ids = lemma_ids
+        self.pos_ids = pos_ids
+        self.offsets = offsets
+        self.sentence_offsets = sentence_offsets
+        self.doc_sentences = doc_sentences
+        self.documents = documents if documents is not None else pd.DataFrame(index=range(len(offsets) - 1))
+        self._term_index = None
+
+    @classmethod
+    def from_lemmas(cls, lemmas, documents=None, vocabulary=None):
+        """
+            Encodes lists of lemmas, without POS tags and sentence boundaries.
+
+            Parameters:
+                lemmas (iterable of list of str): The lemmas of every document.
+                documents (pandas DataFrame, optional): Metadata of the documents. Defaults to None.
+                vocabulary (dict, optional): Maps terms to ids; new terms are added to it. Defaults to a new dict.
+
+            Returns:
+                EncodedCorpus: The encoded corpus.
+        """
+        vocabulary = {} if vocabulary is None else vocabulary
+        ids = array('i')
+        offsets = array('q', [0])
+        for doc in lemmas:
+            ids.extend(vocabulary.setdefault(lemma, len(vocabulary)) for lemma in doc)
+            offsets.append(len(ids))
+        return cls(list(vocabulary), _frombuffer(ids, np.int32), _frombuffer(offsets, np.int64),
+                   documents=documents)
+
+    @classmethod
+    def from_frame(cls, df, metadata=('date',)):
+        """
+            Encodes a preprocessed DataFrame (obtained using preprocess() ). If it has 'lemma_tags' and
+            'sentence_lengths' columns, the POS tags and sentence boundaries of the lemmas are encoded as well (see
+            tagged_sentences() ).
+
+            Parameters:
+                df (pandas DataFrame): A preprocessed DataFrame with a 'lemmas' column.
+                metadata (iterable of str, optional): The columns kept as document metadata, where present.
+                                                      Defaults to ('date',).
+
+            Returns:
+                EncodedCorpus: The encoded corpus.
+        """
+        documents = df[[column for column in metadata if column in df.columns]].reset_index(drop=True)
+        if 'lemma_tags' not in df.columns or 'sentence_lengths' not in df.columns:
+            return cls.from_lemmas(df['lemmas'], documents)
+
+        vocabulary, tag_vocabulary = {}, {UNKNOWN_TAG: 0}
+        ids, pos_ids = array('i'), array('B')
+        offsets, sentence_offsets, doc_sentences = array('q', [0]), array('q', [0]), array('q', [0])
+        for doc in tagged_sentences(df):
+            for sentence in doc:
+                for lemma, tag in sentence:
+                    ids.append(vocabulary.setdefault(lemma, len(vocabulary)))
+                    pos_ids.append(tag_vocabulary.setdefault(tag, len(tag_vocabulary)))
+                sentence_offsets.append(len(ids))
+            offsets.append(len(ids))
+            doc_sentences.append(len(sentence_offsets) - 1)
+        return cls(list(vocabulary), _frombuffer(ids, np.int32), _frombuffer(offsets, np.int64),
+                   tags=list(tag_vocabulary), pos_ids=_frombuffer(pos_ids, np.uint8),
+                   sentence_offsets=_frombuffer(sentence_offsets, np.int64),
+                   doc_sentences=_frombuffer(doc_sentences, np.int64), documents=documents)
+
+    def __repr__(self):
+        return (f"EncodedCorpus({len(self)} documents, {len(self.lemma_ids)} tokens, {len(self.terms)} terms, "
+                f"{self.nbytes} bytes)")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        """Iterates over the term id arrays (views) of the documents."""
+        for start, end in zip(self.offsets[:-1], self.offsets[1:]):
+            yield self.lemma_ids[start:end]
+
+    def __getitem__(self, key):
+        """
+            Returns the term ids of document <key> (a view), or for a slice of documents an EncodedCorpus sharing this
+            corpus' arrays and vocabulary.
+        """
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError("only contiguous slices of an EncodedCorpus are supported")
+            stop = max(start, stop)
+            offsets = self.offsets[start:stop + 1]
+            sentence_offsets = doc_sentences = None
+            if self.doc_sentences is not None:
+                doc_sentences = self.doc_sentences[start:stop + 1]
+                sentence_offsets = self.sentence_offsets[doc_sentences[0]:doc_sentences[-1] + 1] - offsets[0]
+                doc_sentences = doc_sentences - doc_sentences[0]
+            token_slice = slice(offsets[0], offsets[-1])
+            return EncodedCorpus(self.terms, self.lemma_ids[token_slice], offsets - offsets[0], tags=self.tags,
+                                 pos_ids=None if self.pos_ids is None else self.pos_ids[token_slice],
+                                 sentence_offsets=sentence_offsets, doc_sentences=doc_sentences,
+                                 documents=self.documents.iloc[start:stop].reset_index(drop=True))
+        if key < 0:
+            key += len(self)
+        return self.lemma_ids[self.offsets[key]:self.offsets[key + 1]]
+
+    @property
+    def nbytes(self):
+        """The number of bytes of the token and offset arrays."""
+        arrays = (self.lemma_ids, self.pos_ids, self.offsets, self.sentence_offsets, self.doc_sentences)
+        return sum(values.nbytes for values in arrays if values is not None)
+
+    def term_id(self, term):
+        """Returns the id of a term, or -1 if it is not in the vocabulary."""
+        if self._term_index is None:
+            self._term_index = pd.Index(self.terms)
+        return int(self._term_index.get_indexer([term])[0])
+
+    def lemmas(self, document):
+        """Returns the lemmas of a document as strings."""
+        return self.terms[self[document]].tolist()
+
+    def pos(self, document):
+        """Returns the POS tags of the lemmas of a document."""
+        if self.pos_ids is None:
+            raise ValueError("the corpus was encoded without POS tags")
+        return self.tags[self.pos_ids[self.offsets[document]:self.offsets[document + 1]]].tolist()
+
+    def sentences(self, document=None):
+        """
+            Iterates over the term id arrays (views) of the sentences of one document, or of all documents.
+
+            Raises:
+                ValueError: If the corpus was encoded without sentence boundaries.
+        """
+        if self.sentence_offsets is None:
+            raise ValueError("the corpus was encoded without sentence boundaries")
+        if document is None:
+            first, last = 0, len(self.sentence_offsets) - 1
+        else:
+            first, last = self.doc_sentences[document], self.doc_sentences[document + 1]
+        for start, end in zip(self.sentence_offsets[first:last], self.sentence_offsets[first + 1:last + 1]):
+            yield self.lemma_ids[start:end]
+
+    def to_dtm(self, min_docfreq=1, max_docfreq=1.0):
+        """
+            Builds the document-term matrix of counts directly from the term ids. The result equals
+            methods.df_to_dtm() on the lemmas joined with spaces (preprocess()'s 'lemmatised_text' column if rare
+            tokens were kept or collocations compounded; otherwise that column still holds the rare tokens): terms are
+            sorted alphabetically, and single-character terms are left out like CountVectorizer's default token
+            pattern does.
+
+            Parameters:
+                min_docfreq (int or float, optional): Terms occurring in fewer documents (or, as a float, a smaller
+                                                      proportion of documents) are dropped. Defaults to 1.
+                max_docfreq (int or float, optional): Terms occurring in more documents are dropped. Defaults to 1.0.
+
+            Returns:
+                SparseTermMatrix: The DTM, with the metadata of the corpus as document metadata.
+        """
+        n_documents = len(self)
+        matrix = sp.csr_matrix((np.ones(len(self.lemma_ids), dtype=np.int64), self.lemma_ids,
+                                self.offsets - self.offsets[0]), shape=(n_documents, len(self.terms)), copy=True)
+        matrix.sum_duplicates()
+
+        docfreq = np.bincount(matrix.indices, minlength=len(self.terms))
+        min_count = min_docfreq if isinstance(min_docfreq, int) else min_docfreq * n_documents
+        max_count = max_docfreq if isinstance(max_docfreq, int) else max_docfreq * n_documents
+        lengths = np.fromiter((len(term) for term in self.terms), dtype=np.int64, count=len(self.terms))
+        keep = np.flatnonzero((docfreq >= min_count) & (docfreq <= max_count) & (lengths > 1))
+        keep = keep[np.argsort(self.terms[keep].astype(str), kind='stable')]
+        return SparseTermMatrix(matrix[:, keep], self.terms[keep], self.documents)
+
+    def save(self, directory):
+        """
+            Saves the corpus as one .npy file per array plus the vocabulary and metadata, so load() can memory-map it.
+
+            Parameters:
+                directory (str): The directory to write to; it is created if needed.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in ('lemma_ids', 'pos_ids', 'offsets', 'sentence_offsets', 'doc_sentences'):
+            values = getattr(self, name)
+            if values is not None:
+                np.save(os.path.join(directory, f"{name}.npy"), values)
+        with open(os.path.join(directory, 'vocabulary.json'), 'w') as f:
+            json.dump({'terms': self.terms.tolist(), 'tags': self.tags.tolist()}, f)
+        self.documents.to_parquet(os.path.join(directory, 'documents.parquet'))
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+            Loads a corpus written by save().
+
+            Parameters:
+                directory (str): The directory save() wrote to.
+                mmap (bool, optional): If True the arrays are memory-mapped read-only instead of read. Defaults to True.
+
+            Returns:
+                EncodedCorpus: The loaded corpus.
+        """
+        arrays = {}
+        for name in ('lemma_ids', 'pos_ids', 'offsets', 'sentence_offsets', 'doc_sentences'):
+            path = os.path.join(directory, f"{name}.npy")
+            arrays[name] = np.load(path, mmap_mode='r' if mmap else None) if os.path.isfile(path) else None
+        with open(os.path.join(directory, 'vocabulary.json')) as f:
+            vocabulary = json.load(f)
+        documents = pd.read_parquet(os.path.join(directory, 'documents.parquet'))
+        return cls(vocabulary['terms'], tags=vocabulary['tags'], documents=documents, **arrays)
@@ -1,19 +1,30 @@
-import requests
-from bs4 import BeautifulSoup
+import json
+import os
+from datetime import datetime, timedelta, timezone
 
+PLAYERLIST_URL = "https://en.wikipedia.org/wiki/2022_FIFA_World_Cup_squads"
+# bump when the parsing changes, so old caches are not used any more
+CACHE_VERSION = 1
+CACHE_FILE = "playerlist_cache.json"
+# snapshot shipped with the repository, used when there is neither a cache nor a network connection
+SNAPSHOT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "playerlist_snapshot.json")
+MAX_AGE = timedelta(days=30)
 
-def fetch_playerlist():
+
+def parse_playerlist(html_content):
     """
-        Fetches a list of player names from the Wikipedia page for the 2022 FIFA World Cup squads.
+        Parses the player names out of the HTML of the Wikipedia page for the 2022 FIFA World Cup squads.
+
+        Parameters:
+            html_content (str or bytes): The HTML of the page.
 
         Returns:
-            set: A set containing the individual tokens from the names of all players listed on the page.
-        """
-    url = "https://en.wikipedia.org/wiki/2022_FIFA_World_Cup_squads"
+            frozenset: A set containing the individual lowercased tokens from the names of all players listed on the page.
+    """
+    # imported here, so that only parsing a downloaded page loads BeautifulSoup
+    from bs4 import BeautifulSoup
 
     player_list = []
-
-    html_content = requests.get(url).content
     # Parse HTML content with BeautifulSoup
     soup = BeautifulSoup(html_content, 'html.parser')
 
@@ -29,6 +40,115 @@ def fetch_playerlist():
             name_tokens = name.split()
             player_list.extend(name_tokens)
 
-    return [n.lower() for n in set(player_list)]
+    return frozenset(n.lower() for n in player_list)
+
+
+def _read_lexicon(file_path):
+    """
+        Reads a player lexicon file written by _write_lexicon().
+
+        Returns:
+            tuple: The player tokens as a frozenset and the time they were fetched, or (None, None) if the file does not
+                   exist, is malformed or empty, or was written by a different CACHE_VERSION.
+    """
+    try:
+        with open(file_path, encoding="utf8") as file:
+            lexicon = json.load(file)
+        if lexicon["version"] != CACHE_VERSION:
+            return None, None
+        players, fetched = frozenset(lexicon["players"]), datetime.fromisoformat(lexicon["fetched"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None, None
+    # an empty lexicon would silently switch off the player name filter
+    if not players:
+        return None, None
+    return players, fetched
+
+
+def _write_lexicon(file_path, players):
+    """Writes the player tokens to a versioned and timestamped JSON lexicon file."""
+    lexicon = {
+        "version": CACHE_VERSION,
+        "source": PLAYERLIST_URL,
+        "fetched": datetime.now(timezone.utc).isoformat(),
+        "players": sorted(players),
+    }
+    with open(file_path, "w", encoding="utf8") as file:
+        json.dump(lexicon, file, indent=1)
+
+
+def _download_playerlist():
+    """
+        Downloads and parses the Wikipedia page.
+
+        Raises:
+            requests.RequestException: If the page cannot be downloaded or answers with an HTTP error.
+            ValueError: If the page has no player names, e.g. because its layout changed.
+
+        Returns:
+            frozenset: The player tokens, see parse_playerlist().
+    """
+    # imported here, so that reading the cache does not load requests
+    import requests
+
+    response = requests.get(PLAYERLIST_URL, timeout=30)
+    response.raise_for_status()
+    players = parse_playerlist(response.content)
+    if not players:
+        raise ValueError(f"no player names found on {PLAYERLIST_URL}")
+    return players
+
+
+def fetch_playerlist(refresh=False, html_file=None, cache_file=CACHE_FILE, max_age=MAX_AGE):
+    """
+        Fetches the player names from the Wikipedia page for the 2022 FIFA World Cup squads.
+        The names are cached on disk; the page is only downloaded again if refresh is True or the cache is older than
+        max_age. If the download fails, a stale cache or else the snapshot bundled in data/ is used.
+
+        Parameters:
+            refresh (bool, optional): If True, downloads the page even if the cache is still valid. Defaults to False.
+            html_file (str, optional): Path to a saved copy of the page to parse instead of downloading it. Neither
+                                       reads nor writes the cache. Defaults to None.
+            cache_file (str, optional): Path of the JSON cache file. Defaults to "playerlist_cache.json".
+            max_age (datetime.timedelta, optional): How long a cache stays valid. Defaults to 30 days.
+
+        A page which cannot be downloaded, answers with an HTTP error or yields no player names is never cached.
+
+        Raises:
+            requests.RequestException: If the page cannot be downloaded and there is no cache or snapshot to fall back on.
+            ValueError: If the page has no player names and there is no cache or snapshot to fall back on.
+
+        Returns:
+            frozenset: A set containing the individual lowercased tokens from the names of all players listed on the page.
+    """
+    if html_file is not None:
+        with open(html_file, "rb") as file:
+            return parse_playerlist(file.read())
+
+    players, fetched = _read_lexicon(cache_file)
+    if players is not None and not refresh and datetime.now(timezone.utc) - fetched < max_age:
+        return players
+
+    # imported here, so that reading the cache does not load requests
+    import requests
+
+    try:
+        downloaded = _download_playerlist()
+    except (requests.RequestException, ValueError) as error:
+        if players is not None:
+            print(f"could not download player list ({error}), using cache from {fetched:%Y-%m-%d}.")
+            return players
+        players, fetched = _read_lexicon(SNAPSHOT_FILE)
+        if players is not None:
+            print(f"could not download player list ({error}), using bundled snapshot from {fetched:%Y-%m-%d}.")
+            return players
+        raise
+
+    _write_lexicon(cache_file, downloaded)
+    return downloaded
+
 
-# print(fetch_playerlist())
+if __name__ == "__main__":
+    # refreshes the bundled snapshot; fails instead of falling back to the cache or the old snapshot
+    _write_lexicon(SNAPSHOT_FILE, _download_playerlist())
+    print(f"wrote {SNAPSHOT_FILE}.")
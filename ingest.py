@@ -0,0 +1,119 @@
+import json
+import logging
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# characters read from the file at a time
+BUFFER_SIZE = 1 << 16
+# the format of the 'date' field written by every crawler: the Sun's article pages only show the day ("6 Feb 2023"),
+# the other sources give ISO 8601 timestamps in UTC
+DATE_FORMATS = {
+    'guardian': '%Y-%m-%dT%H:%M:%SZ',
+    'mail': '%Y-%m-%dT%H:%M:%S%z',
+    'times': '%Y-%m-%dT%H:%M:%S.%fZ',
+    'sun': '%d %b %Y',
+}
+
+
+def iter_articles(file_path, buffer_size=BUFFER_SIZE):
+    """
+        Reads article records one at a time from a JSON file without loading the whole file. Accepts both a JSON array
+        of objects (like sun_articles.json or the Guardian crawler output) and JSON lines with one object per line
+        (scrapy's `-o articles.jl` output).
+
+        Parameters:
+            file_path (str): The path of the JSON or JSON lines file.
+            buffer_size (int, optional): Number of characters read at a time. Defaults to 65536.
+
+        Raises:
+            ValueError: If the file is not valid JSON.
+
+        Yields:
+            dict: The next article record, e.g. {"title": ..., "date": ..., "content": ...}.
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, encoding='utf8') as file:
+        buffer = file.read(buffer_size).lstrip()
+        in_array = buffer.startswith('[')
+        if in_array:
+            buffer = buffer[1:]
+
+        while True:
+            buffer = buffer.lstrip()
+            if in_array and buffer.startswith(','):
+                buffer = buffer[1:].lstrip()
+            if in_array and buffer.startswith(']'):
+                return
+            if buffer:
+                try:
+                    record, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    # most likely the record continues after the buffer; read at least as much again
+                    more = file.read(max(buffer_size, len(buffer)))
+                    if not more:
+                        raise
+                    buffer += more
+                    continue
+                yield record
+                buffer = buffer[end:]
+            else:
+                buffer = file.read(buffer_size)
+                if not buffer:
+                    if in_array:
+                        raise ValueError(f"JSON array in {file_path} is not closed.")
+                    return
+
+
+def iter_article_chunks(file_path, chunksize=1000, buffer_size=BUFFER_SIZE):
+    """
+        Reads a JSON or JSON lines article file (see iter_articles() ) as DataFrames of at most chunksize articles.
+
+        Parameters:
+            file_path (str): The path of the JSON or JSON lines file.
+            chunksize (int, optional): The maximum number of articles per chunk. Defaults to 1000.
+            buffer_size (int, optional): Number of characters read at a time. Defaults to 65536.
+
+        Yields:
+            pandas DataFrame: The next chunk of articles, one row per article. The index continues across chunks.
+    """
+    records = []
+    start = 0
+    for record in iter_articles(file_path, buffer_size):
+        records.append(record)
+        if len(records) == chunksize:
+            yield pd.DataFrame.from_records(records, index=pd.RangeIndex(start, start + len(records)))
+            start += len(records)
+            records = []
+    if records:
+        yield pd.DataFrame.from_records(records, index=pd.RangeIndex(start, start + len(records)))
+
+
+def normalise_dates(dates, newspaper=None):
+    """
+        Parses the 'date' values of a newspaper's articles into UTC timestamps in one vectorised call with the
+        newspaper's format (see DATE_FORMATS). Values which do not match it, e.g. from an older crawler version, are
+        parsed again with the format inferred per value; values which cannot be parsed at all become NaT.
+
+        Parameters:
+            dates (pandas Series or iterable): The raw 'date' values.
+            newspaper (str, optional): The key of the newspaper in DATE_FORMATS. Defaults to None (infer the format).
+
+        Returns:
+            pandas Series: The dates as datetime64[ns, UTC], with the index of dates.
+    """
+    dates = pd.Series(dates) if not isinstance(dates, pd.Series) else dates
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return pd.to_datetime(dates, utc=True)
+    date_format = DATE_FORMATS.get(newspaper)
+    if date_format is None:
+        parsed = pd.to_datetime(dates, format='mixed', utc=True, errors='coerce')
+    else:
+        parsed = pd.to_datetime(dates, format=date_format, utc=True, errors='coerce')
+        mismatched = parsed.isna() & dates.notna()
+        if mismatched.any():
+            parsed[mismatched] = pd.to_datetime(dates[mismatched], format='mixed', utc=True, errors='coerce')
+    unparsed = parsed.isna() & dates.notna()
+    if unparsed.any():
+        logger.warning(f"{int(unparsed.sum())} dates could not be parsed, e.g. {dates[unparsed].iloc[0]!r}")
+    return parsed
@@ -0,0 +1,282 @@
+import cProfile
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+logger = logging.getLogger("pipeline")
+
+
+class _NullStage:
+    """Stand-in for a StageRecord when instrumentation is disabled; it is falsy, so costly counts can be skipped."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __bool__(self):
+        return False
+
+    def items_in(self, **counts):
+        pass
+
+    def items_out(self, **counts):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class StageRecord:
+    """
+        The metrics of one run of a stage: wall and CPU time, peak memory and the items (documents, tokens, vocabulary
+        size, ...) going in and out. Used as the context manager returned by Instrumentation.stage().
+
+        Attributes:
+            name (str): The stage name, e.g. 'preprocess/document_stages'.
+            wall_seconds (float): Elapsed wall-clock time.
+            cpu_seconds (float): CPU time of this process (worker processes are not included).
+            peak_bytes (int or None): Peak memory allocated by Python during the stage on top of what was allocated
+                                      when it started (only if memory tracing is on).
+            max_rss_bytes (int or None): Peak resident set size of the process so far.
+            counts_in (dict): The items going into the stage.
+            counts_out (dict): The items coming out of the stage.
+            profile_file (str or None): The cProfile stats file of the stage, if it was profiled.
+    """
+
+    def __init__(self, instrumentation, name, counts_in):
+        self._instrumentation = instrumentation
+        self.name = name
+        self.counts_in = dict(counts_in)
+        self.counts_out = {}
+        self.wall_seconds = self.cpu_seconds = None
+        self.peak_bytes = self.max_rss_bytes = None
+        self.profile_file = None
+        self._profiler = None
+        self._start_bytes = None
+        self._child_peak = 0
+
+    def items_in(self, **counts):
+        """Records (more) items going into the stage."""
+        self.counts_in.update(counts)
+
+    def items_out(self, **counts):
+        """Records items coming out of the stage."""
+        self.counts_out.update(counts)
+
+    def __enter__(self):
+        instrumentation = self._instrumentation
+        stack = instrumentation._stack
+        if instrumentation.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                # the peak so far belongs to the enclosing stage
+                stack[-1]._child_peak = max(stack[-1]._child_peak, peak)
+            tracemalloc.reset_peak()
+            self._start_bytes = current
+        if instrumentation._wants_profile(self.name):
+            self._profiler = cProfile.Profile()
+            try:
+                self._profiler.enable()
+            except ValueError:  # another profiler, e.g. of an enclosing stage, is active
+                self._profiler = None
+        stack.append(self)
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wall_seconds = time.perf_counter() - self._wall
+        self.cpu_seconds = time.process_time() - self._cpu
+        instrumentation = self._instrumentation
+        instrumentation._stack.pop()
+        if self._profiler is not None:
+            self._profiler.disable()
+            os.makedirs(instrumentation.profile_dir, exist_ok=True)
+            self.profile_file = os.path.join(instrumentation.profile_dir,
+                                             f"{self.name.replace('/', '.')}.{len(instrumentation.records)}.prof")
+            self._profiler.dump_stats(self.profile_file)
+            self._profiler = None
+        if self._start_bytes is not None:
+            peak = max(self._child_peak, tracemalloc.get_traced_memory()[1])
+            self.peak_bytes = peak - self._start_bytes
+            stack = instrumentation._stack
+            if stack:
+                stack[-1]._child_peak = max(stack[-1]._child_peak, peak)
+            tracemalloc.reset_peak()
+        if resource is not None:
+            # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.max_rss_bytes = max_rss if sys.platform == 'darwin' else max_rss * 1024
+        instrumentation._finish(self, failed=exc_info[0] is not None)
+        return False
+
+    def __getstate__(self):
+        # finished records are sent back from worker processes, without their runtime state
+        state = self.__dict__.copy()
+        state['_instrumentation'] = state['_profiler'] = None
+        return state
+
+    def to_dict(self):
+        """Returns the record as a JSON-serialisable dict."""
+        return {
+            'name': self.name,
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'peak_bytes': self.peak_bytes,
+            'max_rss_bytes': self.max_rss_bytes,
+            'items_in': self.counts_in,
+            'items_out': self.counts_out,
+            'profile_file': self.profile_file,
+        }
+
+
+class Instrumentation:
+    """
+        Collects StageRecords of the pipeline stages. Disabled (the default), stage() returns a shared no-op context
+        manager, so instrumented code costs one attribute lookup and call per stage.
+
+        Example:
+            metrics.enable(memory=True)
+            with metrics.stage('preprocess/read_json') as stage:
+                df = pd.read_json(json_file)
+                stage.items_out(documents=len(df))
+            metrics.to_json('metrics.json')
+
+        Attributes:
+            enabled (bool): Whether stages are recorded.
+            memory (bool): Whether peak memory is measured with tracemalloc (which slows Python code down). Stages
+                           running in several threads at once share tracemalloc's peak, so their peaks overlap.
+            profile (bool or collection of str): Profile every stage (True) or the stages with these names with
+                                                 cProfile; nested stages of a profiled stage are not profiled again.
+            profile_dir (str): Directory the .prof files are written to.
+            log (bool): Whether every finished stage is logged to the 'pipeline' logger at INFO level.
+            records (list of StageRecord): The finished stages, in the order they finished.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.profile = False
+        self.profile_dir = "profiles"
+        self.log = True
+        self.records = []
+        self._local = threading.local()
+        self._started_tracemalloc = False
+
+    @property
+    def _stack(self):
+        """The stages currently open in this thread, innermost last."""
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def enable(self, memory=False, profile=False, profile_dir="profiles", log=True):
+        """
+            Starts recording stages.
+
+            Parameters:
+                memory (bool, optional): Measure peak memory per stage with tracemalloc. Defaults to False.
+                profile (bool or collection of str, optional): Stages to run under cProfile. Defaults to False.
+                profile_dir (str, optional): Directory for the .prof files. Defaults to "profiles".
+                log (bool, optional): Log every finished stage. Defaults to True.
+        """
+        self.enabled = True
+        self.memory = memory
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.log = log
+        self._started_tracemalloc = memory and not tracemalloc.is_tracing()
+
+    def disable(self):
+        """Stops recording stages; the records collected so far are kept."""
+        self.enabled = False
+        if self._started_tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._started_tracemalloc = False
+
+    def reset(self):
+        """Drops all records."""
+        self.records = []
+
+    def stage(self, name, **counts_in):
+        """
+            Returns a context manager measuring the enclosed code as stage <name>.
+
+            Parameters:
+                name (str): The stage name, e.g. 'preprocess/document_stages'.
+                **counts_in: Items going into the stage, e.g. documents=len(df).
+
+            Returns:
+                StageRecord, or a falsy no-op stand-in if instrumentation is disabled.
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return StageRecord(self, name, counts_in)
+
+    def _wants_profile(self, name):
+        if self.profile is True:
+            return True
+        return bool(self.profile) and name in self.profile
+
+    def _finish(self, record, failed=False):
+        self.records.append(record)
+        if self.log:
+            counts = ', '.join(f"{key}={value}" for key, value in {**record.counts_in, **record.counts_out}.items())
+            memory = '' if record.peak_bytes is None else f", peak {record.peak_bytes / 1e6:.1f} MB"
+            logger.info(f"{record.name}{' FAILED' if failed else ''}: {record.wall_seconds:.3f}s wall, "
+                        f"{record.cpu_seconds:.3f}s cpu{memory}{', ' if counts else ''}{counts}")
+
+    def to_dicts(self):
+        """Returns the records as a list of dicts."""
+        return [record.to_dict() for record in self.records]
+
+    def summary(self):
+        """
+            Aggregates the records by stage name, e.g. for stages run once per article.
+
+            Returns:
+                dict: Maps every stage name to its number of calls, total wall and CPU seconds and maximum peak memory.
+        """
+        summary = {}
+        for record in self.records:
+            entry = summary.setdefault(record.name, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0,
+                                                     'peak_bytes': None})
+            entry['calls'] += 1
+            entry['wall_seconds'] += record.wall_seconds
+            entry['cpu_seconds'] += record.cpu_seconds
+            if record.peak_bytes is not None:
+                entry['peak_bytes'] = max(entry['peak_bytes'] or 0, record.peak_bytes)
+        return summary
+
+    def to_json(self, path=None):
+        """
+            Serialises the records (and their summary) as JSON.
+
+            Parameters:
+                path (str, optional): File to write the JSON to. Defaults to None (only return it).
+
+            Returns:
+                str: The JSON document.
+        """
+        document = json.dumps({'stages': self.to_dicts(), 'summary': self.summary()}, indent=2)
+        if path:
+            with open(path, 'w') as f:
+                f.write(document)
+        return document
+
+
+# the instrumentation every module records its stages in
+metrics = Instrumentation()
@@ -0,0 +1,151 @@
+import json
+import os
+from collections import OrderedDict
+import nltk_resources
+
+# the values of wordnet.ADJ, wordnet.VERB, wordnet.NOUN and wordnet.ADV, so that importing this module does not load NLTK
+ADJ, VERB, NOUN, ADV = 'a', 'v', 'n', 'r'
+# first letter of a Penn Treebank tag -> WordNet part of speech; everything else is lemmatised as a noun
+PENN_TO_WORDNET = {
+    'J': ADJ,
+    'V': VERB,
+    'N': NOUN,
+    'R': ADV,
+}
+
+
+def wordnet_pos(penn_tag):
+    """
+        Maps a Penn Treebank part-of-speech tag (as returned by nltk.pos_tag) to the WordNet part of speech used by
+        WordNetLemmatizer.
+
+        Parameters:
+            penn_tag (str): The Penn Treebank tag, e.g. 'VBD'.
+
+        Returns:
+            str: One of ADJ, VERB, NOUN or ADV. Defaults to NOUN.
+    """
+    return PENN_TO_WORDNET.get(penn_tag[:1], NOUN) if penn_tag else NOUN
+
+
+class LemmaCache:
+    """
+        Bounded (token, WordNet POS) -> lemma memo cache in front of a WordNetLemmatizer.
+        Every distinct (token, POS) pair is lemmatised only once; afterwards resolving a lemma is a single dict
+        lookup. When the cache is full the least recently used entry is evicted (LRU): a hit moves its entry to the end
+        of an OrderedDict and a miss evicts from the front, so frequent words stay cached however early they were first
+        seen. The cache can be saved to and loaded from a JSON file so it survives between runs.
+
+        Attributes:
+            maxsize (int): The maximum number of entries kept.
+            hits (int): Number of lookups answered from the cache.
+            misses (int): Number of lookups which had to call the lemmatiser.
+    """
+
+    def __init__(self, maxsize=500_000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # least recently used first
+        self._lemmas = OrderedDict()
+
+    def __len__(self):
+        return len(self._lemmas)
+
+    def lemmatize(self, token, pos=NOUN):
+        """
+            Returns the lemma of a token for a WordNet part of speech, lemmatising it only on a cache miss.
+
+            Parameters:
+                token (str): The token to lemmatise.
+                pos (str, optional): The WordNet part of speech. Defaults to NOUN, which gives the same
+                                     lemmas as WordNetLemmatizer().lemmatize(token).
+
+            Returns:
+                str: The lemma.
+        """
+        key = (token, pos)
+        lemma = self._lemmas.get(key)
+        if lemma is not None:
+            self.hits += 1
+            self._lemmas.move_to_end(key)
+            return lemma
+
+        self.misses += 1
+        # the process' lemmatiser, shared by all caches and loaded on the first miss
+        lemma = nltk_resources.lemmatizer().lemmatize(token, pos)
+        self._store(key, lemma)
+        return lemma
+
+    def _store(self, key, lemma):
+        """Adds or refreshes an entry as the most recently used one, evicting the least recently used if full."""
+        if key in self._lemmas:
+            self._lemmas.move_to_end(key)
+        elif len(self._lemmas) >= self.maxsize:
+            self._lemmas.popitem(last=False)
+        self._lemmas[key] = lemma
+
+    def lemmatize_tagged(self, tagged_tokens, pos_aware=True):
+        """
+            Lemmatises a list of (token, Penn tag) pairs as returned by nltk.pos_tag.
+
+            Parameters:
+                tagged_tokens (list of tuple): The tagged tokens of one document.
+                pos_aware (bool, optional): If False the tags are ignored and every token is lemmatised as a noun,
+                                            like WordNetLemmatizer().lemmatize(token). Defaults to True.
+
+            Returns:
+                list of str: The lemmas in the order of the tokens.
+        """
+        if pos_aware:
+            return [self.lemmatize(token, wordnet_pos(tag)) for token, tag in tagged_tokens]
+        return [self.lemmatize(token) for token, _ in tagged_tokens]
+
+    def update(self, other):
+        """
+            Merges the entries and hit/miss counters of another LemmaCache (e.g. one returned by a worker process).
+            The other cache's entries were used more recently than this cache's own, so they are added as the most
+            recently used ones, in their own order, evicting this cache's least recently used entries if it is full.
+
+            Parameters:
+                other (LemmaCache): The cache to merge into this one.
+        """
+        for key, lemma in other._lemmas.items():
+            self._store(key, lemma)
+        self.hits += other.hits
+        self.misses += other.misses
+
+    def reset_counters(self):
+        """Sets the hit and miss counters back to zero."""
+        self.hits = 0
+        self.misses = 0
+
+    def save(self, file_path):
+        """
+            Writes the cache entries to a JSON file, least recently used first.
+
+            Parameters:
+                file_path (str): The path of the JSON file to write.
+        """
+        with open(file_path, 'w', encoding='utf8') as file:
+            json.dump([[token, pos, lemma] for (token, pos), lemma in self._lemmas.items()], file)
+
+    @classmethod
+    def load(cls, file_path, maxsize=500_000):
+        """
+            Creates a cache from a JSON file written by save(), keeping the maxsize most recently used entries. Returns
+            an empty cache if the file does not exist.
+
+            Parameters:
+                file_path (str): The path of the JSON file to read.
+                maxsize (int, optional): The maximum number of entries kept. Defaults to 500000.
+
+            Returns:
+                LemmaCache: The loaded cache.
+        """
+        cache = cls(maxsize=maxsize)
+        if os.path.isfile(file_path):
+            with open(file_path, encoding='utf8') as file:
+                for token, pos, lemma in json.load(file)[-maxsize:]:
+                    cache._lemmas[(token, pos)] = lemma
+        return cache
@@ -1,14 +1,149 @@
 import io
+import logging
+import os
+from collections import Counter
 import pandas as pd
 import numpy as np
-from IPython.core.display_functions import display
-from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
-from sklearn.preprocessing import MinMaxScaler
-import matplotlib.pyplot as plt
-from matplotlib.dates import MonthLocator, DateFormatter
+from scipy.sparse import csr_matrix
+# scikit-learn, matplotlib and IPython are imported by the functions using them, so that importing this module is cheap
+from corpus_store import PARTITION_DIR, UNDATED, corpus_file, iter_partitions, read_corpus
+from instrumentation import metrics
 
+logger = logging.getLogger(__name__)
 
-def df_to_dtm(df):
+
+class SparseTermMatrix:
+    """
+        A document-term matrix (counts or TF-IDF scores) which stays sparse: it holds the scipy CSR matrix, the terms of
+        its columns and a DataFrame of document metadata such as 'content'. Memory scales with the number of non-zero
+        entries instead of documents x vocabulary.
+        Supports what the dense DataFrames were used for: column lookup by term (matrix[term], matrix.columns.get_loc),
+        ranking terms by column sum and per-document rows. to_pandas() converts it into a sparse pandas DataFrame.
+
+        Attributes:
+            matrix (scipy.sparse.csr_matrix): The documents x terms matrix.
+            columns (pandas Index): The terms, in column order.
+            documents (pandas DataFrame): One row of metadata per document, in row order.
+    """
+
+    def __init__(self, matrix, terms, documents=None):
+        self.matrix = matrix.tocsr()
+        self.columns = pd.Index(terms)
+        self.documents = documents if documents is not None else pd.DataFrame(index=range(matrix.shape[0]))
+        self._column_sums = None
+
+    def __repr__(self):
+        return (f"SparseTermMatrix({self.shape[0]} documents x {self.shape[1]} terms, {self.nnz} non-zero entries, "
+                f"metadata: {list(self.documents.columns)})")
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __contains__(self, term):
+        return term in self.columns
+
+    def __getitem__(self, key):
+        """Returns the column of a term as a dense pandas Series, or a metadata column such as 'content'."""
+        if key in self.columns:
+            return self.column(key)
+        return self.documents[key]
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def nnz(self):
+        return self.matrix.nnz
+
+    def column(self, term):
+        """
+            Returns the scores of a term for every document.
+
+            Parameters:
+                term (str): The term to look up.
+
+            Raises:
+                KeyError: If the term is not in the matrix.
+
+            Returns:
+                pandas Series: The (dense) column of the term, indexed like the documents.
+        """
+        col_index = self.columns.get_loc(term)
+        return pd.Series(self.matrix[:, col_index].toarray().ravel(), index=self.documents.index, name=term)
+
+    def column_sums(self):
+        """
+            Returns the sum of every column, i.e. the total score of every term over all documents.
+
+            Returns:
+                pandas Series: The column sums indexed by term, in column order.
+        """
+        if self._column_sums is None:
+            self._column_sums = pd.Series(np.asarray(self.matrix.sum(axis=0)).ravel(), index=self.columns)
+        return self._column_sums
+
+    def sort_by_column_sum(self):
+        """
+            Returns a copy with the columns ordered by descending column sum, so the position of a term is its rank.
+
+            Returns:
+                SparseTermMatrix: The reordered matrix.
+        """
+        order = self.columns.get_indexer(self.column_sums().sort_values(ascending=False).index)
+        return SparseTermMatrix(self.matrix[:, order], self.columns[order], self.documents)
+
+    def row(self, document):
+        """
+            Returns the non-zero entries of one document.
+
+            Parameters:
+                document (int): The row number of the document.
+
+            Returns:
+                pandas Series: The scores of the terms in the document, indexed by term.
+        """
+        row = self.matrix.getrow(document)
+        return pd.Series(row.data, index=self.columns[row.indices], name=document)
+
+    def to_pandas(self):
+        """
+            Converts the matrix into a pandas DataFrame with sparse columns, with the metadata columns appended.
+
+            Returns:
+                pandas DataFrame: One sparse column per term, followed by the metadata columns.
+        """
+        df = pd.DataFrame.sparse.from_spmatrix(self.matrix, index=self.documents.index, columns=self.columns)
+        return pd.concat([df, self.documents], axis=1)
+
+
+def _documents(df, columns=('content',)):
+    """Returns the metadata columns of a preprocessed DataFrame which are kept next to a term matrix."""
+    return df[[column for column in columns if column in df.columns]].reset_index(drop=True)
+
+
+def _fit_tfidf(texts):
+    """
+        Fits a CountVectorizer and a TfidfTransformer on the given texts.
+
+        Parameters:
+            texts (iterable of str): The lemmatised texts of the documents.
+
+        Returns:
+            tuple: The sparse TF-IDF matrix and the terms of its columns.
+    """
+    from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
+
+    with metrics.stage('methods/fit_tfidf') as stage:
+        vectoriser = CountVectorizer()
+        dtm = vectoriser.fit_transform(texts)
+        tfidf_transformer = TfidfTransformer()
+        tfidf = tfidf_transformer.fit_transform(dtm)
+        stage.items_out(documents=tfidf.shape[0], terms=tfidf.shape[1], nonzero=tfidf.nnz)
+    return tfidf, vectoriser.get_feature_names_out()
+
+
+def df_to_dtm(df, min_docfreq=1, max_docfreq=1.0, metadata=('content',)):
     """
        Convert a pandas DataFrame of preprocessed text data (obtained using preprocessing() ) into a Document-Term Matrix
        (DTM) using a CountVectorizer.
@@ -16,21 +151,27 @@ def df_to_dtm(df):
        Parameters:
            df (pandas DataFrame): A DataFrame containing preprocessed text data, including a column named 'lemmatised_text'
                                   containing the preprocessed text data as strings.
+           min_docfreq (int or float, optional): Terms occurring in fewer documents (or, as a float, a smaller proportion
+                                                 of documents) are dropped, like dfm_trim(). Defaults to 1.
+           max_docfreq (int or float, optional): Terms occurring in more documents are dropped. Defaults to 1.0.
+           metadata (iterable of str, optional): The columns kept as document metadata, where present.
+                                                 Defaults to ('content',).
 
        Returns:
-           pandas DataFrame: A DataFrame representation of the DTM with document IDs as the index and individual terms as
-                             columns. The cells of the DataFrame contain the term frequencies (counts) for each document.
+           SparseTermMatrix: A sparse representation of the DTM with one row per document and individual terms as
+                             columns, holding the term frequencies (counts) for each document. The original 'content'
+                             column is kept as document metadata.
     """
 
+    from sklearn.feature_extraction.text import CountVectorizer
+
     # Create a CountVectorizer object
-    vectoriser = CountVectorizer()
-    dtm = vectoriser.fit_transform(df['lemmatised_text'])
-    # Create a dataframe from the DTM
-    df_dtm = pd.DataFrame(dtm.toarray(), columns=vectoriser.get_feature_names_out())
-    # Add the original text column back to the dataframe
-    df_dtm['content'] = df['content']
+    vectoriser = CountVectorizer(min_df=min_docfreq, max_df=max_docfreq)
+    with metrics.stage('methods/df_to_dtm', documents=len(df)) as stage:
+        dtm = vectoriser.fit_transform(df['lemmatised_text'])
+        stage.items_out(terms=dtm.shape[1], nonzero=dtm.nnz)
 
-    return df_dtm
+    return SparseTermMatrix(dtm, vectoriser.get_feature_names_out(), _documents(df, metadata))
 
 
 def df_to_tfidf(df):
@@ -43,23 +184,18 @@ def df_to_tfidf(df):
                                    containing the preprocessed text data as strings.
 
         Returns:
-            pandas DataFrame: A DataFrame representation of the TF-IDF matrix with document IDs as the index and individual
-                              terms as columns. The cells of the DataFrame contain the TF-IDF scores for each document.
+            SparseTermMatrix: A sparse representation of the TF-IDF matrix with one row per document and individual terms
+                              as columns, ordered by descending total TF-IDF score. The original 'content' column is
+                              kept as document metadata.
     """
 
-    vectoriser = CountVectorizer()
-    dtm = vectoriser.fit_transform(df['lemmatised_text'])
-    tfidf_transformer = TfidfTransformer()
-    tfidf = tfidf_transformer.fit_transform(dtm)
-    # Create a dataframe from the TF-IDF matrix
-    df_tfidf = pd.DataFrame(tfidf.toarray(), columns=vectoriser.get_feature_names_out())
-    df_tfidf = df_tfidf[df_tfidf.sum().sort_values(ascending=False).index]
-    # Add the original text column back to the dataframe
-    df_tfidf['content'] = df['content']
-    pd.set_option('display.max_columns', 100)
-    # Print the resulting dataframe
-    display(df_tfidf)
-    return df_tfidf
+    from IPython.core.display_functions import display
+
+    tfidf, terms = _fit_tfidf(df['lemmatised_text'])
+    tfidf_matrix = SparseTermMatrix(tfidf, terms, _documents(df)).sort_by_column_sum()
+    # Print the resulting matrix
+    display(tfidf_matrix)
+    return tfidf_matrix
 
 
 def csv_to_tfidf(file_path):
@@ -68,32 +204,29 @@ def csv_to_tfidf(file_path):
         Document Frequency (TF-IDF) matrix using a CountVectorizer and a TfidfTransformer.
 
         Parameters:
-            file_path (str): The path to the CSV file containing preprocessed text data, including a column named
-                             'lemmatised_text' containing the preprocessed text data as strings.
+            file_path (str): The path to the CSV (or Parquet, see corpus_store.save_corpus() ) file containing preprocessed
+                             text data, including a column named 'lemmatised_text' containing the preprocessed text data
+                             as strings.
 
         Returns:
-            pandas DataFrame: A DataFrame representation of the TF-IDF matrix with document IDs as the index and individual
-                              terms as columns. The cells of the DataFrame contain the TF-IDF scores for each document.
+            SparseTermMatrix: A sparse representation of the TF-IDF matrix with one row per document and individual terms
+                              as columns, ordered by descending total TF-IDF score. The original 'content' column is
+                              kept as document metadata.
     """
-    df = pd.read_csv(file_path)
-    vectoriser = CountVectorizer()
-    dtm = vectoriser.fit_transform(df['lemmatised_text'])
-    tfidf_transformer = TfidfTransformer()
-    tfidf = tfidf_transformer.fit_transform(dtm)
-    # Create a dataframe from the TF-IDF matrix
-    df_tfidf = pd.DataFrame(tfidf.toarray(), columns=vectoriser.get_feature_names_out())
-    df_tfidf = df_tfidf[df_tfidf.sum().sort_values(ascending=False).index]
-    # Add the original text column back to the dataframe
-    df_tfidf['content'] = df['content']
-    # Limit the size of the dataframe to 100 rows and 100 columns
-    # df_tfidf = df_tfidf.iloc[:100, :500]
+    df = read_corpus(file_path, columns=['lemmatised_text', 'content'])
+    tfidf, terms = _fit_tfidf(df['lemmatised_text'])
 
-    return df_tfidf
+    return SparseTermMatrix(tfidf, terms, _documents(df)).sort_by_column_sum()
 
 
-def read_csv_files():
+def read_csv_files(columns=None):
     """
         Reads the CSV files for The Guardian, Daily Mail, The Times, and The Sun and returns them as dataframes.
+        If a Parquet version of a file exists (e.g. 'guardian.parquet', see corpus_store.save_corpus() ), it is read
+        instead.
+
+        Parameters:
+            columns (list of str, optional): The columns to read. Defaults to None (all columns).
 
         Returns:
             tuple: A tuple containing two elements:
@@ -102,48 +235,236 @@ def read_csv_files():
     """
 
     filenames = ['guardian.csv', 'mail.csv', 'times.csv', 'sun.csv']
-    dataframes = [pd.read_csv(filename) for filename in filenames]
+    dataframes = [read_corpus(corpus_file(filename), columns) for filename in filenames]
     colors = ['blue', 'red', 'green', 'orange']  # Add colors for each dataframe
     return dataframes, colors
 
 
-def plot_tfidf(term: str, save: bool = False) -> bool:
+# colours and labels of the newspapers in the plots, in plotting order
+NEWSPAPER_COLORS = {"Guardian": "blue", "Mail": "red", "Times": "green", "Sun": "orange"}
+NEWSPAPER_LABELS = {"Guardian": "The Guardian", "Mail": "Daily Mail", "Times": "The Times", "Sun": "The Sun"}
+
+
+def monthly_tfidf_table(df):
     """
-    Plots the development of the normalised TF-IDF score for a given term across four UK newspapers: The Times, Daily Mail,
-    The Sun, and The Guardian, for the period between September 2022 and February 2023.
+        Aggregates the TF-IDF scores and counts of every term of a newspaper per month in one vectorised pass.
+        Like plot_tfidf() did per term, the TF-IDF matrix is fitted on all documents and every term's scores are min-max
+        scaled over the documents. Scaling is linear, so the monthly mean of the scaled scores is the scaled monthly
+        mean, and the monthly sums of all terms are a single sparse product of a months x documents indicator matrix
+        with the documents x terms matrix.
+
+        Parameters:
+            df (pandas DataFrame): Preprocessed data with 'date' and 'lemmatised_text' columns.
+
+        Returns:
+            dict: 'terms' (array of str), 'months' (array of 'YYYY-MM' str), 'documents' (number of documents per
+                  month), 'tfidf' (months x terms mean normalised TF-IDF score) and 'counts' (months x terms
+                  occurrences).
+    """
+    from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
+
+    vectoriser = CountVectorizer()
+    counts = vectoriser.fit_transform(df['lemmatised_text'])
+    tfidf = TfidfTransformer().fit_transform(counts)
+    return {'terms': np.asarray(vectoriser.get_feature_names_out(), dtype=str),
+            **_monthly_aggregates(counts, tfidf, df['date'])}
+
+
+def _monthly_aggregates(counts, tfidf, dates):
+    """
+        The month tables of monthly_tfidf_table() for an already fitted documents x terms count and TF-IDF matrix.
+
+        Returns:
+            dict: 'months', 'documents', 'tfidf' and 'counts' as in monthly_tfidf_table().
+    """
+    col_min = tfidf.min(axis=0).toarray().ravel()
+    col_range = tfidf.max(axis=0).toarray().ravel() - col_min
+    # like MinMaxScaler, constant columns are only shifted
+    col_range[col_range == 0] = 1
+
+    months = pd.to_datetime(pd.Series(dates).reset_index(drop=True), utc=True).dt.strftime('%Y-%m')
+    dated = np.flatnonzero(months.notna().to_numpy())
+    month_labels, month_codes = np.unique(months.iloc[dated].to_numpy(dtype=str), return_inverse=True)
+    indicator = csr_matrix((np.ones(len(dated)), (month_codes, dated)), shape=(len(month_labels), counts.shape[0]))
+    documents = np.bincount(month_codes, minlength=len(month_labels))
+
+    mean_tfidf = (indicator @ tfidf).toarray() / np.maximum(documents, 1)[:, None]
+    return {
+        'months': month_labels,
+        'documents': documents,
+        'tfidf': ((mean_tfidf - col_min) / col_range).astype(np.float32),
+        'counts': (indicator @ counts).toarray().astype(np.int32),
+    }
+
+
+class TfidfCube:
+    """
+        Newspaper x month x term cube of the mean normalised TF-IDF scores and counts (see monthly_tfidf_table() ),
+        which plot_tfidf() and the monthly frequency analysis of rstudio/timeseries.R look terms up in. The table of
+        every newspaper is built once and cached as a .npz file, which is rebuilt when the preprocessed file changes.
+
+        Attributes:
+            files (dict): Maps each newspaper name to its preprocessed CSV file.
+            cache_dir (str or None): Directory the tables are cached in, or None to not cache them.
+    """
+
+    def __init__(self, files=None, cache_dir=".tfidf_cube"):
+        self.files = dict(NEWSPAPER_CSV_FILES if files is None else files)
+        self.cache_dir = cache_dir
+        self._tables = {}
+
+    def _cache_file(self, newspaper):
+        return os.path.join(self.cache_dir, f"{newspaper.lower()}.npz")
+
+    def table(self, newspaper):
+        """
+            Returns the monthly table of a newspaper, building it if it is not loaded or cached.
+
+            Parameters:
+                newspaper (str): One of the keys of files, e.g. "Guardian".
+
+            Returns:
+                dict: See monthly_tfidf_table(), plus 'index', a pandas Index of the terms.
+        """
+        if newspaper in self._tables:
+            return self._tables[newspaper]
+
+        file_path = corpus_file(self.files[newspaper])
+        cache_file = self._cache_file(newspaper) if self.cache_dir else None
+        if cache_file and os.path.isfile(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(file_path):
+            with np.load(cache_file) as arrays:
+                table = dict(arrays)
+        else:
+            with metrics.stage('methods/tfidf_cube/build', newspaper=newspaper) as stage:
+                table = monthly_tfidf_table(read_corpus(file_path, columns=['date', 'lemmatised_text']))
+                stage.items_out(months=len(table['months']), terms=len(table['terms']))
+            if cache_file:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                np.savez_compressed(cache_file, **table)
+
+        table['index'] = pd.Index(table['terms'])
+        self._tables[newspaper] = table
+        return table
+
+    def lookup(self, terms, newspaper, measure='tfidf', start=None, end=None):
+        """
+            Looks up the monthly values of several terms in a newspaper.
+
+            Parameters:
+                terms (iterable of str): The terms to look up.
+                newspaper (str): One of the keys of files.
+                measure (str, optional): 'tfidf' for the mean normalised TF-IDF score or 'counts' for the number of
+                                         occurrences. Defaults to 'tfidf'.
+                start (str or date, optional): The first month, e.g. '2022-11'. Defaults to None (the first month).
+                end (str or date, optional): The last month, inclusive. Defaults to None (the last month).
+
+            Returns:
+                pandas DataFrame: Months (a PeriodIndex) x terms. Terms which do not occur in the newspaper are NaN.
+        """
+        terms = list(terms)
+        table = self.table(newspaper)
+        # the months are sorted 'YYYY-MM' strings, so the range is a slice
+        months = table['months']
+        low = 0 if start is None else np.searchsorted(months, str(pd.Period(start, freq='M')))
+        high = len(months) if end is None else np.searchsorted(months, str(pd.Period(end, freq='M')), side='right')
+        positions = table['index'].get_indexer(terms)
+        values = table[measure][low:high, np.maximum(positions, 0)].astype(np.float64)
+        values[:, positions < 0] = np.nan
+        months = pd.PeriodIndex(months[low:high], freq='M', name='month')
+        return pd.DataFrame(values, index=months, columns=pd.Index(terms, name='term'))
+
+    def frequencies(self, terms, newspaper, start=None, end=None):
+        """
+            Returns the number of occurrences of several terms per month, like counts_per_month in
+            rstudio/timeseries.R. Terms which do not occur in the newspaper are 0.
+
+            Parameters:
+                terms (iterable of str): The terms to count.
+                newspaper (str): One of the keys of files.
+                start (str or date, optional): The first month. Defaults to None (the first month).
+                end (str or date, optional): The last month, inclusive. Defaults to None (the last month).
+
+            Returns:
+                pandas DataFrame: Months x terms.
+        """
+        return self.lookup(terms, newspaper, measure='counts', start=start, end=end).fillna(0).astype(int)
+
+
+def monthly_term_counts(terms, newspapers=None, start=None, end=None, root=PARTITION_DIR):
+    """
+        Counts the occurrences of several terms per newspaper and month in the corpus partitioned by month (see
+        corpus_store.save_partitioned() ), like counts_per_month in rstudio/timeseries.R. Only the 'lemmas' of the
+        partitions in the range are read, so "Guardian, Nov - Dec 2022" opens two files, and nothing has to be fitted;
+        the month comes from the partition, so no date is parsed either.
+
+        Parameters:
+            terms (iterable of str): The terms to count.
+            newspapers (iterable of str, optional): The newspapers, e.g. ['guardian']. Defaults to None (all of them).
+            start (str or date, optional): The first month, e.g. '2022-11'. Defaults to None (the first month).
+            end (str or date, optional): The last month, inclusive, e.g. '2022-12'. Defaults to None (the last month).
+            root (str, optional): The root directory of the partitions. Defaults to 'corpus'.
+
+        Returns:
+            pandas DataFrame: (newspaper, month) x terms counts; the months are Periods, articles without a date are
+                              left out.
+    """
+    terms = list(terms)
+    wanted = set(terms)
+    index, rows = [], []
+    for newspaper, month, df in iter_partitions(root, newspapers, start, end, columns=['lemmas']):
+        if month == UNDATED:
+            continue
+        counts = Counter(token for doc in df['lemmas'] for token in doc if token in wanted)
+        index.append((newspaper, pd.Period(month, freq='M')))
+        rows.append([counts[term] for term in terms])
+    return pd.DataFrame(np.array(rows, dtype=np.int64).reshape(len(rows), len(terms)),
+                        index=pd.MultiIndex.from_tuples(index, names=['newspaper', 'month']),
+                        columns=pd.Index(terms, name='term'))
+
+
+# shared by plot_tfidf() calls, so the cube is only loaded once
+_default_tfidf_cube = None
+
+
+def _tfidf_cube():
+    global _default_tfidf_cube
+    if _default_tfidf_cube is None:
+        _default_tfidf_cube = TfidfCube()
+    return _default_tfidf_cube
+
+
+def plot_tfidf_terms(terms, save: bool = False, cube=None, start=None, end=None) -> bool:
+    """
+    Plots the development of the normalised TF-IDF score for several terms across four UK newspapers: The Times,
+    Daily Mail, The Sun, and The Guardian, for the period between September 2022 and February 2023. One line is drawn
+    per newspaper and term; the scores are looked up in the TF-IDF cube (see TfidfCube).
 
     Args:
-        term (str): The term for which to plot the TF-IDF score.
+        terms (iterable of str): The terms for which to plot the TF-IDF score.
         save (bool, optional): Whether to save the plot as a JPEG image file. Defaults to False.
+        cube (TfidfCube, optional): The cube to look the terms up in. Defaults to a shared TfidfCube().
+        start (str or date, optional): The first month to plot, e.g. '2022-11'. Defaults to None (the first month).
+        end (str or date, optional): The last month to plot, inclusive. Defaults to None (the last month).
 
     Returns:
-        bool: True if the plot was created successfully, otherwise False.
-    """
-    vectorizer = TfidfVectorizer()
-    dataframes, colors = read_csv_files()
-    # Create an empty dataframe to store the combined data from all dataframes
-    df = pd.DataFrame()
-
-    for i, dataframe in enumerate(dataframes):
-        # Calculate the TF-IDF for all text in each dataframe
-        tfidf = vectorizer.fit_transform(dataframe['lemmatised_text'])
-        # Get the index of the term you want to plot
-        term_index = vectorizer.vocabulary_[term]
-        # Extract the TF-IDF scores for the selected term
-        tfidf_term = tfidf[:, term_index].toarray().ravel()
-        # Normalize the TF-IDF scores to be between 0 and 1
-        scaler = MinMaxScaler()
-        tfidf_term = scaler.fit_transform(tfidf_term.reshape(-1, 1)).ravel()
-        # Convert the date column to datetime objects
-        dataframe['date'] = pd.to_datetime(dataframe['date'], utc=True)
-        # Group by month and calculate the mean TF-IDF score for each month
-        tfidf_monthly = dataframe.groupby(dataframe['date'].dt.to_period('M'))['lemmatised_text'].agg(
-            ['count', lambda x: np.nanmean(tfidf_term[x.index])])
-        tfidf_monthly.columns = ['count', 'tfidf']
-        # Add a new column to the dataframe with the color for this dataframe
-        tfidf_monthly['color'] = colors[i]
-        # Append the data to the combined dataframe
-        df = df.append(tfidf_monthly)
+        bool: True if the plot was created successfully, False if none of the terms occurs in any newspaper.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.dates import MonthLocator, DateFormatter
+
+    terms = list(terms)
+    cube = _tfidf_cube() if cube is None else cube
+    lines = []
+    for newspaper, color in NEWSPAPER_COLORS.items():
+        if newspaper not in cube.files:
+            continue
+        scores = cube.lookup(terms, newspaper, start=start, end=end).dropna(axis=1, how='all')
+        for term in scores.columns:
+            label = NEWSPAPER_LABELS[newspaper] if len(terms) == 1 else f"{NEWSPAPER_LABELS[newspaper]}: {term}"
+            lines.append((scores[term], label, color))
+    if not lines:
+        logger.warning(f"none of the terms {terms} occurs in any newspaper.")
+        return False
 
     # Create the plot
     fig, ax = plt.subplots(figsize=(12, 8))
@@ -153,25 +474,23 @@ def plot_tfidf(term: str, save: bool = False) -> bool:
     ax.xaxis.set_major_locator(months)
     ax.xaxis.set_major_formatter(months_fmt)
 
-    # Loop through the data for each dataframe and plot the data with the corresponding color
-    for color, group in df.groupby('color'):
-        group.index = group.index.to_timestamp()
-        if color == 'green':
-            ax.plot(group.index, group['tfidf'], label='The Times', color=color)
-        elif color == 'red':
-            ax.plot(group.index, group['tfidf'], label='Daily Mail', color=color)
-        elif color == 'orange':
-            ax.plot(group.index, group['tfidf'], label='The Sun', color=color)
-        else:
-            ax.plot(group.index, group['tfidf'], label='The Guardian', color=color)
+    # the line styles tell the terms apart, the colours the newspapers
+    styles = ['-', '--', ':', '-.']
+    for series, label, color in lines:
+        linestyle = styles[terms.index(series.name) % len(styles)]
+        ax.plot(series.index.to_timestamp(), series.values, label=label, color=color, linestyle=linestyle)
 
     # Add labels and title
     ax.set_xlabel('Month')
     ax.set_ylabel('Normalised TF-IDF score')
-    ax.set_title(f'TF-IDF score development Sep 22 - Feb 23 for term "{term}"')
+    title_terms = ', '.join(f'"{term}"' for term in terms)
+    first = min(series.index.min() for series, _, _ in lines)
+    last = max(series.index.max() for series, _, _ in lines)
+    ax.set_title(f'TF-IDF score development {first.strftime("%b %y")} - {last.strftime("%b %y")} for '
+                 f'{"term" if len(terms) == 1 else "terms"} {title_terms}')
     ax.legend()
     if save == True:
-        plt.savefig(f"{term}.jpg")
+        plt.savefig(f"{'_'.join(terms)}.jpg")
     else:
         pass
     plt.show()
@@ -180,14 +499,33 @@ def plot_tfidf(term: str, save: bool = False) -> bool:
     return True
 
 
+def plot_tfidf(term: str, save: bool = False, start=None, end=None) -> bool:
+    """
+    Plots the development of the normalised TF-IDF score for a given term across four UK newspapers: The Times, Daily Mail,
+    The Sun, and The Guardian, for the period between September 2022 and February 2023.
+    The scores are looked up in the TF-IDF cube (see TfidfCube), so only the first call has to fit the newspapers.
+
+    Args:
+        term (str): The term for which to plot the TF-IDF score.
+        save (bool, optional): Whether to save the plot as a JPEG image file. Defaults to False.
+        start (str or date, optional): The first month to plot, e.g. '2022-11'. Defaults to None (the first month).
+        end (str or date, optional): The last month to plot, inclusive. Defaults to None (the last month).
+
+    Returns:
+        bool: True if the plot was created successfully, otherwise False (e.g. if the term occurs in no newspaper).
+    """
+    return plot_tfidf_terms([term], save=save, start=start, end=end)
+
+
 def get_vocab_from_csv(csv_file, lemma_col='lemmas'):
     """
-    Read a CSV file containing lemmas and return a set of unique lemmas.
+    Read a CSV (or Parquet, see corpus_store.save_corpus() ) file containing lemmas and return a set of unique lemmas.
+    Only the lemma column is read.
 
     Parameters
     ----------
     csv_file : str
-        The path to the CSV file to read.
+        The path to the CSV or Parquet file to read.
     lemma_col : str, optional
         The name of the column in the CSV file containing the lemmas. Default is 'lemmas'.
 
@@ -210,16 +548,9 @@ def get_vocab_from_csv(csv_file, lemma_col='lemmas'):
     >>> print(vocab)
     {'word1', 'word2', 'word3', ...}
     """
-    try:
-        df = pd.read_csv(csv_file)
-    except FileNotFoundError:
-        raise FileNotFoundError(f"File not found: {csv_file}")
-
-    if lemma_col not in df.columns:
-        raise ValueError(f"Column '{lemma_col}' not found in CSV file.")
+    df = read_corpus(csv_file, columns=[lemma_col])
 
-    lemmas = df[lemma_col].apply(eval).explode().unique()
-    return set(lemmas)
+    return {lemma for doc in df[lemma_col] for lemma in doc}
 
 
 def get_avg_token_length(vocab):
@@ -261,12 +592,11 @@ def get_avg_token_length(vocab):
 
 def get_term_position(df_tfidf, term):
     """
-        Get the column index of a given term in a TF-IDF matrix represented by a pandas DataFrame.
+        Get the column index of a given term in a TF-IDF matrix.
 
         Parameters:
-            df_tfidf (pandas DataFrame): A DataFrame representation of the TF-IDF matrix with document IDs as the index and
-                                         individual terms as columns. The cells of the DataFrame contain the TF-IDF scores
-                                         for each document.
+            df_tfidf (SparseTermMatrix or pandas DataFrame): The TF-IDF matrix with individual terms as columns, e.g. as
+                                                             returned by df_to_tfidf() or csv_to_tfidf().
             term (str): The term whose column index is to be obtained.
 
         Returns:
@@ -278,10 +608,117 @@ def get_term_position(df_tfidf, term):
     return col_index
 
 
+# newspaper name as written to the compare files -> preprocessed CSV file
+NEWSPAPER_CSV_FILES = {"Guardian": "guardian.csv", "Times": "times.csv", "Sun": "sun.csv", "Mail": "mail.csv"}
+# written instead of a position when a term does not occur in a newspaper
+ABSENT = "absent"
+
+
+class TermRankEngine:
+    """
+        Answers rank queries for many terms across the four newspapers. Every newspaper's TF-IDF matrix is fitted only
+        once and turned into a term -> position table, where the position is the column index of the term in the
+        csv_to_tfidf() matrix (terms ordered by descending total TF-IDF score). The tables can be cached as CSV files,
+        so later runs skip the fitting as long as the preprocessed CSV files have not changed.
+
+        Attributes:
+            files (dict): Maps each newspaper name to its preprocessed CSV file.
+            cache_dir (str or None): Directory the rank tables are cached in, or None to not cache them.
+    """
+
+    def __init__(self, files=None, cache_dir=".term_ranks"):
+        self.files = dict(NEWSPAPER_CSV_FILES if files is None else files)
+        self.cache_dir = cache_dir
+        self._ranks = {}
+
+    def _cache_file(self, newspaper):
+        return os.path.join(self.cache_dir, f"{newspaper.lower()}_ranks.csv")
+
+    def rank_table(self, newspaper):
+        """
+            Returns the term -> position table of a newspaper, fitting its TF-IDF matrix if it is not loaded or cached.
+
+            Parameters:
+                newspaper (str): One of the keys of files, e.g. "Guardian".
+
+            Returns:
+                pandas Series: The position of every term, indexed by term.
+        """
+        if newspaper in self._ranks:
+            return self._ranks[newspaper]
+
+        file_path = corpus_file(self.files[newspaper])
+        cache_file = self._cache_file(newspaper) if self.cache_dir else None
+        if cache_file and os.path.isfile(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(file_path):
+            ranks = pd.read_csv(cache_file, index_col='term', keep_default_na=False)['position']
+        else:
+            with metrics.stage('methods/term_ranks/build', newspaper=newspaper):
+                terms = csv_to_tfidf(file_path).columns
+            ranks = pd.Series(np.arange(len(terms)), index=pd.Index(terms, name='term'), name='position')
+            if cache_file:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                ranks.to_csv(cache_file)
+
+        self._ranks[newspaper] = ranks
+        return ranks
+
+    def ranks(self, terms):
+        """
+            Looks up the positions of several terms in every newspaper.
+
+            Parameters:
+                terms (iterable of str): The terms to look up.
+
+            Returns:
+                pandas DataFrame: One row per term and one column per newspaper. Terms which do not occur in a newspaper
+                                  are marked with ABSENT.
+        """
+        terms = list(terms)
+        table = pd.DataFrame(index=pd.Index(terms, name='term'))
+        for newspaper in self.files:
+            ranks = self.rank_table(newspaper)
+            table[newspaper] = pd.Series([int(ranks[term]) if term in ranks.index else ABSENT for term in terms],
+                                         index=table.index, dtype=object)
+        return table
+
+    def write_compare_files(self, terms, directory="data", combined_file="combined.csv"):
+        """
+            Writes a '<term>compare.csv' file (columns Newspaper, Position) for every term and one combined file
+            (columns Newspaper, Position, filename) for all of them.
+
+            Parameters:
+                terms (iterable of str): The terms to compare.
+                directory (str, optional): Directory the per-term files are written to. Defaults to "data".
+                combined_file (str, optional): Path of the combined file, or None to not write it.
+                                               Defaults to "combined.csv".
+
+            Returns:
+                pandas DataFrame: The combined table.
+        """
+        table = self.ranks(terms)
+        os.makedirs(directory, exist_ok=True)
+        combined = []
+        for term, positions in table.iterrows():
+            compare = pd.DataFrame({'Newspaper': positions.index, 'Position': positions.values})
+            compare.to_csv(os.path.join(directory, f"{term}compare.csv"), index=False)
+            combined.append(compare.assign(filename=term))
+
+        combined = pd.concat(combined, ignore_index=True) if combined else \
+            pd.DataFrame(columns=['Newspaper', 'Position', 'filename'])
+        if combined_file:
+            combined.to_csv(combined_file, index=False)
+        return combined
+
+
+# shared by compare_term_position() calls, so the newspapers are only fitted once
+_default_rank_engine = None
+
+
 def compare_term_position(term):
     """
         Compare the positions of a given term in the TF-IDF matrices of four different CSV files and write the results to a
-        new CSV file.
+        new CSV file. The matrices are fitted once per session (see TermRankEngine); a term which does not occur in a
+        newspaper gets the position "absent".
 
         Parameters:
             term (str): The term whose position is to be compared.
@@ -289,13 +726,13 @@ def compare_term_position(term):
         Returns:
             None
         """
-    guardian = csv_to_tfidf("guardian.csv").columns.get_loc(term)
-    times = csv_to_tfidf("times.csv").columns.get_loc(term)
-    sun = csv_to_tfidf("sun.csv").columns.get_loc(term)
-    mail = csv_to_tfidf("mail.csv").columns.get_loc(term)
+    global _default_rank_engine
+    if _default_rank_engine is None:
+        _default_rank_engine = TermRankEngine()
+    positions = _default_rank_engine.ranks([term]).loc[term]
+    guardian, times, sun, mail = (positions[newspaper] for newspaper in ("Guardian", "Times", "Sun", "Mail"))
 
     with io.open(f"{term}compare.csv", "w", encoding="utf8") as file:
         file.write(f"guardian, {guardian}, times, {times}, sun, {sun}, mail, {mail}")
 
     return print(f"guardian, {guardian}, times, {times}, sun, {sun}, mail, {mail}")
-
@@ -0,0 +1,47 @@
+"""
+The NLTK models the preprocessing uses - the punkt sentence tokenizer, the English stopwords, the averaged perceptron
+tagger and WordNet - loaded once per process on first use. Importing NLTK and loading the models takes seconds, so
+preprocessing.py only does it when the first document is processed. Process pools call preload() in the parent before
+they start their workers, so forked workers inherit the loaded models, and pass it as the pool initializer, so spawned
+workers load them once each instead of once per shard.
+"""
+
+_resources = {}
+
+
+def preload():
+    """
+        Loads the NLTK models unless this process already has them.
+
+        Returns:
+            dict: 'stopwords' (frozenset of the English stopwords), 'tagger' (nltk.tag.PerceptronTagger, the tagger
+                  nltk.pos_tag uses) and 'lemmatizer' (nltk.stem.WordNetLemmatizer with WordNet loaded).
+    """
+    if _resources:
+        return _resources
+    import nltk
+    from nltk.corpus import stopwords, wordnet
+    from nltk.stem import WordNetLemmatizer
+    from nltk.tag import PerceptronTagger
+
+    # loads and caches the punkt model word_tokenize and sent_tokenize use
+    nltk.sent_tokenize("Warm up. Twice.")
+    wordnet.ensure_loaded()
+    _resources.update(stopwords=frozenset(stopwords.words('english')), tagger=PerceptronTagger(),
+                      lemmatizer=WordNetLemmatizer())
+    return _resources
+
+
+def stopword_set():
+    """Returns the English stopwords as a frozenset."""
+    return preload()['stopwords']
+
+
+def tagger():
+    """Returns the shared perceptron tagger; tagger().tag(tokens) equals nltk.pos_tag(tokens)."""
+    return preload()['tagger']
+
+
+def lemmatizer():
+    """Returns the shared WordNetLemmatizer."""
+    return preload()['lemmatizer']
@@ -0,0 +1,361 @@
+"""
+Runs the analysis from the crawled articles to the comparison files and plots as a dependency graph:
+
+    crawl/<paper> -> preprocess/<paper> -> ranks, cube -> compare, plot/<term>
+
+Every stage declares the files it reads and writes. Its key is a hash of the contents of its input files, its
+parameters and the source of the modules it runs, and a stage whose key matches the last successful run and whose
+outputs exist is skipped. Stages whose dependencies are done run in parallel in a process pool, so the four newspapers
+are preprocessed at the same time.
+
+Run from the repository root with
+
+    python pipeline.py [targets ...] [--workers 4] [--terms lgbt armband] [--crawl] [--force] [--dry-run]
+
+Targets are stage names or prefixes (e.g. 'preprocess'); by default every stage is built. The crawl stages need the
+browsers and the Guardian API key and only run with --crawl; otherwise the '<paper>_articles.json' files are the inputs.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from instrumentation import metrics
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATE_FILE = os.path.join(".pipeline", "state.json")
+PAPERS = ("guardian", "mail", "times", "sun")
+# the terms of the data/*compare.csv files
+DEFAULT_TERMS = ("alcohol", "armband", "boycott", "bribery", "climate", "controversy", "corruption", "discrimination",
+                 "gay", "iran", "lesbian", "lgbt", "lgbtq", "migrant", "protest", "russia", "sportswashing")
+PREPROCESS_CODE = ("preprocessing.py", "lemmatisation.py", "get_playernames.py", "corpus_store.py", "ingest.py",
+                   "dedup.py")
+
+
+class Stage:
+    """
+        One step of the pipeline.
+
+        Attributes:
+            name (str): Unique name, e.g. 'preprocess/sun'.
+            function (callable): Module-level function run in a worker process as function(**params).
+            params (dict): JSON-serialisable keyword arguments of function.
+            inputs (tuple of str): Files the stage reads.
+            outputs (tuple of str): Files the stage writes.
+            deps (tuple of str): Names of the stages which have to finish first.
+            code (tuple of str): Source files whose contents are part of the key.
+    """
+
+    def __init__(self, name, function, params=None, inputs=(), outputs=(), deps=(), code=()):
+        self.name = name
+        self.function = function
+        self.params = params or {}
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.deps = tuple(deps)
+        self.code = tuple(code)
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, deps={list(self.deps)})"
+
+    def key(self):
+        """Returns the hash of the input file contents, parameters and code of the stage."""
+        digest = hashlib.sha256()
+        digest.update(f"{self.function.__module__}.{self.function.__qualname__}".encode())
+        digest.update(json.dumps(self.params, sort_keys=True).encode())
+        for path in self.code + self.inputs:
+            digest.update(path.encode())
+            digest.update(_file_digest(path))
+        return digest.hexdigest()
+
+    def up_to_date(self, state):
+        return state.get(self.name) == self.key() and all(os.path.exists(path) for path in self.outputs)
+
+
+def _file_digest(path):
+    """Returns the sha256 of a file's contents, or of nothing if it does not exist."""
+    digest = hashlib.sha256()
+    if os.path.isfile(path):
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.digest()
+
+
+# stage functions, module-level so they can be sent to the worker processes
+
+def merge_articles(articles_file, run_file):
+    """
+        Adds the articles of one crawl run to the articles of the earlier runs. The spiders skip every URL an earlier
+        run fetched (see crawler/frontier.py), so a run only finds the new articles; writing its output over the
+        articles file would drop all the others. Articles equal to one already there are left out, and the articles
+        file is only rewritten if something was added, so the stages reading it stay up to date.
+
+        Parameters:
+            articles_file (str): The JSON array of the articles found so far; created if it does not exist.
+            run_file (str): The JSON lines feed of the run; a missing file counts as a run without articles.
+
+        Returns:
+            int: The number of articles added.
+    """
+    articles = []
+    if os.path.isfile(articles_file):
+        with open(articles_file, encoding="utf8") as f:
+            articles = json.load(f)
+    seen = {json.dumps(article, sort_keys=True) for article in articles}
+    added = 0
+    if os.path.isfile(run_file):
+        with open(run_file, encoding="utf8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                article = json.loads(line)
+                key = json.dumps(article, sort_keys=True)
+                if key not in seen:
+                    seen.add(key)
+                    articles.append(article)
+                    added += 1
+    if added or not os.path.isfile(articles_file):
+        tmp_file = f"{articles_file}.tmp"
+        with open(tmp_file, "w", encoding="utf8") as f:
+            json.dump(articles, f, indent=4)
+        os.replace(tmp_file, articles_file)
+    return added
+
+
+def crawl_spider(paper):
+    # every run writes its own feed, which is then merged into the articles of the earlier runs
+    run_file = os.path.join(ROOT, f"{paper}_articles.run.jl")
+    subprocess.run([sys.executable, "-m", "scrapy", "runspider", os.path.join("crawler", f"{paper}.py"), "-O",
+                    run_file], cwd=ROOT, check=True)
+    try:
+        added = merge_articles(os.path.join(ROOT, f"{paper}_articles.json"), run_file)
+    finally:
+        if os.path.exists(run_file):
+            os.remove(run_file)
+    logger.info(f"crawl/{paper}: {added} new articles")
+
+
+def crawl_guardian():
+    from crawler import guardian
+
+    failed = guardian.harvest(work_dir=os.path.join(ROOT, "guardian_articles"),
+                              output_file=os.path.join(ROOT, "guardian_articles.json"))
+    if failed:
+        raise RuntimeError(f"Guardian pages {failed} failed")
+
+
+def run_preprocess(paper, **params):
+    from preprocessing import preprocess
+
+    preprocess(paper, csv=True, parquet=True, partitioned=True, **params)
+
+
+def build_ranks():
+    import methods
+
+    engine = methods.TermRankEngine()
+    for newspaper in engine.files:
+        engine.rank_table(newspaper)
+
+
+def write_compare(terms):
+    import methods
+
+    methods.TermRankEngine().write_compare_files(terms)
+
+
+def build_cube():
+    import methods
+
+    cube = methods.TfidfCube()
+    for newspaper in cube.files:
+        cube.table(newspaper)
+
+
+def plot_term(term):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import methods
+
+    methods.plot_tfidf(term, save=True)
+    plt.close("all")
+
+
+def build_graph(terms=DEFAULT_TERMS, crawl=False, preprocess_params=None):
+    """
+        Returns the stages of the pipeline, keyed by name.
+
+        Parameters:
+            terms (iterable of str, optional): The terms to compare and plot. Defaults to DEFAULT_TERMS.
+            crawl (bool, optional): Whether to include the crawl stages. Defaults to False.
+            preprocess_params (dict, optional): Keyword arguments of preprocess(), e.g. {'workers': 2}.
+    """
+    terms = list(terms)
+    stages = {}
+    corpus_files = []
+    for paper in PAPERS:
+        articles = f"{paper}_articles.json"
+        if crawl:
+            function, params = (crawl_guardian, {}) if paper == "guardian" else (crawl_spider, {"paper": paper})
+            code = [os.path.join("crawler", f"{paper}.py")]
+            stages[f"crawl/{paper}"] = Stage(f"crawl/{paper}", function, params, outputs=[articles], code=code)
+        stages[f"preprocess/{paper}"] = Stage(f"preprocess/{paper}", run_preprocess,
+                                              {"paper": paper, **(preprocess_params or {})},
+                                              inputs=[articles],
+                                              outputs=[f"{paper}.csv", f"{paper}.parquet",
+                                                       os.path.join("corpus", f"newspaper={paper}")],
+                                              deps=[f"crawl/{paper}"] if crawl else [], code=PREPROCESS_CODE)
+        corpus_files += [f"{paper}.csv", f"{paper}.parquet"]
+
+    preprocessed = [f"preprocess/{paper}" for paper in PAPERS]
+    stages["ranks"] = Stage("ranks", build_ranks, inputs=corpus_files,
+                            outputs=[os.path.join(".term_ranks", f"{paper}_ranks.csv") for paper in PAPERS],
+                            deps=preprocessed, code=["methods.py"])
+    stages["cube"] = Stage("cube", build_cube, inputs=corpus_files,
+                           outputs=[os.path.join(".tfidf_cube", f"{paper}.npz") for paper in PAPERS],
+                           deps=preprocessed, code=["methods.py"])
+    stages["compare"] = Stage("compare", write_compare, {"terms": terms}, inputs=stages["ranks"].outputs,
+                              outputs=[os.path.join("data", f"{term}compare.csv") for term in terms] +
+                                      ["combined.csv"], deps=["ranks"], code=["methods.py"])
+    for term in terms:
+        stages[f"plot/{term}"] = Stage(f"plot/{term}", plot_term, {"term": term}, inputs=stages["cube"].outputs,
+                                       outputs=[f"{term}.jpg"], deps=["cube"], code=["methods.py"])
+    return stages
+
+
+def select(stages, targets):
+    """Returns the names of the target stages (names or prefixes) and everything they depend on."""
+    wanted = [name for name in stages
+              if not targets or any(name == target or name.startswith(target.rstrip("/") + "/") for target in targets)]
+    if not wanted:
+        raise ValueError(f"no stage matches {targets}")
+    selected = set()
+    todo = list(wanted)
+    while todo:
+        name = todo.pop()
+        if name not in selected:
+            selected.add(name)
+            todo.extend(dep for dep in stages[name].deps if dep in stages)
+    return selected
+
+
+def _load_state():
+    if os.path.isfile(STATE_FILE):
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    return {}
+
+
+def _save_state(state):
+    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+    with open(STATE_FILE + ".tmp", "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(STATE_FILE + ".tmp", STATE_FILE)
+
+
+def run(stages, targets=(), workers=4, force=False, dry_run=False):
+    """
+        Runs the selected stages in dependency order, skipping the up-to-date ones and running independent ones in
+        parallel. A stage's key is checked when it becomes ready, so it sees the outputs of the stages before it.
+
+        Parameters:
+            stages (dict): The stages, see build_graph().
+            targets (iterable of str, optional): Stage names or prefixes to build. Defaults to all stages.
+            workers (int, optional): Number of worker processes. Defaults to 4.
+            force (bool, optional): Run the selected stages even if they are up to date. Defaults to False.
+            dry_run (bool, optional): Only report which stages would run. Defaults to False.
+
+        Returns:
+            dict: Maps the selected stage names to 'skipped', 'done', 'failed', 'blocked' or 'would run'.
+    """
+    selected = select(stages, targets)
+    state = _load_state()
+    status = {}
+    pending = {}
+
+    def ready(name):
+        return all(status.get(dep) in ("skipped", "done", "would run") for dep in stages[name].deps if dep in selected)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while len(status) < len(selected):
+            for name in sorted(selected - status.keys() - set(pending.values())):
+                stage = stages[name]
+                if any(status.get(dep) in ("failed", "blocked") for dep in stage.deps):
+                    status[name] = "blocked"
+                elif ready(name):
+                    if not force and stage.up_to_date(state):
+                        status[name] = "skipped"
+                    elif dry_run:
+                        status[name] = "would run"
+                    else:
+                        logger.info(f"running {name}")
+                        pending[pool.submit(_run_stage, stage.function, stage.params, name, metrics.enabled)] = name
+                else:
+                    continue
+                if name in status:
+                    logger.info(f"{name}: {status[name]}")
+            if not pending:
+                continue
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    records = future.result()
+                except Exception as error:
+                    logger.error(f"{name} failed: {error!r}")
+                    status[name] = "failed"
+                    continue
+                metrics.records.extend(records)
+                status[name] = "done"
+                state[name] = stages[name].key()
+                _save_state(state)
+                logger.info(f"{name}: done")
+    return status
+
+
+def _run_stage(function, params, name, record_metrics):
+    """Runs a stage function in a worker process and returns the metrics records of the stage."""
+    if record_metrics:
+        metrics.enable(log=False)
+        metrics.reset()
+    with metrics.stage(f"pipeline/{name}"):
+        function(**params)
+    return metrics.records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the crawl -> preprocess -> compare/plot pipeline.")
+    parser.add_argument("targets", nargs="*", help="stage names or prefixes, e.g. 'preprocess/sun' or 'plot'")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--terms", nargs="+", default=list(DEFAULT_TERMS))
+    parser.add_argument("--crawl", action="store_true", help="include the crawl stages")
+    parser.add_argument("--force", action="store_true", help="run the selected stages even if they are up to date")
+    parser.add_argument("--dry-run", action="store_true", help="only list the stages that would run")
+    parser.add_argument("--preprocess-workers", type=int, default=1, help="worker processes per preprocess() call")
+    parser.add_argument("--metrics", help="write the stage metrics to this JSON file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    if args.metrics:
+        metrics.enable(log=False)
+    params = {"workers": args.preprocess_workers} if args.preprocess_workers > 1 else {}
+    stages = build_graph(args.terms, crawl=args.crawl, preprocess_params=params)
+    status = run(stages, args.targets, workers=args.workers, force=args.force, dry_run=args.dry_run)
+    if args.metrics:
+        metrics.to_json(args.metrics)
+    for name in sorted(status):
+        logger.info(f"{name:30s} {status[name]}")
+    return 1 if any(value in ("failed", "blocked") for value in status.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
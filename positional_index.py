@@ -0,0 +1,414 @@
+import json
+import os
+from array import array
+import numpy as np
+import pandas as pd
+from corpus_store import corpus_file, read_corpus
+from encoded_corpus import _frombuffer
+from instrumentation import metrics
+from methods import NEWSPAPER_CSV_FILES
+
+ARRAYS = ('tokens', 'folded', 'offsets', 'sentence_offsets', 'doc_sentences', 'postings', 'posting_offsets',
+          'frequencies')
+
+
+def _tokenize(text):
+    """Returns the word_tokenize() tokens of a sentence or query; NLTK is imported on first use."""
+    from nltk.tokenize import word_tokenize
+
+    return word_tokenize(text, preserve_line=True)
+
+
+def _encode_varints(values):
+    """
+        Encodes non-negative integers as LEB128 varints: seven bits per byte, low bits first, the high bit set on all but
+        the last byte of a value.
+
+        Returns:
+            tuple: The uint8 byte array and the number of bytes of every value.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    n_bytes = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        n_bytes += values >= np.uint64(1 << shift)
+    starts = np.cumsum(n_bytes) - n_bytes
+    data = np.empty(int(n_bytes.sum()), dtype=np.uint8)
+    for k in range(int(n_bytes.max()) if len(values) else 0):
+        mask = n_bytes > k
+        low_bits = (values[mask] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        more = (n_bytes[mask] > k + 1).astype(np.uint64) << np.uint64(7)
+        data[starts[mask] + k] = (low_bits | more).astype(np.uint8)
+    return data, n_bytes
+
+
+def _decode_varints(data):
+    """Decodes a byte array written by _encode_varints() into an int64 array."""
+    data = np.asarray(data, dtype=np.uint8)
+    if not len(data):
+        return np.zeros(0, dtype=np.int64)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = (np.arange(len(data)) - np.repeat(starts, ends - starts + 1)) * 7
+    return np.add.reduceat((data & 0x7f).astype(np.int64) << shifts, starts)
+
+
+class PositionalIndex:
+    """
+        Positional index of the tokenised sentences of a preprocessed corpus (the 'sentences' column written by
+        preprocess() ), for exact-phrase, proximity and keyword-in-context (KWIC) queries.
+
+        Every word_tokenize() token of the sentences - stopwords and punctuation included, so phrases match the text -
+        gets a global position. The forward index is the flat array of the token ids with CSR-style document and sentence
+        offsets like EncodedCorpus, which gives the context of a match. The inverted index maps every case-folded term id
+        to the sorted positions of its occurrences; the positions are delta-encoded and stored as varints in one byte
+        array, usually one or two bytes per occurrence. The document, sentence and offset of a posting are found by
+        binary search in the offsets, so a query only decodes the postings of its own words, whatever the corpus size.
+
+        Attributes:
+            words (numpy array): The surface form of every token id, as it occurs in the text.
+            terms (numpy array): The case-folded term of every term id, sorted.
+            tokens (numpy array): The int32 token ids of all sentences, concatenated.
+            folded (numpy array): The term id of every token id.
+            offsets (numpy array): Document i is tokens[offsets[i]:offsets[i+1]].
+            sentence_offsets (numpy array): Sentence j is tokens[sentence_offsets[j]:sentence_offsets[j+1]].
+            doc_sentences (numpy array): The sentences of document i are doc_sentences[i]:doc_sentences[i+1].
+            postings (numpy array): The uint8 varint-encoded position gaps of all terms, term by term.
+            posting_offsets (numpy array): The postings of term t are postings[posting_offsets[t]:posting_offsets[t+1]].
+            frequencies (numpy array): Number of occurrences of every term.
+            documents (pandas DataFrame): One row of metadata (e.g. 'title', 'date') per document.
+    """
+
+    def __init__(self, words, terms, tokens, folded, offsets, sentence_offsets, doc_sentences, postings,
+                 posting_offsets, frequencies, documents=None):
+        self.words = np.asarray(words, dtype=object)
+        self.terms = np.asarray(terms, dtype=object)
+        self.tokens = tokens
+        self.folded = folded
+        self.offsets = offsets
+        self.sentence_offsets = sentence_offsets
+        self.doc_sentences = doc_sentences
+        self.postings = postings
+        self.posting_offsets = posting_offsets
+        self.frequencies = frequencies
+        self.documents = documents if documents is not None else pd.DataFrame(index=range(len(offsets) - 1))
+        self._term_ids = None
+
+    @classmethod
+    def from_sentences(cls, documents_sentences, documents=None):
+        """
+            Tokenises the sentences of every document and builds the index.
+
+            Parameters:
+                documents_sentences (iterable of list of str): The sentences of every document.
+                documents (pandas DataFrame, optional): Metadata of the documents. Defaults to None.
+
+            Returns:
+                PositionalIndex: The index.
+        """
+        vocabulary = {}
+        tokens = array('i')
+        offsets, sentence_offsets, doc_sentences = array('q', [0]), array('q', [0]), array('q', [0])
+        for sentences in documents_sentences:
+            for sentence in sentences:
+                tokens.extend(vocabulary.setdefault(word, len(vocabulary)) for word in _tokenize(sentence))
+                sentence_offsets.append(len(tokens))
+            offsets.append(len(tokens))
+            doc_sentences.append(len(sentence_offsets) - 1)
+        tokens = _frombuffer(tokens, np.int32)
+
+        words = list(vocabulary)
+        lowered = [word.lower() for word in words]
+        terms = sorted(set(lowered))
+        term_ids = {term: i for i, term in enumerate(terms)}
+        folded = np.fromiter((term_ids[word] for word in lowered), dtype=np.int32, count=len(lowered))
+
+        # positions grouped by term, ascending within each term (the sort is stable)
+        keys = folded[tokens]
+        positions = np.argsort(keys, kind='stable')
+        frequencies = np.bincount(keys, minlength=len(terms))
+        term_starts = np.concatenate(([0], np.cumsum(frequencies)))
+        gaps = positions.copy()
+        gaps[1:] -= positions[:-1]
+        firsts = term_starts[:-1][frequencies > 0]
+        gaps[firsts] = positions[firsts]
+        postings, n_bytes = _encode_varints(gaps)
+        posting_offsets = np.concatenate(([0], np.cumsum(n_bytes)))[term_starts]
+
+        return cls(words, terms, tokens, folded, _frombuffer(offsets, np.int64),
+                   _frombuffer(sentence_offsets, np.int64), _frombuffer(doc_sentences, np.int64), postings,
+                   posting_offsets, frequencies, documents)
+
+    @classmethod
+    def from_frame(cls, df, metadata=('title', 'date')):
+        """
+            Builds the index of a preprocessed DataFrame (obtained using preprocess() ).
+
+            Parameters:
+                df (pandas DataFrame): A preprocessed DataFrame with a 'sentences' column.
+                metadata (iterable of str, optional): The columns kept as document metadata, where present.
+                                                      Defaults to ('title', 'date').
+
+            Returns:
+                PositionalIndex: The index.
+        """
+        documents = df[[column for column in metadata if column in df.columns]].reset_index(drop=True)
+        with metrics.stage('positional_index/build', documents=len(df)) as stage:
+            index = cls.from_sentences(df['sentences'], documents)
+            stage.items_out(tokens=len(index.tokens), terms=len(index.terms), postings_bytes=len(index.postings))
+        return index
+
+    @classmethod
+    def from_store(cls, file_path, metadata=('title', 'date')):
+        """
+            Builds the index of a preprocessed file, reading only the sentences and the metadata columns.
+
+            Parameters:
+                file_path (str): A preprocessed CSV or Parquet file (see corpus_store.read_corpus() ).
+                metadata (iterable of str, optional): The metadata columns. Defaults to ('title', 'date').
+
+            Returns:
+                PositionalIndex: The index.
+        """
+        return cls.from_frame(read_corpus(file_path, columns=['sentences', *metadata]), metadata)
+
+    def __repr__(self):
+        return (f"PositionalIndex({len(self)} documents, {len(self.tokens)} tokens, {len(self.terms)} terms, "
+                f"{self.nbytes} bytes)")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self):
+        """The number of bytes of the index arrays."""
+        return sum(getattr(self, name).nbytes for name in ARRAYS)
+
+    def term_id(self, term):
+        """Returns the id of a (case-folded) term, or -1 if it does not occur."""
+        if self._term_ids is None:
+            self._term_ids = {term: i for i, term in enumerate(self.terms)}
+        return self._term_ids.get(term.lower(), -1)
+
+    def positions(self, term):
+        """Returns the sorted global positions of all occurrences of a term (case-insensitive)."""
+        term_id = self.term_id(term)
+        if term_id < 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.cumsum(_decode_varints(self.postings[self.posting_offsets[term_id]:self.posting_offsets[term_id + 1]]))
+
+    def phrase(self, query):
+        """
+            Finds the exact occurrences of a phrase within a sentence, ignoring case. The phrase is tokenised like the
+            sentences, so "World Cup's" matches the tokens 'world', 'cup', "'s".
+
+            Parameters:
+                query (str): The phrase, e.g. "human rights".
+
+            Returns:
+                numpy array: The global positions of the first tokens of the matches, sorted.
+        """
+        words = _tokenize(query)
+        if not words:
+            return np.zeros(0, dtype=np.int64)
+        ids = [self.term_id(word) for word in words]
+        if min(ids) < 0:
+            return np.zeros(0, dtype=np.int64)
+        # start from the rarest word and keep the candidates the other words follow at the right distance
+        order = sorted(range(len(ids)), key=lambda k: self.frequencies[ids[k]])
+        starts = self.positions(words[order[0]]) - order[0]
+        for k in order[1:]:
+            if not len(starts):
+                break
+            positions = self.positions(words[k])
+            found = np.searchsorted(positions, starts + k)
+            found[found == len(positions)] = 0
+            starts = starts[positions[found] == starts + k] if len(positions) else starts[:0]
+        if len(words) > 1 and len(starts):
+            sentences = np.searchsorted(self.sentence_offsets, starts, side='right') - 1
+            starts = starts[starts + len(words) <= self.sentence_offsets[sentences + 1]]
+        return starts
+
+    def near(self, first, second, window=5):
+        """
+            Finds the occurrences of a phrase with another phrase at most <window> tokens before or after it, in the
+            same document.
+
+            Parameters:
+                first (str): The phrase whose occurrences are returned, e.g. "armband".
+                second (str): The phrase which has to occur nearby, e.g. "fifa".
+                window (int, optional): The largest distance between the starts of the phrases. Defaults to 5.
+
+            Returns:
+                numpy array: The global positions of the matching occurrences of first, sorted.
+        """
+        starts, others = self.phrase(first), self.phrase(second)
+        if not len(starts) or not len(others):
+            return starts[:0]
+        documents = np.searchsorted(self.offsets, starts, side='right') - 1
+        lower = np.maximum(starts - window, self.offsets[documents])
+        upper = np.minimum(starts + window, self.offsets[documents + 1] - 1)
+        nearby = np.searchsorted(others, upper, side='right') - np.searchsorted(others, lower, side='left')
+        if _tokenize(first.lower()) == _tokenize(second.lower()):
+            # an occurrence is not near itself
+            nearby -= 1
+        return starts[nearby > 0]
+
+    def locate(self, positions):
+        """
+            Returns the document, the sentence within the document and the offset within the sentence of positions.
+
+            Returns:
+                pandas DataFrame: Columns 'document', 'sentence' and 'offset', one row per position.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        documents = np.searchsorted(self.offsets, positions, side='right') - 1
+        sentences = np.searchsorted(self.sentence_offsets, positions, side='right') - 1
+        return pd.DataFrame({'document': documents, 'sentence': sentences - self.doc_sentences[documents],
+                             'offset': positions - self.sentence_offsets[sentences]})
+
+    def concordance(self, positions, length=1, width=8, limit=None):
+        """
+            Returns the keyword-in-context lines of matches.
+
+            Parameters:
+                positions (numpy array): The global positions of the matches, e.g. from phrase().
+                length (int, optional): The number of tokens of a match. Defaults to 1.
+                width (int, optional): The number of tokens of context on either side, within the document.
+                                       Defaults to 8.
+                limit (int, optional): The largest number of lines. Defaults to None (all matches).
+
+            Returns:
+                pandas DataFrame: 'document', 'sentence', 'offset', 'left', 'keyword', 'right' and the metadata columns
+                                  of the documents, one row per match.
+        """
+        positions = np.asarray(positions, dtype=np.int64)[:limit]
+        lines = self.locate(positions)
+        starts = self.offsets[lines['document'].to_numpy()]
+        ends = self.offsets[lines['document'].to_numpy() + 1]
+        words = self.words
+        left, keyword, right = [], [], []
+        for position, start, end in zip(positions, starts, ends):
+            left.append(' '.join(words[self.tokens[max(start, position - width):position]]))
+            keyword.append(' '.join(words[self.tokens[position:position + length]]))
+            right.append(' '.join(words[self.tokens[position + length:min(end, position + length + width)]]))
+        lines['left'], lines['keyword'], lines['right'] = left, keyword, right
+        metadata = self.documents.iloc[lines['document']].reset_index(drop=True)
+        return pd.concat([lines, metadata], axis=1)
+
+    def kwic(self, query, width=8, limit=None):
+        """Returns the keyword-in-context lines of a phrase, see phrase() and concordance()."""
+        return self.concordance(self.phrase(query), len(_tokenize(query)), width, limit)
+
+    def kwic_near(self, first, second, window=5, width=8, limit=None):
+        """Returns the keyword-in-context lines of first near second, see near() and concordance()."""
+        return self.concordance(self.near(first, second, window), len(_tokenize(first)), width, limit)
+
+    def save(self, directory):
+        """
+            Saves the index as one .npy file per array plus the vocabulary and metadata, so load() can memory-map it.
+            The vocabulary file is written last and marks a complete index.
+
+            Parameters:
+                directory (str): The directory to write to; it is created if needed.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        self.documents.to_parquet(os.path.join(directory, 'documents.parquet'))
+        with open(os.path.join(directory, 'vocabulary.json'), 'w') as f:
+            json.dump({'words': self.words.tolist(), 'terms': self.terms.tolist()}, f)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+            Loads an index written by save().
+
+            Parameters:
+                directory (str): The directory save() wrote to.
+                mmap (bool, optional): If True the arrays are memory-mapped read-only instead of read. Defaults to True.
+
+            Returns:
+                PositionalIndex: The loaded index.
+        """
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r' if mmap else None)
+                  for name in ARRAYS}
+        with open(os.path.join(directory, 'vocabulary.json')) as f:
+            vocabulary = json.load(f)
+        documents = pd.read_parquet(os.path.join(directory, 'documents.parquet'))
+        return cls(vocabulary['words'], vocabulary['terms'], documents=documents, **arrays)
+
+
+class Concordance:
+    """
+        Phrase, proximity and KWIC queries over the four newspapers. The PositionalIndex of every newspaper is built
+        once from its preprocessed file and saved to index_dir; later sessions memory-map it, until the preprocessed
+        file changes.
+
+        Attributes:
+            files (dict): Maps each newspaper name to its preprocessed CSV file (the Parquet version is used if it
+                          exists, see corpus_file() ).
+            index_dir (str): Directory the indexes are saved in.
+    """
+
+    def __init__(self, files=None, index_dir=".positional_index"):
+        self.files = dict(NEWSPAPER_CSV_FILES if files is None else files)
+        self.index_dir = index_dir
+        self._indexes = {}
+
+    def index(self, newspaper):
+        """
+            Returns the PositionalIndex of a newspaper, loading it from index_dir or building it if it is missing or
+            older than the preprocessed file.
+
+            Parameters:
+                newspaper (str): One of the keys of files, e.g. "Guardian".
+
+            Returns:
+                PositionalIndex: The index.
+        """
+        if newspaper in self._indexes:
+            return self._indexes[newspaper]
+        file_path = corpus_file(self.files[newspaper])
+        directory = os.path.join(self.index_dir, newspaper.lower())
+        marker = os.path.join(directory, 'vocabulary.json')
+        if os.path.isfile(marker) and os.path.getmtime(marker) >= os.path.getmtime(file_path):
+            index = PositionalIndex.load(directory)
+        else:
+            index = PositionalIndex.from_store(file_path)
+            index.save(directory)
+        self._indexes[newspaper] = index
+        return index
+
+    def _lines(self, lines_of):
+        frames = [lines_of(self.index(newspaper)).assign(newspaper=newspaper) for newspaper in self.files]
+        lines = pd.concat(frames, ignore_index=True)
+        return lines[['newspaper'] + [column for column in lines.columns if column != 'newspaper']]
+
+    def kwic(self, query, width=8, limit=None):
+        """
+            Returns the keyword-in-context lines of a phrase in every newspaper.
+
+            Parameters:
+                query (str): The phrase, e.g. "human rights".
+                width (int, optional): The number of tokens of context on either side. Defaults to 8.
+                limit (int, optional): The largest number of lines per newspaper. Defaults to None (all).
+
+            Returns:
+                pandas DataFrame: One row per match with the 'newspaper' and the columns of
+                                  PositionalIndex.concordance().
+        """
+        return self._lines(lambda index: index.kwic(query, width, limit))
+
+    def kwic_near(self, first, second, window=5, width=8, limit=None):
+        """Returns the keyword-in-context lines of first near second in every newspaper, see PositionalIndex.near()."""
+        return self._lines(lambda index: index.kwic_near(first, second, window, width, limit))
+
+    def counts(self, query):
+        """
+            Counts the occurrences of a phrase in every newspaper.
+
+            Returns:
+                pandas Series: The number of matches, indexed by newspaper.
+        """
+        return pd.Series({newspaper: len(self.index(newspaper).phrase(query)) for newspaper in self.files},
+                         name=query)
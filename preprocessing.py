@@ -1,15 +1,348 @@
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.stem import WordNetLemmatizer
-from nltk.corpus import stopwords
+import hashlib
+import json
+import logging
+import os
 from string import punctuation
 import pandas as pd
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 # function which gets a list of all player names, used to remove them from the corpus
 from get_playernames import fetch_playerlist
+from lemmatisation import LemmaCache
+from corpus_store import CorpusWriter, iter_corpus, load_corpus, save_corpus, save_partitioned
+from ingest import iter_article_chunks, normalise_dates
+from instrumentation import metrics
+# NLTK and its models are loaded on first use, see nltk_resources.py
+import nltk_resources
 
+logger = logging.getLogger(__name__)
 
-def preprocess(newspaper: str, csv: bool = False, rare: bool = False):
+# display name and article file for every supported newspaper
+NEWSPAPERS = {
+    "times": ("The Times", "times_articles.json"),
+    "sun": ("The Sun", "sun_articles.json"),
+    "mail": ("Daily Mail", "mail_articles.json"),
+    "dailymail": ("Daily Mail", "mail_articles.json"),
+    "guardian": ("The Guardian", "guardian_articles.json"),
+}
+
+
+# `word not in punctuation` is a substring test on the punctuation string, so the set holds every substring of it
+PUNCTUATION = frozenset(punctuation[i:j] for i in range(len(punctuation)) for j in range(i, len(punctuation) + 1))
+
+# names of the per-stage token counters, in pipeline order
+STAGES = ('tokens', 'without_stopwords', 'without_symbols', 'lemmas', 'without_players')
+
+
+def _exploded_length(n_tokens):
+    """
+        Number of rows a document contributes to `df[column].explode()`: its token count, or 1 for an empty list.
+    """
+    return n_tokens or 1
+
+
+def _filter_lemmas(lemmas, lemma_tags, sentence_lengths, dropped):
+    """
+        Removes the lemmas in dropped from a document together with their POS tags, and shortens the sentences they
+        were in.
+
+        Returns:
+            tuple: The remaining lemmas, their tags and the new number of lemmas of every sentence.
+    """
+    kept, kept_tags, kept_lengths = [], [], []
+    start = 0
+    for length in sentence_lengths:
+        n_kept = len(kept)
+        for lemma, tag in zip(lemmas[start:start + length], lemma_tags[start:start + length]):
+            if lemma not in dropped:
+                kept.append(lemma)
+                kept_tags.append(tag)
+        kept_lengths.append(len(kept) - n_kept)
+        start += length
+    return kept, kept_tags, kept_lengths
+
+
+def _drop_lemmas(df, dropped):
+    """
+        Removes the given lemmas from the 'lemmas' column of a preprocessed DataFrame, keeping its 'lemma_tags' and
+        'sentence_lengths' columns aligned.
+    """
+    if not dropped:
+        return df
+    filtered = [_filter_lemmas(*doc, dropped)
+                for doc in zip(df['lemmas'], df['lemma_tags'], df['sentence_lengths'])]
+    df['lemmas'] = [lemmas for lemmas, _, _ in filtered]
+    df['lemma_tags'] = [lemma_tags for _, lemma_tags, _ in filtered]
+    df['sentence_lengths'] = [sentence_lengths for _, _, sentence_lengths in filtered]
+    return df
+
+
+def _align_compounds(lemmas, lemma_tags, sentence_lengths, compounded):
+    """
+        Aligns the POS tags and sentence lengths of a document with its compounded lemmas. Lemmas are alphabetic, so
+        a token which differs from the next lemma is the compound of it and the one after; the compound gets the tag of
+        its second word (the head of "world_cup"). Compounds are joined within a sentence (see
+        compound_collocations() ), so both words are in the same sentence.
+
+        Returns:
+            tuple: The tags of the compounded lemmas and the new number of lemmas of every sentence.
+    """
+    sentence_of = [sentence for sentence, length in enumerate(sentence_lengths) for _ in range(length)]
+    tags = []
+    lengths = [0] * len(sentence_lengths)
+    i = 0
+    for token in compounded:
+        width = 1 if token == lemmas[i] else 2
+        tags.append(lemma_tags[i + width - 1])
+        lengths[sentence_of[i]] += 1
+        i += width
+    return tags, lengths
+
+
+def _preprocess_documents(df, playerlist, lemma_cache=None, pos_aware=True):
+    """
+        Runs the per-document preprocessing stages (sentence splitting, tokenisation, stopword and symbol removal,
+        part-of-speech tagging, lemmatisation and player name removal) on a DataFrame of articles.
+        The token filters are fused into a single pass per document using set lookups, and running counters replace
+        the exploded column lengths that used to be printed after every filter. All documents are POS tagged in one
+        batch and lemmas are resolved through a (token, tag) memo cache.
+        Every sentence is tokenised on its own, which gives the same tokens as word_tokenize() on the whole article,
+        so the POS tag of every lemma ('lemma_tags') and the number of lemmas of every sentence ('sentence_lengths')
+        are kept alongside the lemmas.
+        Only looks at one article at a time, so it can be run on any shard of a corpus.
+
+        Parameters:
+            df (pandas DataFrame): A DataFrame of articles with a 'content' column.
+            playerlist (iterable of str): Lowercased player name tokens to remove from the lemmas.
+            lemma_cache (LemmaCache, optional): The lemma cache to use and fill. Defaults to a new, empty cache.
+            pos_aware (bool, optional): If True, tokens are lemmatised with their WordNet part of speech, otherwise
+                                        every token is lemmatised as a noun. Defaults to True.
+
+        Returns:
+            tuple: The DataFrame with the added columns, a dict with the number of tokens after each stage and the
+                   lemma cache.
+    """
+    from nltk.tokenize import sent_tokenize, word_tokenize
+
+    stopword_set = nltk_resources.stopword_set()
+    player_set = frozenset(playerlist)
+    if lemma_cache is None:
+        lemma_cache = LemmaCache()
+    counts = dict.fromkeys(STAGES, 0)
+    sentences, tokens, article_lengths, token_sentence_lengths = [], [], [], []
+    lemmas, lemma_tags, sentence_lengths = [], [], []
+
+    for text in df['content']:
+        doc_sentences = sent_tokenize(text)
+        sentences.append(doc_sentences)
+        # punctuation, stopwords and symbols in one pass over the words
+        doc_tokens = []
+        doc_lengths = []
+        n_words = n_content_words = 0
+        for sentence in doc_sentences:
+            n_sentence_tokens = len(doc_tokens)
+            # word_tokenize(text) tokenises the sentences of sent_tokenize(text) one after another
+            for word in word_tokenize(sentence, preserve_line=True):
+                if word in PUNCTUATION:
+                    continue
+                word = word.lower()
+                n_words += 1
+                if word in stopword_set:
+                    continue
+                n_content_words += 1
+                if word.isalpha():
+                    doc_tokens.append(word)
+            doc_lengths.append(len(doc_tokens) - n_sentence_tokens)
+        tokens.append(doc_tokens)
+        token_sentence_lengths.append(doc_lengths)
+        article_lengths.append(n_words)
+
+        counts['tokens'] += _exploded_length(n_words)
+        counts['without_stopwords'] += _exploded_length(n_content_words)
+        counts['without_symbols'] += _exploded_length(len(doc_tokens))
+        counts['lemmas'] += _exploded_length(len(doc_tokens))
+
+    # tag all documents with the process' tagger instead of loading one per nltk.pos_tag(_sents) call
+    tagger = nltk_resources.tagger()
+    pos_tags = [tagger.tag(doc_tokens) for doc_tokens in tokens]
+    for doc_tags, doc_lengths in zip(pos_tags, token_sentence_lengths):
+        # lemmatise each token and drop player names
+        doc_lemmas, doc_lemma_tags, doc_lengths = _filter_lemmas(lemma_cache.lemmatize_tagged(doc_tags, pos_aware),
+                                                                 [tag for _, tag in doc_tags], doc_lengths,
+                                                                 player_set)
+        lemmas.append(doc_lemmas)
+        lemma_tags.append(doc_lemma_tags)
+        sentence_lengths.append(doc_lengths)
+        counts['without_players'] += _exploded_length(len(doc_lemmas))
+
+    df['sentences'] = pd.Series(sentences, index=df.index, dtype=object)
+    df['tokens'] = pd.Series(tokens, index=df.index, dtype=object)
+    df['article_length'] = pd.Series(article_lengths, index=df.index, dtype='int64')
+    df['pos_tags'] = pd.Series(pos_tags, index=df.index, dtype=object)
+    df['lemmas'] = pd.Series(lemmas, index=df.index, dtype=object)
+    df['lemma_tags'] = pd.Series(lemma_tags, index=df.index, dtype=object)
+    df['sentence_lengths'] = pd.Series(sentence_lengths, index=df.index, dtype=object)
+    # Convert the list of lemmas back to text
+    df['lemmatised_text'] = df['lemmas'].apply(lambda x: ' '.join(x))
+
+    return df, counts, lemma_cache
+
+
+def find_rare_tokens(lemmas, rare_threshold=10):
+    """
+        Finds the tokens appearing less than rare_threshold times in the whole corpus.
+
+        Parameters:
+            lemmas (iterable of list): The lemma lists of all documents of the corpus.
+            rare_threshold (int, optional): Tokens with a corpus frequency below this are rare. Defaults to 10.
+
+        Returns:
+            tuple: The set of rare tokens and the exploded token count of the corpus.
+    """
+    token_counts = Counter()
+    n_tokens = 0
+    for doc in lemmas:
+        token_counts.update(doc)
+        n_tokens += _exploded_length(len(doc))
+    return frozenset(token for token, count in token_counts.items() if count < rare_threshold), n_tokens
+
+
+def remove_rare_tokens(lemmas, rare_threshold=10):
+    """
+        Removes tokens appearing less than rare_threshold times in the whole corpus.
+
+        Parameters:
+            lemmas (iterable of list): The lemma lists of all documents of the corpus.
+            rare_threshold (int, optional): Tokens with a corpus frequency below this are removed. Defaults to 10.
+
+        Returns:
+            tuple: The filtered lemma lists, the set of rare tokens and the exploded token count before filtering.
+    """
+    lemmas = list(lemmas)
+    rare_tokens, n_tokens = find_rare_tokens(lemmas, rare_threshold)
+    return [[token for token in doc if token not in rare_tokens] for doc in lemmas], rare_tokens, n_tokens
+
+
+def _split_shards(df, n_shards):
+    """
+        Splits a DataFrame into at most n_shards contiguous, non-empty shards of (nearly) equal size.
+
+        Parameters:
+            df (pandas DataFrame): The DataFrame to split.
+            n_shards (int): The number of shards to create.
+
+        Returns:
+            list: A list of DataFrames which, concatenated, give back the original DataFrame.
+    """
+    n_shards = max(1, min(n_shards, len(df)))
+    size, remainder = divmod(len(df), n_shards)
+    shards = []
+    start = 0
+    for i in range(n_shards):
+        stop = start + size + (1 if i < remainder else 0)
+        shards.append(df.iloc[start:stop].copy())
+        start = stop
+    return shards
+
+
+def _process_pool(workers):
+    """
+        Returns a process pool for the per-document stages. The NLTK models are loaded in this process first, so forked
+        workers inherit them, and by the pool initializer, so spawned workers load them once each.
+    """
+    nltk_resources.preload()
+    return ProcessPoolExecutor(max_workers=workers, initializer=nltk_resources.preload)
+
+
+def _run_document_stages(df, playerlist, workers=1, executor=None, lemma_cache=None, pos_aware=True):
+    """
+        Runs _preprocess_documents() either serially or on shards of the DataFrame in a process pool and merges the
+        results in the original order.
+
+        Parameters:
+            df (pandas DataFrame): A DataFrame of articles with a 'content' column.
+            playerlist (list): Lowercased player name tokens to remove from the lemmas.
+            workers (int, optional): Number of shards / worker processes. Defaults to 1 (serial).
+            executor (concurrent.futures.Executor, optional): An existing pool to run the shards on. Defaults to None.
+            lemma_cache (LemmaCache, optional): The lemma cache to start from; worker entries are merged back into it.
+                                                Defaults to a new, empty cache.
+            pos_aware (bool, optional): Whether to lemmatise with WordNet parts of speech. Defaults to True.
+
+        Returns:
+            tuple: The preprocessed DataFrame, the summed token counts of all shards and the lemma cache.
+    """
+    if lemma_cache is None:
+        lemma_cache = LemmaCache()
+    if executor is None and workers <= 1:
+        return _preprocess_documents(df, playerlist, lemma_cache, pos_aware)
+
+    shards = _split_shards(df, workers)
+    # every shard gets a copy of lemma_cache, so let the copies count only what happens in the workers
+    hits, misses = lemma_cache.hits, lemma_cache.misses
+    lemma_cache.reset_counters()
+    arguments = ([playerlist] * len(shards), [lemma_cache] * len(shards), [pos_aware] * len(shards))
+    if executor is None:
+        with _process_pool(workers) as pool:
+            results = list(pool.map(_preprocess_documents, shards, *arguments))
+    else:
+        results = list(executor.map(_preprocess_documents, shards, *arguments))
+
+    # exploded lengths are additive per row, so the shard counts add up to the corpus counts
+    counts = Counter()
+    for _, shard_counts, shard_cache in results:
+        counts.update(shard_counts)
+        lemma_cache.update(shard_cache)
+    lemma_cache.hits += hits
+    lemma_cache.misses += misses
+    df = pd.concat([shard for shard, _, _ in results])
+    return df, dict(counts), lemma_cache
+
+
+def _canonical_newspaper(newspaper):
+    """Returns the first name in NEWSPAPERS of a newspaper's article file, e.g. 'mail' for 'dailymail'."""
+    json_file = NEWSPAPERS[newspaper][1]
+    return next(name for name, (_, file) in NEWSPAPERS.items() if file == json_file)
+
+
+def _other_newspapers(newspaper):
+    """
+        Returns the shingle signatures of the articles of every other newspaper, in NEWSPAPERS order, for
+        deduplicate_across(); they are read from dedup.SIGNATURE_DIR unless the article file changed since they were
+        stored (see dedup.cached_signatures() ). The given newspaper is a placeholder and the article files that do not
+        exist are left out.
+    """
+    # imported here, so that importing this module does not load SciPy
+    from dedup import cached_signatures
+
+    own = _canonical_newspaper(newspaper)
+    frames = {}
+    for name, (_, json_file) in NEWSPAPERS.items():
+        if name == own:
+            frames[name] = None
+        elif name == _canonical_newspaper(name) and os.path.isfile(json_file):
+            frames[name] = cached_signatures(json_file)
+    return frames
+
+
+def _check_newspaper(newspaper):
+    """
+        Validates a newspaper argument and returns it lowercased.
+
+        Raises:
+            ValueError: If the 'newspaper' argument is not a string or is not one of the supported newspapers.
+    """
+    if not isinstance(newspaper, str):
+        raise ValueError('newspaper argument must be a string')
+    newspaper = newspaper.lower()
+    if newspaper not in NEWSPAPERS:
+        raise ValueError('newspaper argument must be one of "times", "sun", or "guardian", "mail" or "dailymail".')
+    return newspaper
+
+
+def preprocess(newspaper: str, csv: bool = False, rare: bool = False, workers: int = 1, executor=None,
+               rare_threshold: int = 10, pos_aware: bool = True, lemma_cache_file: str = None, parquet: bool = False,
+               collocations: int = 0, collocation_min_count: int = 25, dedup: str = None,
+               dedup_threshold: float = 0.8, dedup_across: bool = False, partitioned: bool = False):
     """
         Preprocesses text data from JSON files for four different newspapers (The Times, The Sun, Daily Mail and The Guardian),
         including tokenisation, removal of stopwords, punctuation, rare tokens and player names, part-of-speech tagging,
@@ -22,8 +355,44 @@ def preprocess(newspaper: str, csv: bool = False, rare: bool = False):
         Name of the newspaper to preprocess data for. Must be one of "times", "sun", "mail" or "guardian".
         csv : bool, optional
         If True, saves the resulting DataFrame to a CSV file. Defaults to False.
+        parquet : bool, optional
+        If True, saves the resulting DataFrame to a Parquet file with native list columns (see corpus_store.py), which
+        loads much faster than the CSV file. Defaults to False.
+        partitioned : bool, optional
+        If True, also saves the resulting DataFrame partitioned by newspaper and month under corpus/ (see
+        corpus_store.save_partitioned() ), so queries for a range of months only read those months. Defaults to False.
         rare : bool, optional
         If True, rare tokens are not removed from the preprocessed text. Defaults to False.
+        rare_threshold : int, optional
+        Tokens appearing less than this many times in the corpus count as rare. Defaults to 10.
+        workers : int, optional
+        Number of processes the per-document stages are sharded across. Defaults to 1 (serial); the output is the
+        same for every value.
+        executor : concurrent.futures.Executor, optional
+        An existing process pool to run the shards on, e.g. shared between newspapers. Defaults to None.
+        pos_aware : bool, optional
+        If True, tokens are lemmatised with the WordNet part of speech of their POS tag ("played" -> "play"), otherwise
+        every token is lemmatised as a noun like before. Defaults to True.
+        lemma_cache_file : str, optional
+        JSON file the (token, tag) -> lemma cache is loaded from and saved back to, so it persists between runs.
+        Defaults to None (no persistence).
+        collocations : int, optional
+        If greater than 0, the top this many two-word collocations (by quanteda's lambda z-score, see collocations.py)
+        are joined into single tokens such as "world_cup" in the 'lemmas' column, within sentences and after rare
+        tokens have been removed, and 'lemmatised_text' is rebuilt from the compounded lemmas. Otherwise
+        'lemmatised_text' is joined before rare tokens are removed, like it always was. Defaults to 0 (no compounding).
+        collocation_min_count : int, optional
+        Minimum number of occurrences of a collocation. Defaults to 25.
+        dedup : str, optional
+        'collapse' keeps only the longest version of near-duplicate articles (same story on overlapping search pages,
+        updated versions), 'mark' keeps them all and adds a 'duplicate_of' column, see dedup.py. Runs before the
+        articles are tokenised. Defaults to None (no deduplication).
+        dedup_threshold : float, optional
+        Minimum Jaccard similarity of the 5-word shingles of near-duplicates. Defaults to 0.8.
+        dedup_across : bool, optional
+        If True, articles with a near-duplicate in another newspaper's JSON file (e.g. agency copy) are marked in a
+        'syndicated' column ('mark') or dropped if a newspaper earlier in NEWSPAPERS has them ('collapse').
+        Defaults to False.
 
         Raises:
         -------
@@ -34,114 +403,420 @@ def preprocess(newspaper: str, csv: bool = False, rare: bool = False):
         --------
         pandas.DataFrame:
             DataFrame containing the preprocessed text data. The DataFrame has columns for the original article content,
-            the preprocessed text, and additional columns for the sentences, tokens, part-of-speech tags, and lemmas.
+            the preprocessed text, and additional columns for the sentences, tokens, part-of-speech tags, lemmas, the
+            tag of every lemma ('lemma_tags') and the number of lemmas of every sentence ('sentence_lengths').
     """
 
-    if not isinstance(newspaper, str):
-        raise ValueError('newspaper argument must be a string')
-    newspaper = newspaper.lower()
-    if newspaper not in ["times", "sun", "guardian", "mail", "dailymail"]:
-        raise ValueError('newspaper argument must be one of "times", "sun", or "guardian", "mail" or "dailymail".')
-
-    if newspaper == "times":
-        print("starting preprocessing newspaper 'The Times'.")
-        df = pd.read_json('times_articles.json')
-        print("transformed JSON to dataframe.")
-        # content = df.loc[:, "content"]
-
-    elif newspaper == "sun":
-        print("starting preprocessing newspaper 'The Sun'.")
-        df = pd.read_json('sun_articles.json')
-        print("transformed JSON to dataframe.")
-        # content = df.loc[:, "content"]
-
-    elif newspaper == "mail" or newspaper == "dailymail":
-        print("starting preprocessing newspaper 'Daily Mail'.")
-        df = pd.read_json('mail_articles.json')
-        print("transformed JSON to dataframe.")
-        # content = df.loc[:, "content"]
-
-    elif newspaper == "guardian":
-        print("starting preprocessing newspaper 'The Guardian'.")
-        df = pd.read_json('guardian_articles.json')
-        print("transformed JSON to dataframe.")
-        # content = df.loc[:, "content"]
+    newspaper = _check_newspaper(newspaper)
+    name, json_file = NEWSPAPERS[newspaper]
+    logger.info(f"starting preprocessing newspaper '{name}'.")
+    with metrics.stage(f'preprocess/{newspaper}/read_json') as stage:
+        # the dates are parsed with the newspaper's format below instead of read_json's guessing
+        df = pd.read_json(json_file, convert_dates=False)
+        df['date'] = normalise_dates(df['date'], _canonical_newspaper(newspaper))
+        stage.items_out(documents=len(df))
+    logger.info("transformed JSON to dataframe.")
 
-    else:
-        raise ValueError('Input newspaper is not processable')
-
-    playerlist = fetch_playerlist()
+    with metrics.stage(f'preprocess/{newspaper}/fetch_playerlist') as stage:
+        playerlist = fetch_playerlist()
+        stage.items_out(players=len(playerlist))
     if 'author' in df.columns:
         df = df.drop('author', axis=1)
+    if dedup:
+        # imported here, so that importing this module does not load SciPy
+        from dedup import deduplicate, deduplicate_across
+        with metrics.stage(f'preprocess/{newspaper}/dedup', documents=len(df)) as stage:
+            df, merged = deduplicate(df, threshold=dedup_threshold, mode=dedup)
+            logger.info(f"{'marked' if dedup == 'mark' else 'merged'} {merged} near-duplicate articles")
+            stage.items_out(merged=merged)
+            if dedup_across:
+                df, syndicated = deduplicate_across(df, _canonical_newspaper(newspaper), _other_newspapers(newspaper),
+                                                    threshold=dedup_threshold, mode=dedup)
+                logger.info(f"{'marked' if dedup == 'mark' else 'dropped'} {syndicated} articles with a "
+                            f"near-duplicate in another newspaper")
+                stage.items_out(syndicated=syndicated)
+            stage.items_out(documents=len(df))
     # preprocessing starts here
-    df['sentences'] = df['content'].apply(lambda x: nltk.sent_tokenize(x))
-    print("tokenised into sentences.")
-    # Tokenize each document into words and remove punctuation
-    df['tokens'] = df['content'].apply(lambda x: [word.lower() for word in word_tokenize(x) if word not in punctuation])
-    print("tokenised into words.")
-
-    df['article_length'] = df['tokens'].apply(len)
+    lemma_cache = LemmaCache.load(lemma_cache_file) if lemma_cache_file else LemmaCache()
+    with metrics.stage(f'preprocess/{newspaper}/document_stages', documents=len(df), workers=workers) as stage:
+        df, counts, lemma_cache = _run_document_stages(df, playerlist, workers=workers, executor=executor,
+                                                       lemma_cache=lemma_cache, pos_aware=pos_aware)
+        stage.items_out(**counts, lemma_cache_hits=lemma_cache.hits, lemma_cache_misses=lemma_cache.misses)
     # Calculate the mean of the `article_length` column
-    mean_article_length = df['article_length'].mean()
-    print(f"Mean article length: {mean_article_length}")
-
-    print(f"number of tokens: {len(df['tokens'].explode())}")
-    # Remove stopwords
-    stopwords_list = stopwords.words('english')
-    df['tokens'] = df['tokens'].apply(lambda x: [word for word in x if word not in stopwords_list])
-    print("removed stopwords.")
-    print(f"number of tokens: {len(df['tokens'].explode())}")
-    # Remove symbols
-    df['tokens'] = df['tokens'].apply(lambda x: [word for word in x if word.isalpha()])
-    print("removed symbols.")
-    print(f"number of tokens: {len(df['tokens'].explode())}")
-    df['pos_tags'] = df['tokens'].apply(lambda x: nltk.pos_tag(x))
-    print("assigned pos tags.")
-    # lemmatise each token
-    lemmatiser = WordNetLemmatizer()
-    df['lemmas'] = df['tokens'].apply(lambda x: [lemmatiser.lemmatize(token) for token in x])
-    print("lemmatised tokens.")
-
-    all_tokens = [token for doc in df['lemmas'] for token in doc]
-    # Create a set to remove duplicates and get the vocabulary
-    print(f"Vocabulary without stopwords and player names: {len(set(all_tokens)-set(playerlist))}")
-
-    print(f"number of tokens: {len(df['lemmas'].explode())}")
-    df['lemmas'] = df['lemmas'].apply(lambda x: [token for token in x if token not in playerlist])
-    print("removed playerlist tokens.")
-
-    print(f"number of tokens: {len(df['lemmas'].explode())}")
-    # Convert the list of lemmas back to text
-    df['lemmatised_text'] = df['lemmas'].apply(lambda x: ' '.join(x))
-    print("rejoined text with lemmas.")
+    logger.info(f"tokenised, tagged and lemmatised {len(df)} articles, mean article length: "
+                f"{df['article_length'].mean()}")
+    logger.info(f"number of tokens: {counts['tokens']}, without stopwords: {counts['without_stopwords']}, "
+                f"without symbols: {counts['without_symbols']}, without player names: {counts['without_players']}")
+    logger.info(f"lemma cache: {lemma_cache.hits} hits, {lemma_cache.misses} misses, {len(lemma_cache)} entries")
+    if lemma_cache_file:
+        lemma_cache.save(lemma_cache_file)
+
+    # counting the vocabulary is a pass over all lemmas, so only do it if someone looks at it
+    if metrics.enabled or logger.isEnabledFor(logging.INFO):
+        with metrics.stage(f'preprocess/{newspaper}/vocabulary', documents=len(df)) as stage:
+            # player names are already filtered out, so the remaining lemmas are the vocabulary without them
+            vocabulary = {token for doc in df['lemmas'] for token in doc}
+            stage.items_out(vocabulary=len(vocabulary))
+        logger.info(f"Vocabulary without stopwords and player names: {len(vocabulary)}")
 
     if rare:
-        print("rare tokens not removed as rare == TRUE")
+        logger.info("rare tokens not removed as rare == TRUE")
     else:
-        # Get a list of all tokens
-        all_tokens = [token for doc in df['lemmas'] for token in doc]
-        # Create a Counter object to count the frequency of each token
-        token_counts = Counter(all_tokens)
-        # Get a list of tokens that appear less than 10 times
-        rare_tokens = [token for token, count in token_counts.items() if count < 10]
-        print(f"number of tokens appearing less than ten times: {len(rare_tokens)}")
-        # Filter out rare tokens
-        print(f"number of tokens: {len(df['lemmas'].explode())}")
-        df['lemmas'] = [[token for token in doc if token not in rare_tokens] for doc in df['lemmas']]
-        print("removed rare tokens.")
+        with metrics.stage(f'preprocess/{newspaper}/remove_rare_tokens', tokens=counts['without_players']) as stage:
+            rare_tokens, n_tokens = find_rare_tokens(df['lemmas'], rare_threshold)
+            df = _drop_lemmas(df, rare_tokens)
+            stage.items_out(tokens=n_tokens, rare_types=len(rare_tokens))
+        logger.info(f"removed {len(rare_tokens)} tokens appearing less than {rare_threshold} times, "
+                    f"number of tokens: {n_tokens}")
+
+    if collocations > 0:
+        # imported here, so that importing this module does not load SciPy
+        from collocations import compound_collocations
+        with metrics.stage(f'preprocess/{newspaper}/collocations', documents=len(df)) as stage:
+            compounded, table = compound_collocations(df['lemmas'], min_count=collocation_min_count,
+                                                      top=collocations, sentence_lengths=df['sentence_lengths'])
+            aligned = [_align_compounds(*doc) for doc in zip(df['lemmas'], df['lemma_tags'], df['sentence_lengths'],
+                                                              compounded)]
+            df['lemmas'] = compounded
+            df['lemmatised_text'] = [' '.join(doc) for doc in compounded]
+            df['lemma_tags'] = [lemma_tags for lemma_tags, _ in aligned]
+            df['sentence_lengths'] = [sentence_lengths for _, sentence_lengths in aligned]
+            stage.items_out(collocations=len(table))
+        logger.info(f"compounded {len(table)} collocations, e.g. {', '.join(table['collocation'].head(5))}")
 
     # Remove rows where there are no tokens left
     df = df[df['lemmas'].map(len) > 0]
-    print(f"number of tokens: {len(df['lemmas'].explode())}")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"number of tokens: {sum(_exploded_length(len(doc)) for doc in df['lemmas'])}")
 
-    if csv == True:
-        if rare == True:
-            name = f'{newspaper}_rare.csv'
-            df.to_csv(name, index=False)
-        else:
-            name = f'{newspaper}.csv'
-            df.to_csv(name, index=False)
+    if csv == True or parquet == True or partitioned == True:
+        stem = f'{newspaper}_rare' if rare == True else newspaper
+        with metrics.stage(f'preprocess/{newspaper}/write', documents=len(df)):
+            if parquet == True:
+                name = f'{stem}.parquet'
+                save_corpus(df, name)
+                logger.info(f"Created file '{name}'.")
+            if partitioned == True:
+                months = save_partitioned(df, stem)
+                logger.info(f"Created {len(months)} month partitions of '{stem}'.")
+            if csv == True:
+                name = f'{stem}.csv'
+                df.to_csv(name, index=False)
+                logger.info(f"Created file '{name}'.")
 
-        return print(f"Created file '{name}'.")
+        return None
     else:
         return df
+
+
+def preprocess_all(newspapers=("times", "sun", "mail", "guardian"), csv: bool = False, rare: bool = False,
+                   workers: int = 1, rare_threshold: int = 10, pos_aware: bool = True,
+                   lemma_cache_file: str = None, parquet: bool = False, collocations: int = 0,
+                   collocation_min_count: int = 25, dedup: str = None, dedup_threshold: float = 0.8,
+                   dedup_across: bool = False, partitioned: bool = False):
+    """
+        Preprocesses several newspapers in one call, sharing a single process pool between them.
+
+        Parameters:
+            newspapers (iterable of str, optional): The newspapers to preprocess. Defaults to all four.
+            csv (bool, optional): If True, saves each resulting DataFrame to a CSV file. Defaults to False.
+            parquet (bool, optional): If True, saves each resulting DataFrame to a Parquet file. Defaults to False.
+            rare (bool, optional): If True, rare tokens are not removed. Defaults to False.
+            workers (int, optional): Number of worker processes in the shared pool. Defaults to 1 (serial).
+            rare_threshold (int, optional): Tokens appearing less than this many times count as rare. Defaults to 10.
+            pos_aware (bool, optional): Whether to lemmatise with WordNet parts of speech. Defaults to True.
+            lemma_cache_file (str, optional): JSON file the lemma cache is shared through. Defaults to None.
+            collocations (int, optional): Number of collocations to join per newspaper. Defaults to 0 (none).
+            collocation_min_count (int, optional): Minimum number of occurrences of a collocation. Defaults to 25.
+            dedup (str, optional): 'collapse' or 'mark' near-duplicate articles. Defaults to None (keep them).
+            dedup_threshold (float, optional): Minimum Jaccard similarity of near-duplicates. Defaults to 0.8.
+            dedup_across (bool, optional): Also deduplicate across the newspapers. Defaults to False.
+            partitioned (bool, optional): Also save each DataFrame partitioned by month. Defaults to False.
+
+        Returns:
+            dict: Maps each newspaper name to the return value of preprocess() for it.
+    """
+    if workers <= 1:
+        return {newspaper: preprocess(newspaper, csv=csv, rare=rare, rare_threshold=rare_threshold,
+                                      pos_aware=pos_aware, lemma_cache_file=lemma_cache_file,
+                                      parquet=parquet, collocations=collocations,
+                                      collocation_min_count=collocation_min_count, dedup=dedup,
+                                      dedup_threshold=dedup_threshold, dedup_across=dedup_across,
+                                      partitioned=partitioned)
+                for newspaper in newspapers}
+
+    with _process_pool(workers) as pool:
+        return {newspaper: preprocess(newspaper, csv=csv, rare=rare, workers=workers, executor=pool,
+                                      rare_threshold=rare_threshold, pos_aware=pos_aware,
+                                      lemma_cache_file=lemma_cache_file, parquet=parquet,
+                                      collocations=collocations, collocation_min_count=collocation_min_count,
+                                      dedup=dedup, dedup_threshold=dedup_threshold, dedup_across=dedup_across,
+                                      partitioned=partitioned)
+                for newspaper in newspapers}
+
+
+def preprocess_chunked(newspaper: str, chunksize: int = 1000, csv: bool = False, parquet: bool = True,
+                       rare: bool = False, rare_threshold: int = 10, workers: int = 1, pos_aware: bool = True,
+                       lemma_cache_file: str = None, json_file: str = None):
+    """
+        Preprocesses a newspaper like preprocess(), but streams the articles from the JSON file in chunks and writes the
+        results incrementally, so memory stays bounded by the chunk size regardless of the size of the corpus.
+        The first pass preprocesses the chunks into a staging Parquet file and only keeps the corpus-wide token counts
+        in memory; the second pass streams the staged chunks, removes rare tokens and writes the output files.
+
+        Parameters:
+            newspaper (str): Name of the newspaper, one of "times", "sun", "mail" or "guardian".
+            chunksize (int, optional): Number of articles per chunk. Defaults to 1000.
+            csv (bool, optional): If True, writes '<newspaper>.csv'. Defaults to False.
+            parquet (bool, optional): If True, writes '<newspaper>.parquet'. Defaults to True.
+            rare (bool, optional): If True, rare tokens are not removed (and the files get the '_rare' suffix).
+                                   Defaults to False.
+            rare_threshold (int, optional): Tokens appearing less than this many times count as rare. Defaults to 10.
+            workers (int, optional): Number of processes each chunk is sharded across. Defaults to 1 (serial).
+            pos_aware (bool, optional): Whether to lemmatise with WordNet parts of speech. Defaults to True.
+            lemma_cache_file (str, optional): JSON file the lemma cache is loaded from and saved to. Defaults to None.
+            json_file (str, optional): The article file to read, a JSON array or JSON lines (scrapy output).
+                                       Defaults to the newspaper's '<newspaper>_articles.json'.
+
+        Raises:
+            ValueError: If the 'newspaper' argument is not supported or neither csv nor parquet is True.
+
+        Returns:
+            list of str: The names of the files written.
+    """
+    newspaper = _check_newspaper(newspaper)
+    if not csv and not parquet:
+        raise ValueError('preprocess_chunked() writes its output to files, set csv or parquet to True.')
+    name, default_json_file = NEWSPAPERS[newspaper]
+    json_file = json_file or default_json_file
+    stem = f'{newspaper}_rare' if rare else newspaper
+    staging_file = f'{stem}.staging.parquet'
+    logger.info(f"starting chunked preprocessing newspaper '{name}'.")
+
+    playerlist = fetch_playerlist()
+    lemma_cache = LemmaCache.load(lemma_cache_file) if lemma_cache_file else LemmaCache()
+    counts = Counter()
+    token_counts = Counter()
+    n_articles = total_length = 0
+
+    # first pass: per-document stages, chunk by chunk, keeping only the token counts
+    pool = _process_pool(workers) if workers > 1 else None
+    try:
+        with CorpusWriter(staging_file) as writer:
+            for chunk in iter_article_chunks(json_file, chunksize):
+                chunk['date'] = normalise_dates(chunk['date'], _canonical_newspaper(newspaper))
+                if 'author' in chunk.columns:
+                    chunk = chunk.drop('author', axis=1)
+                with metrics.stage(f'preprocess_chunked/{newspaper}/document_stages', documents=len(chunk)) as stage:
+                    chunk, chunk_counts, lemma_cache = _run_document_stages(chunk, playerlist, workers=workers,
+                                                                            executor=pool, lemma_cache=lemma_cache,
+                                                                            pos_aware=pos_aware)
+                    stage.items_out(**chunk_counts)
+                counts.update(chunk_counts)
+                token_counts.update(token for doc in chunk['lemmas'] for token in doc)
+                n_articles += len(chunk)
+                total_length += int(chunk['article_length'].sum())
+                writer.write(chunk)
+                logger.info(f"preprocessed {n_articles} articles.")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if not n_articles:
+        logger.info(f"no articles found in '{json_file}'.")
+        return []
+
+    logger.info(f"Mean article length: {total_length / n_articles}")
+    for stage_name in STAGES:
+        logger.info(f"number of tokens ({stage_name}): {counts[stage_name]}")
+    logger.info(f"lemma cache: {lemma_cache.hits} hits, {lemma_cache.misses} misses, {len(lemma_cache)} entries")
+    if lemma_cache_file:
+        lemma_cache.save(lemma_cache_file)
+    logger.info(f"Vocabulary without stopwords and player names: {len(token_counts)}")
+
+    if rare:
+        rare_tokens = frozenset()
+        logger.info("rare tokens not removed as rare == TRUE")
+    else:
+        rare_tokens = frozenset(token for token, count in token_counts.items() if count < rare_threshold)
+        logger.info(f"number of tokens appearing less than {rare_threshold} times: {len(rare_tokens)}")
+
+    # second pass: remove rare tokens and empty documents from the staged chunks and write the output
+    files = []
+    n_tokens = 0
+    parquet_writer = CorpusWriter(f'{stem}.parquet') if parquet else None
+    if csv and os.path.exists(f'{stem}.csv'):
+        os.remove(f'{stem}.csv')
+    try:
+        with metrics.stage(f'preprocess_chunked/{newspaper}/write', documents=n_articles) as stage:
+            for chunk in iter_corpus(staging_file, batch_size=chunksize):
+                chunk = _drop_lemmas(chunk, rare_tokens)
+                chunk = chunk[chunk['lemmas'].map(len) > 0]
+                n_tokens += sum(_exploded_length(len(doc)) for doc in chunk['lemmas'])
+                if parquet_writer is not None:
+                    parquet_writer.write(chunk)
+                if csv:
+                    chunk.to_csv(f'{stem}.csv', mode='a', header=not os.path.exists(f'{stem}.csv'), index=False)
+            stage.items_out(tokens=n_tokens)
+    finally:
+        if parquet_writer is not None:
+            parquet_writer.close()
+        os.remove(staging_file)
+    logger.info(f"number of tokens: {n_tokens}")
+
+    for file_name, wanted in ((f'{stem}.parquet', parquet), (f'{stem}.csv', csv)):
+        if wanted and os.path.exists(file_name):
+            files.append(file_name)
+            logger.info(f"Created file '{file_name}'.")
+    return files
+
+
+# bump when the stored per-article results change, so existing incremental stores are rebuilt
+STORE_VERSION = 4
+
+
+def article_keys(df):
+    """
+        Computes a key for every article from a hash of its title, date and content, so unchanged articles can be
+        recognised between runs.
+
+        Parameters:
+            df (pandas DataFrame): A DataFrame of articles with 'title', 'date' and 'content' columns.
+
+        Returns:
+            list of str: The SHA-1 hex digest of every article, in row order.
+    """
+    return [hashlib.sha1('\x1f'.join(map(str, values)).encode('utf8')).hexdigest()
+            for values in zip(df['title'], df['date'], df['content'])]
+
+
+def _store_fingerprint(playerlist, pos_aware):
+    """Identifies everything besides the article itself that the stored per-article results depend on."""
+    players = hashlib.sha1(' '.join(sorted(playerlist)).encode('utf8')).hexdigest()
+    return f"{STORE_VERSION}-{players}-{pos_aware}"
+
+
+def _load_store(store_dir, fingerprint):
+    """
+        Loads the per-article results and the running token counts of an incremental store.
+
+        Returns:
+            tuple: The stored articles and a Counter of their lemmas; empty if there is no store yet or it was built with
+                   a different fingerprint.
+    """
+    meta_file = os.path.join(store_dir, 'meta.json')
+    articles_file = os.path.join(store_dir, 'articles.parquet')
+    if os.path.isfile(meta_file) and os.path.isfile(articles_file):
+        with open(meta_file, encoding='utf8') as file:
+            meta = json.load(file)
+        if meta['fingerprint'] == fingerprint:
+            return load_corpus(articles_file), Counter(meta['token_counts'])
+        logger.info("incremental store was built with other settings or player list, rebuilding it.")
+    return pd.DataFrame({'key': pd.Series(dtype=object), 'lemmas': pd.Series(dtype=object)}), Counter()
+
+
+def _save_store(store_dir, articles, token_counts, fingerprint):
+    """Writes the per-article results and the running token counts of an incremental store."""
+    os.makedirs(store_dir, exist_ok=True)
+    save_corpus(articles, os.path.join(store_dir, 'articles.parquet'))
+    with open(os.path.join(store_dir, 'meta.json'), 'w', encoding='utf8') as file:
+        json.dump({'fingerprint': fingerprint, 'token_counts': token_counts}, file)
+
+
+def preprocess_incremental(newspaper: str, store_dir: str = None, csv: bool = False, parquet: bool = False,
+                           rare: bool = False, rare_threshold: int = 10, workers: int = 1, pos_aware: bool = True,
+                           lemma_cache_file: str = None, partitioned: bool = False):
+    """
+        Preprocesses a newspaper like preprocess(), but only tokenises, tags and lemmatises articles which are new or
+        changed since the last run. Every article is keyed by a hash of its title, date and content (see
+        article_keys() ); the per-article results and the corpus-wide lemma counts are kept in store_dir, so the rare
+        token filter can be re-applied without re-tokenising anything. A run costs in proportion to the new articles.
+
+        Parameters:
+            newspaper (str): Name of the newspaper, one of "times", "sun", "mail" or "guardian".
+            store_dir (str, optional): Directory of the incremental store. Defaults to '<newspaper>_store'.
+            csv (bool, optional): If True, saves the resulting DataFrame to a CSV file. Defaults to False.
+            parquet (bool, optional): If True, saves the resulting DataFrame to a Parquet file. Defaults to False.
+            rare (bool, optional): If True, rare tokens are not removed. Defaults to False.
+            rare_threshold (int, optional): Tokens appearing less than this many times count as rare. Defaults to 10.
+            workers (int, optional): Number of processes the new articles are sharded across. Defaults to 1.
+            pos_aware (bool, optional): Whether to lemmatise with WordNet parts of speech. Defaults to True.
+            lemma_cache_file (str, optional): JSON file the lemma cache is loaded from and saved to. Defaults to None.
+            partitioned (bool, optional): If True, also saves the resulting DataFrame partitioned by month (see
+                                          corpus_store.save_partitioned() ). Defaults to False.
+
+        Raises:
+            ValueError: If the 'newspaper' argument is not supported.
+
+        Returns:
+            pandas.DataFrame or None: The preprocessed DataFrame in the order of the JSON file, or None if it was saved
+                                      to a file.
+    """
+    newspaper = _check_newspaper(newspaper)
+    name, json_file = NEWSPAPERS[newspaper]
+    store_dir = store_dir or f'{newspaper}_store'
+    logger.info(f"starting incremental preprocessing newspaper '{name}'.")
+    df = pd.read_json(json_file, convert_dates=False)
+    if 'author' in df.columns:
+        df = df.drop('author', axis=1)
+    df['key'] = article_keys(df)
+    df['date'] = normalise_dates(df['date'], _canonical_newspaper(newspaper))
+
+    playerlist = fetch_playerlist()
+    fingerprint = _store_fingerprint(playerlist, pos_aware)
+    stored, token_counts = _load_store(store_dir, fingerprint)
+
+    # articles which changed or disappeared from the JSON file leave the store and the running counts
+    keys = set(df['key'])
+    removed = stored[~stored['key'].isin(keys)]
+    for doc in removed['lemmas']:
+        token_counts.subtract(doc)
+    stored = stored[stored['key'].isin(keys)]
+    new = df[~df['key'].isin(set(stored['key']))].drop_duplicates('key')
+    logger.info(f"reusing {len(stored)} unchanged articles, preprocessing {len(new)} new or changed articles, "
+                f"dropping {len(removed)} removed articles.")
+
+    if len(new):
+        lemma_cache = LemmaCache.load(lemma_cache_file) if lemma_cache_file else LemmaCache()
+        with metrics.stage(f'preprocess_incremental/{newspaper}/document_stages', documents=len(new),
+                           reused=len(stored)) as stage:
+            new, counts, lemma_cache = _run_document_stages(new.copy(), playerlist, workers=workers,
+                                                            lemma_cache=lemma_cache, pos_aware=pos_aware)
+            stage.items_out(**counts)
+        if lemma_cache_file:
+            lemma_cache.save(lemma_cache_file)
+        for doc in new['lemmas']:
+            token_counts.update(doc)
+        stored = pd.concat([stored, new], ignore_index=True)[new.columns]
+    # drop tokens whose count went down to zero
+    token_counts = +token_counts
+    _save_store(store_dir, stored, token_counts, fingerprint)
+    logger.info(f"Vocabulary without stopwords and player names: {len(token_counts)}")
+
+    # back to the order of the JSON file
+    df = stored.set_index('key').loc[df['key']].reset_index(drop=True)
+    if rare:
+        logger.info("rare tokens not removed as rare == TRUE")
+    else:
+        rare_tokens = frozenset(token for token, count in token_counts.items() if count < rare_threshold)
+        logger.info(f"number of tokens appearing less than {rare_threshold} times: {len(rare_tokens)}")
+        df = _drop_lemmas(df, rare_tokens)
+        logger.info("removed rare tokens.")
+
+    # Remove rows where there are no tokens left
+    df = df[df['lemmas'].map(len) > 0]
+    logger.info(f"number of tokens: {sum(_exploded_length(len(doc)) for doc in df['lemmas'])}")
+
+    if csv or parquet or partitioned:
+        stem = f'{newspaper}_rare' if rare else newspaper
+        if parquet:
+            save_corpus(df, f'{stem}.parquet')
+            logger.info(f"Created file '{stem}.parquet'.")
+        if partitioned:
+            months = save_partitioned(df, stem)
+            logger.info(f"Created {len(months)} month partitions of '{stem}'.")
+        if csv:
+            df.to_csv(f'{stem}.csv', index=False)
+            logger.info(f"Created file '{stem}.csv'.")
+        return None
+    return df
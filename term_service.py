@@ -0,0 +1,404 @@
+"""
+Long-running HTTP service answering term queries over the four preprocessed newspapers. Every corpus is read and
+fitted once into a TermIndex: an inverted index (term -> postings of document ids and term frequencies), the TF-IDF
+postings, the IDF and rank of every term and the month x term table of monthly_tfidf_table(), so a query is a few
+array lookups instead of a csv_to_tfidf() refit. When a preprocessed file changes, its index is rebuilt in a thread
+and swapped in, while the other newspapers keep answering.
+
+Run from the repository root with
+
+    python term_service.py [--host 127.0.0.1] [--port 8765] [--reload-interval 5]
+
+Queries (GET, answered as JSON, per newspaper unless restricted with newspaper=Sun):
+
+    /rank?term=lgbt                    position of the term as in TermRankEngine, or "absent"
+    /months?term=lgbt                  mean normalised TF-IDF score per month as in TfidfCube
+    /top?term=lgbt&k=10                the articles with the highest TF-IDF score of the term
+    /prefix?q=qat&limit=20             vocabulary terms starting with q and their document frequency
+    /stats                             sizes and build times of the indexes
+    /reload                            rebuild the indexes of the changed (or the given) newspapers now
+
+`python -m benchmarks.bench_service --spawn` measures the latency under concurrent load.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
+
+from corpus_store import corpus_file, read_corpus
+from instrumentation import metrics
+from methods import ABSENT, NEWSPAPER_CSV_FILES, SparseTermMatrix, _monthly_aggregates
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+# the largest code point, so every term starting with a prefix sorts before prefix + MAX_CHAR
+MAX_CHAR = '\U0010ffff'
+
+
+class TermIndex:
+    """
+        The query tables of one newspaper, fitted once from its preprocessed file.
+
+        Attributes:
+            newspaper (str): The newspaper name, e.g. "Guardian".
+            file_path (str): The preprocessed file the index was built from.
+            mtime (float): Modification time of file_path when it was read.
+            terms (numpy array of str): The vocabulary in sorted order; a term's position is its term id.
+            doc_freq (numpy array of int): Number of documents containing each term.
+            idf (numpy array of float): The IDF of each term, as used by TfidfTransformer.
+            rank (numpy array of int): Position of each term when ordered by descending total TF-IDF score, like the
+                                       columns of csv_to_tfidf().
+            postings (scipy.sparse.csc_matrix): Documents x terms counts; column t holds the ids (indices) and term
+                                                frequencies (data) of the documents containing term t.
+            tfidf (scipy.sparse.csc_matrix): Documents x terms TF-IDF scores, in the same layout.
+            months (numpy array of str): The 'YYYY-MM' months of the monthly table.
+            monthly (numpy array of float32): Months x terms mean normalised TF-IDF score, see monthly_tfidf_table().
+            documents (pandas DataFrame): 'title' and 'date' of every document, in document id order.
+            build_seconds (float): Time it took to build the index.
+    """
+
+    def __init__(self, newspaper, file_path, mtime, terms, counts, tfidf, idf, documents):
+        self.newspaper = newspaper
+        self.file_path = file_path
+        self.mtime = mtime
+        self.terms = np.asarray(terms, dtype=str)
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+        self.postings = counts.tocsc()
+        self.postings.sort_indices()
+        self.tfidf = tfidf.tocsc()
+        self.tfidf.sort_indices()
+        self.doc_freq = np.diff(self.postings.indptr)
+        self.idf = np.asarray(idf)
+
+        sums = SparseTermMatrix(tfidf, self.terms).column_sums()
+        order = sums.index.get_indexer(sums.sort_values(ascending=False).index)
+        self.rank = np.empty(len(self.terms), dtype=np.int64)
+        self.rank[order] = np.arange(len(self.terms))
+
+        aggregates = _monthly_aggregates(counts, tfidf, documents['date'])
+        self.months = aggregates['months']
+        self.monthly = aggregates['tfidf']
+        self.documents = documents
+        self.build_seconds = None
+
+    @classmethod
+    def build(cls, newspaper, file_path):
+        """
+            Reads a preprocessed file and fits its index.
+
+            Parameters:
+                newspaper (str): The newspaper name.
+                file_path (str): The preprocessed CSV or Parquet file.
+
+            Returns:
+                TermIndex: The index.
+        """
+        start = time.perf_counter()
+        mtime = os.path.getmtime(file_path)
+        with metrics.stage('term_service/build', newspaper=newspaper) as stage:
+            df = read_corpus(file_path, columns=['title', 'date', 'lemmatised_text'])
+            vectoriser = CountVectorizer()
+            counts = vectoriser.fit_transform(df['lemmatised_text'])
+            transformer = TfidfTransformer()
+            tfidf = transformer.fit_transform(counts)
+            documents = df[['title', 'date']].reset_index(drop=True)
+            index = cls(newspaper, file_path, mtime, vectoriser.get_feature_names_out(), counts, tfidf,
+                        transformer.idf_, documents)
+            stage.items_out(documents=counts.shape[0], terms=counts.shape[1], postings=counts.nnz)
+        index.build_seconds = time.perf_counter() - start
+        return index
+
+    def term_id(self, term):
+        """Returns the id of a term, or None if it does not occur in the newspaper."""
+        return self.term_ids.get(term)
+
+    def postings_of(self, term):
+        """
+            Returns the postings of a term.
+
+            Returns:
+                tuple: The document ids and the term frequencies, as numpy arrays (empty if the term does not occur).
+        """
+        term_id = self.term_id(term)
+        if term_id is None:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+        start, end = self.postings.indptr[term_id], self.postings.indptr[term_id + 1]
+        return self.postings.indices[start:end], self.postings.data[start:end]
+
+    def rank_of(self, term):
+        """Returns the position of a term as written to the compare files, or ABSENT."""
+        term_id = self.term_id(term)
+        return ABSENT if term_id is None else int(self.rank[term_id])
+
+    def month_scores(self, term):
+        """Returns the mean normalised TF-IDF score of a term per month as a dict, or None if it does not occur."""
+        term_id = self.term_id(term)
+        if term_id is None:
+            return None
+        return dict(zip(self.months.tolist(), self.monthly[:, term_id].tolist()))
+
+    def top_documents(self, term, k=10):
+        """
+            Returns the k documents with the highest TF-IDF score of a term.
+
+            Returns:
+                list of dict: 'document' (id), 'title', 'date', 'tf' and 'tfidf' of each document, best first.
+        """
+        term_id = self.term_id(term)
+        if term_id is None or k <= 0:
+            return []
+        start, end = self.tfidf.indptr[term_id], self.tfidf.indptr[term_id + 1]
+        scores = self.tfidf.data[start:end]
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best], kind='stable')]
+        else:
+            best = np.argsort(-scores, kind='stable')
+        doc_ids = self.tfidf.indices[start:end][best]
+        documents, tf = self.postings_of(term)
+        tf = tf[np.searchsorted(documents, doc_ids)]
+        return [{'document': int(doc), 'title': str(self.documents.at[doc, 'title']),
+                 'date': str(self.documents.at[doc, 'date']), 'tf': int(count), 'tfidf': float(score)}
+                for doc, count, score in zip(doc_ids, tf, scores[best])]
+
+    def prefix(self, prefix, limit=20):
+        """
+            Returns the first terms (alphabetically) of the vocabulary starting with prefix.
+
+            Returns:
+                list of tuple: (term, document frequency) pairs.
+        """
+        start = np.searchsorted(self.terms, prefix, side='left')
+        end = min(np.searchsorted(self.terms, prefix + MAX_CHAR, side='left'), start + max(limit, 0))
+        return [(str(term), int(freq)) for term, freq in zip(self.terms[start:end], self.doc_freq[start:end])]
+
+    def stats(self):
+        """Returns the size and build information of the index."""
+        return {'file': self.file_path, 'documents': int(self.postings.shape[0]), 'terms': len(self.terms),
+                'postings': int(self.postings.nnz), 'months': len(self.months),
+                'build_seconds': self.build_seconds, 'mtime': self.mtime}
+
+
+class TermService:
+    """
+        Holds a TermIndex per newspaper and answers the queries of the HTTP service. An index is replaced as a whole
+        when its file is rebuilt, so a query always sees one consistent index.
+
+        Attributes:
+            files (dict): Maps each newspaper name to its preprocessed CSV file (the Parquet version is used if it
+                          exists, see corpus_file() ).
+            indexes (dict): Maps each loaded newspaper name to its TermIndex.
+    """
+
+    def __init__(self, files=None):
+        self.files = dict(NEWSPAPER_CSV_FILES if files is None else files)
+        self.indexes = {}
+        self._reload_lock = None
+
+    def load(self, newspaper):
+        """Builds the index of a newspaper from its current file and swaps it in."""
+        file_path = corpus_file(self.files[newspaper])
+        index = TermIndex.build(newspaper, file_path)
+        self.indexes[newspaper] = index
+        logger.info(f"{newspaper}: indexed {index.stats()['documents']} documents, {len(index.terms)} terms "
+                    f"from {file_path} in {index.build_seconds:.1f}s")
+        return index
+
+    def load_all(self):
+        """
+            Builds the indexes of all newspapers whose file exists. A newspaper whose file is missing or cannot be read
+            (truncated Parquet file, CSV without the needed columns, ...) is logged and skipped, so the others are still
+            served.
+        """
+        for newspaper in self.files:
+            try:
+                self.load(newspaper)
+            except FileNotFoundError as error:
+                logger.warning(f"{newspaper}: not loaded, {error}")
+            except (OSError, ValueError, KeyError, SyntaxError) as error:
+                logger.error(f"{newspaper}: not loaded, reading {corpus_file(self.files[newspaper])} failed: "
+                             f"{error!r}")
+
+    def changed(self):
+        """Returns the newspapers whose preprocessed file was rebuilt (or appeared) since it was indexed."""
+        changed = []
+        for newspaper, name in self.files.items():
+            file_path = corpus_file(name)
+            if not os.path.isfile(file_path):
+                continue
+            index = self.indexes.get(newspaper)
+            if index is None or index.file_path != file_path or os.path.getmtime(file_path) != index.mtime:
+                changed.append(newspaper)
+        return changed
+
+    async def reload(self, newspapers=None):
+        """
+            Rebuilds the indexes of the given (by default the changed) newspapers in a worker thread, so queries are
+            answered from the old indexes in the meantime.
+
+            Returns:
+                list of str: The newspapers which were reloaded.
+        """
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+        async with self._reload_lock:
+            newspapers = self.changed() if newspapers is None else list(newspapers)
+            loop = asyncio.get_running_loop()
+            reloaded = []
+            for newspaper in newspapers:
+                try:
+                    await loop.run_in_executor(None, self.load, newspaper)
+                    reloaded.append(newspaper)
+                except Exception as error:
+                    # keep answering from the old index
+                    logger.error(f"{newspaper}: reload failed: {error!r}")
+            return reloaded
+
+    async def watch(self, interval=5.0):
+        """Checks the preprocessed files every interval seconds and reloads the changed ones."""
+        while True:
+            await asyncio.sleep(interval)
+            if self.changed():
+                await self.reload()
+
+    def _selected(self, params):
+        newspaper = params.get('newspaper')
+        if newspaper is None:
+            return list(self.indexes.items())
+        if newspaper not in self.indexes:
+            raise LookupError(f"unknown or unloaded newspaper {newspaper!r}")
+        return [(newspaper, self.indexes[newspaper])]
+
+    def query(self, path, params):
+        """
+            Answers one query.
+
+            Parameters:
+                path (str): The endpoint, e.g. '/rank'.
+                params (dict): The query parameters, one value each.
+
+            Returns:
+                tuple: The HTTP status and the JSON-serialisable answer.
+        """
+        try:
+            if path == '/stats':
+                return HTTPStatus.OK, {newspaper: index.stats() for newspaper, index in self.indexes.items()}
+            if path == '/prefix':
+                prefix, limit = params.get('q', ''), int(params.get('limit', 20))
+                return HTTPStatus.OK, {'prefix': prefix, 'terms': {newspaper: index.prefix(prefix, limit)
+                                                                    for newspaper, index in self._selected(params)}}
+            if path not in ('/rank', '/months', '/top'):
+                return HTTPStatus.NOT_FOUND, {'error': f"unknown query {path}"}
+            term = params.get('term')
+            if not term:
+                return HTTPStatus.BAD_REQUEST, {'error': "missing parameter 'term'"}
+            term = term.lower()
+            selected = self._selected(params)
+            if path == '/rank':
+                return HTTPStatus.OK, {'term': term, 'ranks': {newspaper: index.rank_of(term)
+                                                               for newspaper, index in selected}}
+            if path == '/months':
+                return HTTPStatus.OK, {'term': term, 'months': {newspaper: index.month_scores(term)
+                                                                for newspaper, index in selected}}
+            k = int(params.get('k', 10))
+            return HTTPStatus.OK, {'term': term, 'documents': {newspaper: index.top_documents(term, k)
+                                                               for newspaper, index in selected}}
+        except LookupError as error:
+            return HTTPStatus.NOT_FOUND, {'error': str(error)}
+        except ValueError as error:
+            return HTTPStatus.BAD_REQUEST, {'error': str(error)}
+
+    async def handle_connection(self, reader, writer):
+        """Serves the HTTP/1.1 requests of one connection, keeping it open between requests."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if int(headers.get('content-length', 0)):
+                    await reader.readexactly(int(headers['content-length']))
+
+                url = urlsplit(target)
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                if method not in ('GET', 'POST'):
+                    status, answer = HTTPStatus.METHOD_NOT_ALLOWED, {'error': f"method {method} not allowed"}
+                elif url.path == '/reload':
+                    newspapers = [params['newspaper']] if 'newspaper' in params else None
+                    if newspapers and newspapers[0] not in self.files:
+                        status, answer = HTTPStatus.NOT_FOUND, {'error': f"unknown newspaper {newspapers[0]!r}"}
+                    else:
+                        status, answer = HTTPStatus.OK, {'reloaded': await self.reload(newspapers)}
+                else:
+                    status, answer = self.query(url.path, params)
+
+                keep_alive = version.strip() == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                body = json.dumps(answer).encode()
+                writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}"
+                             f"\r\n\r\n".encode() + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(service, host='127.0.0.1', port=DEFAULT_PORT, reload_interval=5.0):
+    """
+        Runs the HTTP service until cancelled.
+
+        Parameters:
+            service (TermService): The service with its indexes loaded.
+            host (str, optional): Address to listen on. Defaults to '127.0.0.1'.
+            port (int, optional): Port to listen on. Defaults to DEFAULT_PORT.
+            reload_interval (float, optional): Seconds between checks for rebuilt files, or 0 to only reload on
+                                               /reload queries. Defaults to 5.0.
+    """
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    watcher = asyncio.create_task(service.watch(reload_interval)) if reload_interval else None
+    logger.info(f"serving {', '.join(service.indexes)} on http://{host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serves rank, month, top document and prefix queries of terms.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--reload-interval', type=float, default=5.0,
+                        help="seconds between checks for rebuilt corpora, 0 to disable")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    service = TermService()
+    service.load_all()
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.reload_interval))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
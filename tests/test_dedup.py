@@ -0,0 +1,51 @@
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("scipy")
+
+import dedup
+
+STORY = ("Qatar has spent an estimated 220 billion dollars on stadiums, hotels and roads for the first World Cup held in "
+         "the Middle East, and human rights groups say thousands of migrant workers died building them")
+
+
+def test_large_buckets_give_linear_candidates_and_one_group():
+    # many copies of one story fall into the same bucket of every band
+    documents = [STORY] * 500 + [f"an unrelated article number {i} about something else entirely" for i in range(20)]
+    hashes, offsets, signatures = dedup.shingle_signatures(documents)
+    bands, rows = dedup.lsh_parameters(signatures.shape[1], 0.8)
+    candidates = dedup.lsh_candidates(signatures, bands, rows, max_bucket=8)
+    assert len(candidates) <= 500 * 7
+    assert (candidates[:, 0] < candidates[:, 1]).all()
+    labels = dedup.group_duplicates(hashes, offsets, signatures, max_bucket=8)
+    assert len(set(labels[:500])) == 1
+    assert len(set(labels[500:])) == 20 and labels[0] not in labels[500:]
+
+
+def test_small_buckets_pair_every_member():
+    signatures = np.array([[1, 2], [1, 2], [1, 2], [3, 4]], dtype=np.uint32)
+    assert dedup.lsh_candidates(signatures, bands=1, rows=2).tolist() == [[0, 1], [0, 2], [1, 2]]
+
+
+def test_deduplicate_across_with_stored_signatures(tmp_path):
+    other = tmp_path / "times_articles.json"
+    other.write_text(json.dumps([{"title": "a", "date": "2022-11-20", "content": STORY},
+                                 {"title": "b", "date": "2022-11-21", "content": "nothing in common with the rest"}]))
+    df = pd.DataFrame({"content": [STORY + " on Sunday", "a story only the Sun has"]})
+    cache_dir = str(tmp_path / "signatures")
+
+    stored = dedup.cached_signatures(str(other), cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    again = dedup.cached_signatures(str(other), cache_dir=cache_dir)
+    assert all(np.array_equal(a, b) for a, b in zip(stored, again))
+
+    marked, n_marked = dedup.deduplicate_across(df, "sun", {"times": stored, "sun": None})
+    assert n_marked == 1 and marked["syndicated"].tolist() == ["times", ""]
+    from_frames, _ = dedup.deduplicate_across(df, "sun", {"times": pd.read_json(other), "sun": None})
+    assert from_frames["syndicated"].tolist() == marked["syndicated"].tolist()
+    collapsed, n_dropped = dedup.deduplicate_across(df, "sun", {"times": stored, "sun": None}, mode="collapse")
+    assert n_dropped == 1 and collapsed["content"].tolist() == ["a story only the Sun has"]
@@ -0,0 +1,74 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("lxml")
+
+from crawler import guardian
+
+
+class _SearchHandler(BaseHTTPRequestHandler):
+    """Serves canned result pages of the content API search; server.failures lists the statuses to fail with first."""
+
+    def do_GET(self):
+        page = int(parse_qs(urlsplit(self.path).query)["page"][0])
+        self.server.requests.append(page)
+        failures = self.server.failures.get(page)
+        if failures:
+            self.send_response(failures.pop(0))
+            self.end_headers()
+            return
+        body = json.dumps({"response": {"results": [{
+            "webTitle": f"Article {page}",
+            "webPublicationDate": "2022-11-20T12:00:00Z",
+            "fields": {"body": f"<p>Page {page} <strong>body</strong></p>"},
+        }]}}).encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SearchHandler)
+    server.requests = []
+    server.failures = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _harvest(server, tmp_path):
+    return guardian.harvest(pages=[1, 2, 3], base_url=f"http://127.0.0.1:{server.server_port}/", api_key="test",
+                            work_dir=str(tmp_path / "pages"), output_file=str(tmp_path / "articles.json"),
+                            concurrency=2, rate=1000.0, cleaners=1,
+                            session=guardian.make_session(pool_size=2, retries=2, backoff=0))
+
+
+def test_harvest_retries_reports_failed_pages_and_resumes(server, tmp_path):
+    # page 2 fails once and is retried, page 3 keeps failing with a 5xx
+    server.failures = {2: [503], 3: [500, 502, 500]}
+    assert _harvest(server, tmp_path) == [3]
+    assert server.requests.count(2) == 2
+    assert server.requests.count(3) == 3
+    assert sorted(path.name for path in (tmp_path / "pages").iterdir()) == ["page_0001.json", "page_0002.json"]
+    assert not (tmp_path / "articles.json").exists()
+
+    # the second run only fetches the failed page and writes all articles in page order
+    server.requests.clear()
+    assert _harvest(server, tmp_path) == []
+    assert server.requests == [3]
+    articles = json.loads((tmp_path / "articles.json").read_text())
+    assert articles == [{"title": f"Article {page}", "date": "2022-11-20T12:00:00Z", "content": f"Page {page} body"}
+                        for page in (1, 2, 3)]
@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+pytest.importorskip("lxml")
+
+from benchmarks.bench_cleaner import extract_text, make_body
+from crawler.html_cleaner import bs4_cleanse, clean_html, clean_many
+
+# bodies as the content API's 'body' field returns them: links inside paragraphs, image and tweet embeds, rich link
+# asides, <br>, named and numeric entities, scripts and a live blog block with unclosed tags
+GUARDIAN_BODIES = [
+    '<p>Gareth Southgate&#x27;s side face <a href="https://www.theguardian.com/football/iran" '
+    'data-link-name="in body link">Iran</a> on Monday &ndash; kick-off 1pm&nbsp;GMT.</p> '
+    '<figure class="element element-image" data-media-id="5f1c"> <img src="https://media.guim.co.uk/5f1c/1000.jpg" '
+    'alt="England&#x27;s &quot;OneLove&quot; armband" width="1000" height="600" class="gu-image" /> <figcaption> '
+    '<span class="element-image__caption">Harry Kane at training.</span> '
+    '<span class="element-image__credit">Photograph: Getty</span> </figcaption> </figure> '
+    '<h2>Armband row</h2> <p>Fifa said the <strong>OneLove</strong> armband would lead to a '
+    '<em>yellow card</em>.<br>Seven European nations backed down.</p>',
+
+    '<aside class="element element-rich-link"> <p> <span>Related: </span>'
+    '<a href="https://www.theguardian.com/football/2022/nov/21/briefing">World Cup 2022 briefing</a> </p> </aside> '
+    '<figure class="element element-tweet" data-canonical-url="https://twitter.com/England/status/1"> '
+    '<blockquote class="twitter-tweet"><p lang="en" dir="ltr">Statement &amp; more '
+    '<a href="https://t.co/x">pic.twitter.com/x</a></p>&mdash; England (@England) '
+    '<a href="https://twitter.com/England/status/1">November 21, 2022</a></blockquote> '
+    '<script async src="https://platform.twitter.com/widgets.js" charset="utf-8"></script> </figure> '
+    '<ul> <li>Wales 1-1 USA</li> <li>England 6-2 Iran</li> </ul> '
+    '<script>window.guardian && track("body") < 2</script> '
+    '<p>Tickets cost &pound;220 &lt; &pound;300 &gt; nothing, said <s>Fifa</s> Qatar&#8217;s organisers.</p>',
+
+    '<div class="block-elements"><p><time datetime="2022-12-18T17:23:00Z">17.23 GMT</time> '
+    '<strong>GOAL! Argentina 3-3 France (Mbapp&eacute;, 118 min pen)</strong><br /><br />'
+    '<p>Unclosed paragraph with <em>nested <strong>tags</em> and <a href="x?a=1&b=2">a link</a>'
+    '<blockquote class="quoted"><p>&ldquo;We never gave up,&rdquo; he said.</p></blockquote>'
+    '<table><tr><td headers=" a  b " class=" score  final ">3-3</td></tr></table><hr></div>',
+]
+
+
+def test_clean_html_removes_embeds_and_unwraps_text_tags():
+    cleaned = clean_html(GUARDIAN_BODIES[0])
+    assert "<img" not in cleaned and "<a " not in cleaned and "<p>" not in cleaned
+    assert extract_text(cleaned) == ("Gareth Southgate's side face Iran on Monday – kick-off 1pm GMT. Armband row "
+                                     "Fifa said the OneLove armband would lead to a yellow card.Seven European "
+                                     "nations backed down.")
+    assert "Related" not in clean_html(GUARDIAN_BODIES[1])
+
+
+def test_clean_html_of_no_text_is_empty():
+    assert clean_html(None) == "" and clean_html(" ") == ""
+    assert clean_html(b"<p>bytes</p>") == "bytes"
+
+
+@pytest.mark.parametrize("body", GUARDIAN_BODIES)
+def test_clean_html_keeps_the_text_of_bs4_cleanse_on_guardian_bodies(body):
+    pytest.importorskip("bs4")
+    assert extract_text(clean_html(body)) == extract_text(bs4_cleanse(body))
+
+
+def test_clean_html_keeps_the_text_of_bs4_cleanse_on_generated_bodies():
+    pytest.importorskip("bs4")
+    rng = random.Random(0)
+    bodies = [make_body(rng) for _ in range(200)]
+    assert [extract_text(clean_html(body)) for body in bodies] == [extract_text(bs4_cleanse(body)) for body in bodies]
+    assert clean_many(bodies, workers=1) == [clean_html(body) for body in bodies]
@@ -0,0 +1,53 @@
+import lemmatisation
+from lemmatisation import VERB, LemmaCache
+
+
+class _Lemmatizer:
+    """Stands in for WordNetLemmatizer and records the tokens it is asked for."""
+
+    def __init__(self):
+        self.calls = []
+
+    def lemmatize(self, token, pos):
+        self.calls.append(token)
+        return token.rstrip('s')
+
+
+def _cache(monkeypatch, maxsize):
+    lemmatizer = _Lemmatizer()
+    monkeypatch.setattr(lemmatisation.nltk_resources, 'lemmatizer', lambda: lemmatizer)
+    return LemmaCache(maxsize=maxsize), lemmatizer
+
+
+def test_eviction_is_least_recently_used(monkeypatch):
+    cache, lemmatizer = _cache(monkeypatch, maxsize=2)
+    cache.lemmatize('goals')
+    cache.lemmatize('fans')
+    # the hit makes 'goals' the most recently used entry, so 'fans' is evicted for 'cups'
+    assert cache.lemmatize('goals') == 'goal'
+    cache.lemmatize('cups')
+    cache.lemmatize('goals')
+    assert lemmatizer.calls == ['goals', 'fans', 'cups']
+    cache.lemmatize('fans')
+    assert lemmatizer.calls[-1] == 'fans'
+    assert (cache.hits, cache.misses, len(cache)) == (2, 4, 2)
+
+
+def test_update_adds_worker_entries_as_most_recent(monkeypatch):
+    cache, _ = _cache(monkeypatch, maxsize=3)
+    worker = LemmaCache(maxsize=3)
+    for token in ('goals', 'fans', 'cups'):
+        cache.lemmatize(token)
+    worker.lemmatize('plays', VERB)
+    cache.update(worker)
+    assert list(cache._lemmas) == [('fans', 'n'), ('cups', 'n'), ('plays', VERB)]
+    assert cache.misses == 4
+
+
+def test_save_and_load_keep_the_most_recently_used(monkeypatch, tmp_path):
+    cache, _ = _cache(monkeypatch, maxsize=3)
+    for token in ('goals', 'fans', 'cups', 'fans'):
+        cache.lemmatize(token)
+    cache.save(str(tmp_path / 'lemmas.json'))
+    loaded = LemmaCache.load(str(tmp_path / 'lemmas.json'), maxsize=2)
+    assert list(loaded._lemmas) == [('cups', 'n'), ('fans', 'n')]
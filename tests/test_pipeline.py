@@ -0,0 +1,52 @@
+import json
+import os
+
+import pipeline
+
+
+def _fake_scrapy(found):
+    """Returns a subprocess.run stand-in which writes the articles of one crawl run to the -O feed."""
+    def run(command, cwd, check):
+        with open(command[command.index("-O") + 1], "w", encoding="utf8") as f:
+            for article in found:
+                f.write(json.dumps(article) + "\n")
+    return run
+
+
+def _articles(root, paper="sun"):
+    with open(os.path.join(root, f"{paper}_articles.json"), encoding="utf8") as f:
+        return json.load(f)
+
+
+ARTICLES = [{"title": "a", "date": "6 Feb 2023", "content": "first"},
+            {"title": "b", "date": "7 Feb 2023", "content": "second"}]
+
+
+def test_second_crawl_without_new_articles_keeps_the_corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "ROOT", str(tmp_path))
+    monkeypatch.setattr(pipeline.subprocess, "run", _fake_scrapy(ARTICLES))
+    pipeline.crawl_spider("sun")
+    assert _articles(tmp_path) == ARTICLES
+    before = (tmp_path / "sun_articles.json").read_bytes()
+
+    # the frontier makes the spider skip everything it fetched before
+    monkeypatch.setattr(pipeline.subprocess, "run", _fake_scrapy([]))
+    pipeline.crawl_spider("sun")
+    assert (tmp_path / "sun_articles.json").read_bytes() == before
+    assert not (tmp_path / "sun_articles.run.jl").exists()
+
+
+def test_crawl_adds_new_articles_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, "ROOT", str(tmp_path))
+    monkeypatch.setattr(pipeline.subprocess, "run", _fake_scrapy(ARTICLES))
+    pipeline.crawl_spider("sun")
+    new = {"title": "c", "date": "8 Feb 2023", "content": "third"}
+    monkeypatch.setattr(pipeline.subprocess, "run", _fake_scrapy([ARTICLES[1], new]))
+    pipeline.crawl_spider("sun")
+    assert _articles(tmp_path) == ARTICLES + [new]
+
+
+def test_merge_articles_without_feed(tmp_path):
+    articles_file = str(tmp_path / "mail_articles.json")
+    assert pipeline.merge_articles(articles_file, str(tmp_path / "missing.jl")) == 0
+    assert _articles(tmp_path, "mail") == []
@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+from string import punctuation
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("scipy")
+
+import nltk_resources
+import preprocessing
+from collocations import compound_collocations
+from encoded_corpus import tagged_sentences
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LEMMAS = ["world", "cup", "kane", "score", "goal", "world", "cup"]
+TAGS = ["NN", "NN", "NNP", "VBD", "NN", "NN", "NN"]
+SENTENCE_LENGTHS = [3, 2, 0, 2]
+
+
+def test_collocations_does_not_import_preprocessing():
+    code = "import sys, collocations; sys.exit('preprocessing' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code], cwd=ROOT).returncode == 0
+
+
+def test_filter_lemmas_keeps_tags_and_sentences_aligned():
+    lemmas, tags, lengths = preprocessing._filter_lemmas(LEMMAS, TAGS, SENTENCE_LENGTHS, {"kane"})
+    assert lemmas == ["world", "cup", "score", "goal", "world", "cup"]
+    assert tags == ["NN", "NN", "VBD", "NN", "NN", "NN"]
+    assert lengths == [2, 2, 0, 2]
+
+
+def test_no_compound_spans_a_sentence_break():
+    lemmas, tags, lengths = preprocessing._filter_lemmas(LEMMAS, TAGS, SENTENCE_LENGTHS, {"kane"})
+    # "cup score" and "goal world" only occur across a sentence break
+    compounded, table = compound_collocations([lemmas] * 3, min_count=1, top=10, sentence_lengths=[lengths] * 3)
+    assert sorted(table["collocation"]) == ["score goal", "world cup"]
+    for doc in compounded:
+        assert doc == ["world_cup", "score_goal", "world_cup"]
+        compound_tags, compound_lengths = preprocessing._align_compounds(lemmas, tags, lengths, doc)
+        assert compound_tags == ["NN", "NN", "NN"] and compound_lengths == [1, 1, 0, 1]
+        start = lemma_start = 0
+        for sentence_length, length in zip(compound_lengths, lengths):
+            # the words of the compounds of a sentence are the lemmas of that sentence
+            words = [word for token in doc[start:start + sentence_length] for word in token.split("_")]
+            assert words == lemmas[lemma_start:lemma_start + length]
+            start += sentence_length
+            lemma_start += length
+
+
+def test_rare_token_removal_keeps_the_text_and_the_sentences_aligned():
+    df = pd.DataFrame({"lemmas": [LEMMAS], "lemma_tags": [TAGS], "sentence_lengths": [SENTENCE_LENGTHS],
+                       "lemmatised_text": [" ".join(LEMMAS)]})
+    rare_tokens, n_tokens = preprocessing.find_rare_tokens(df["lemmas"], rare_threshold=2)
+    assert rare_tokens == {"kane", "score", "goal"} and n_tokens == len(LEMMAS)
+    df = preprocessing._drop_lemmas(df, rare_tokens)
+    # the text is joined before rare tokens are removed, like the baseline did
+    assert df["lemmatised_text"].tolist() == ["world cup kane score goal world cup"]
+    assert next(tagged_sentences(df)) == [[("world", "NN"), ("cup", "NN")], [], [], [("world", "NN"), ("cup", "NN")]]
+
+
+def test_pos_unaware_lemmas_are_the_legacy_lemmas():
+    pytest.importorskip("nltk")
+    from nltk.corpus import stopwords
+    from nltk.stem import WordNetLemmatizer
+    from nltk.tokenize import word_tokenize
+    try:
+        nltk_resources.preload()
+    except LookupError:
+        pytest.skip("the NLTK data is not installed")
+    text = "Kane scored twice as England played Iran. The fans were singing in the stadiums!"
+    df, _, _ = preprocessing._preprocess_documents(pd.DataFrame({"content": [text]}), ["kane"], pos_aware=False)
+
+    # the chain of the old preprocess(): every token is lemmatised as a noun
+    tokens = [word.lower() for word in word_tokenize(text) if word not in punctuation]
+    tokens = [word for word in tokens if word not in stopwords.words("english") and word.isalpha()]
+    lemmatiser = WordNetLemmatizer()
+    legacy = [lemma for lemma in (lemmatiser.lemmatize(token) for token in tokens) if lemma != "kane"]
+    assert "played" in legacy and "fan" in legacy
+    assert df["lemmas"].tolist() == [legacy]
+    assert df["lemmatised_text"].tolist() == [" ".join(legacy)]
+
+    pos_aware, _, _ = preprocessing._preprocess_documents(pd.DataFrame({"content": [text]}), ["kane"])
+    assert "play" in pos_aware["lemmas"][0] and "played" not in pos_aware["lemmas"][0]
@@ -0,0 +1,37 @@
+import pytest
+
+pytest.importorskip("scrapy")
+pytest.importorskip("selenium")
+
+from crawler.replay import replay
+from crawler.response_cache import ResponseCache
+
+SEARCH_PAGE = """<html><body>
+<a class="teaser-anchor--search" href="https://www.thesun.co.uk/sport/1/">One</a>
+<a class="teaser-anchor--search" href="https://www.thesun.co.uk/sport/2/">Two</a>
+<a class="other" href="https://www.thesun.co.uk/tv/3/">Not a result</a>
+</body></html>"""
+
+
+def _article(title):
+    return f"""<html><body><h1 class="article__headline">{title}</h1>
+<span class="article__timestamp">20 Nov 2022</span>
+<div class="article__content"><p>First paragraph.</p><p>Second paragraph.</p></div>
+</body></html>"""
+
+
+def test_replay_extracts_links_and_articles_from_the_cache(tmp_path):
+    cache_dir = str(tmp_path / "sun_cache")
+    with ResponseCache(cache_dir) as cache:
+        cache.put("https://www.thesun.co.uk/?s=qatar+world+cup", SEARCH_PAGE, kind="search")
+        # the second search page links the same articles again
+        cache.put("https://www.thesun.co.uk/page/2/?s=qatar+world+cup%2F", SEARCH_PAGE + " ", kind="search")
+        cache.put("https://www.thesun.co.uk/sport/1/", _article("One"))
+        cache.put("https://www.thesun.co.uk/sport/2/", _article("Two"))
+
+    links, items = replay("sun", cache_dir=cache_dir, links_file=str(tmp_path / "links.txt"), workers=1,
+                          chunksize=2)
+    assert links == ["https://www.thesun.co.uk/sport/1/", "https://www.thesun.co.uk/sport/2/"]
+    assert (tmp_path / "links.txt").read_text().splitlines() == links
+    assert items == [{"title": title, "date": "20 Nov 2022", "content": "First paragraph. Second paragraph."}
+                     for title in ("One", "Two")]
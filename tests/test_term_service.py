@@ -0,0 +1,32 @@
+import logging
+
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("sklearn")
+pytest.importorskip("pyarrow")
+
+from term_service import TermService
+
+CSV = """title,date,lemmatised_text
+Kane scores,2022-11-21,kane score goal england
+Armband row,2022-11-22,armband fifa england card
+"""
+
+
+def test_load_all_skips_newspapers_whose_file_cannot_be_read(tmp_path, caplog):
+    (tmp_path / "good.csv").write_text(CSV)
+    (tmp_path / "columns.csv").write_text("title,date\nKane scores,2022-11-21\n")
+    # a truncated Parquet file is preferred over the CSV file of the same name
+    (tmp_path / "truncated.csv").write_text(CSV)
+    (tmp_path / "truncated.parquet").write_bytes(b"PAR1\x00\x00")
+    files = {name: str(tmp_path / f"{name}.csv") for name in ("good", "columns", "truncated", "missing")}
+
+    service = TermService(files)
+    with caplog.at_level(logging.WARNING, logger="term_service"):
+        service.load_all()
+
+    assert list(service.indexes) == ["good"]
+    assert service.indexes["good"].rank_of("england") >= 0
+    failed = {record.getMessage().split(":")[0] for record in caplog.records}
+    assert failed == {"columns", "truncated", "missing"}
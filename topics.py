@@ -0,0 +1,205 @@
+import logging
+import pickle
+import numpy as np
+import pandas as pd
+from corpus_store import corpus_file, read_corpus
+from methods import NEWSPAPER_CSV_FILES, SparseTermMatrix, _documents, df_to_dtm
+
+logger = logging.getLogger(__name__)
+
+# the most frequent terms of every newspaper, removed from the DTM in rstudio/topic.R
+TOP10_TERMS = ("world", "cup", "football", "qatar", "fifa", "tournament", "final", "team", "england", "ball")
+
+
+def prune_dtm(dtm, exclude=TOP10_TERMS):
+    """
+        Removes the given terms from a DTM and drops the documents which have no terms left, since LDA cannot handle
+        empty documents.
+
+        Parameters:
+            dtm (SparseTermMatrix): The document-term matrix (see methods.df_to_dtm() ).
+            exclude (iterable of str, optional): The terms to remove. Defaults to TOP10_TERMS.
+
+        Returns:
+            SparseTermMatrix: The pruned DTM, with its document metadata filtered accordingly.
+    """
+    keep_terms = ~dtm.columns.isin(list(exclude))
+    matrix = dtm.matrix[:, np.flatnonzero(keep_terms)]
+    keep_documents = np.flatnonzero(matrix.getnnz(axis=1) > 0)
+    documents = dtm.documents.iloc[keep_documents].reset_index(drop=True)
+    return SparseTermMatrix(matrix[keep_documents], dtm.columns[keep_terms], documents)
+
+
+class TopicModel:
+    """
+        Online (minibatch) LDA over a sparse DTM, the Python counterpart of rstudio/topic.R. Fitting uses
+        scikit-learn's online variational Bayes: the E-step of every minibatch is split across <workers> processes,
+        so wall-clock time goes down with the number of cores. The vocabulary is fixed by the first fit, and update()
+        warm-starts the model on new articles instead of refitting the whole corpus.
+
+        Attributes:
+            lda (LatentDirichletAllocation): The fitted scikit-learn model.
+            terms (pandas Index): The vocabulary, in column order of the topic-term matrix.
+            documents (pandas DataFrame): Metadata ('date', ...) of the documents seen so far.
+            doc_topic (numpy array): Documents x topics matrix of topic proportions (theta).
+    """
+
+    def __init__(self, n_topics=20, alpha=None, batch_size=256, passes=10, workers=-1, seed=1):
+        """
+            Parameters:
+                n_topics (int, optional): Number of topics (K). Defaults to 20.
+                alpha (float, optional): The document-topic prior; smaller values give more specific topic
+                                         distributions. Defaults to None (1 / n_topics).
+                batch_size (int, optional): Number of documents per minibatch. Defaults to 256.
+                passes (int, optional): Number of passes over the corpus in fit(). Defaults to 10.
+                workers (int, optional): Number of processes for the E-step, -1 for all cores. Defaults to -1.
+                seed (int, optional): Random seed. Defaults to 1.
+        """
+        # imported here, so that importing this module does not load scikit-learn
+        from sklearn.decomposition import LatentDirichletAllocation
+
+        self.lda = LatentDirichletAllocation(n_components=n_topics, doc_topic_prior=alpha,
+                                             learning_method='online', batch_size=batch_size, max_iter=passes,
+                                             n_jobs=workers, random_state=seed)
+        self.terms = None
+        self.documents = None
+        self.doc_topic = None
+
+    def __repr__(self):
+        state = 'unfitted' if self.terms is None else f"{len(self.documents)} documents x {len(self.terms)} terms"
+        return f"TopicModel({self.lda.n_components} topics, {state})"
+
+    def fit(self, dtm):
+        """
+            Fits the model on a DTM from scratch.
+
+            Parameters:
+                dtm (SparseTermMatrix): The (pruned, see prune_dtm() ) document-term matrix with count values.
+
+            Returns:
+                TopicModel: The fitted model itself.
+        """
+        self.terms = dtm.columns
+        self.documents = dtm.documents
+        self.lda.set_params(total_samples=dtm.shape[0])
+        self.doc_topic = self.lda.fit_transform(dtm.matrix)
+        return self
+
+    def update(self, df, passes=1):
+        """
+            Warm-starts the model on new articles: they are vectorised with the existing vocabulary (unknown terms are
+            ignored) and the topic-term distributions are updated with online minibatch steps.
+
+            Parameters:
+                df (pandas DataFrame): Preprocessed new articles with a 'lemmatised_text' column.
+                passes (int, optional): Number of passes over the new articles. Defaults to 1.
+
+            Returns:
+                TopicModel: The updated model itself.
+        """
+        from sklearn.feature_extraction.text import CountVectorizer
+
+        if self.terms is None:
+            raise ValueError("the model has to be fitted before it can be updated")
+        matrix = CountVectorizer(vocabulary=list(self.terms)).transform(df['lemmatised_text'])
+        keep_documents = np.flatnonzero(matrix.getnnz(axis=1) > 0)
+        matrix = matrix[keep_documents]
+        documents = _documents(df, self.documents.columns).iloc[keep_documents].reset_index(drop=True)
+        if matrix.shape[0] == 0:
+            return self
+
+        self.lda.set_params(total_samples=len(self.documents) + matrix.shape[0])
+        for _ in range(passes):
+            self.lda.partial_fit(matrix)
+        self.documents = pd.concat([self.documents, documents], ignore_index=True)
+        self.doc_topic = np.vstack([self.doc_topic, self.lda.transform(matrix)])
+        return self
+
+    def topic_term(self):
+        """
+            Returns the topic-term distributions (beta); every row sums to 1.
+
+            Returns:
+                pandas DataFrame: Topics x terms.
+        """
+        components = self.lda.components_
+        return pd.DataFrame(components / components.sum(axis=1, keepdims=True), columns=self.terms)
+
+    def top_terms(self, n=10):
+        """
+            Returns the n most probable terms of every topic, like terms(topicModel, 10) in R.
+
+            Parameters:
+                n (int, optional): Number of terms per topic. Defaults to 10.
+
+            Returns:
+                pandas DataFrame: One column per topic holding its top terms in descending order.
+        """
+        order = np.argsort(-self.lda.components_, axis=1)[:, :n]
+        return pd.DataFrame({topic: self.terms[order[topic]] for topic in range(len(order))})
+
+    def topic_names(self, n=5):
+        """Returns the names of the topics, made of their top n terms."""
+        return [' '.join(terms) for _, terms in self.top_terms(n).items()]
+
+    def document_topic(self):
+        """
+            Returns the topic proportions of every document (theta); every row sums to 1.
+
+            Returns:
+                pandas DataFrame: Documents x topics, with the document metadata appended.
+        """
+        theta = pd.DataFrame(self.doc_topic, columns=self.topic_names())
+        return pd.concat([theta, self.documents], axis=1)
+
+    def monthly_proportions(self):
+        """
+            Returns the mean topic proportions of the documents of every month.
+
+            Raises:
+                KeyError: If the documents have no 'date' metadata.
+
+            Returns:
+                pandas DataFrame: Months x topics.
+        """
+        months = pd.to_datetime(self.documents['date'], utc=True).dt.to_period('M')
+        theta = pd.DataFrame(self.doc_topic, columns=self.topic_names())
+        return theta.groupby(months.values).mean()
+
+    def save(self, path):
+        """Pickles the model, so it can be warm-started in a later run."""
+        with open(path, 'wb') as file:
+            pickle.dump(self, file)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a model pickled with save()."""
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+
+
+def fit_newspapers(files=None, n_topics=20, min_docfreq=0.01, max_docfreq=0.99, exclude=TOP10_TERMS, **kwargs):
+    """
+        Fits one topic model per newspaper in a single call, on the DTMs of their preprocessed files (Parquet files are
+        read instead of CSV files where they exist). The DTMs are trimmed like in rstudio/topic.R: terms in less than 1%
+        or more than 99% of the documents and the TOP10_TERMS are removed.
+
+        Parameters:
+            files (dict, optional): Maps newspaper names to their files. Defaults to NEWSPAPER_CSV_FILES.
+            n_topics (int, optional): Number of topics per model. Defaults to 20.
+            min_docfreq (float, optional): Minimum document frequency (proportion) of a term. Defaults to 0.01.
+            max_docfreq (float, optional): Maximum document frequency (proportion) of a term. Defaults to 0.99.
+            exclude (iterable of str, optional): Terms removed from the DTMs. Defaults to TOP10_TERMS.
+            **kwargs: Passed on to TopicModel, e.g. workers or passes.
+
+        Returns:
+            dict: Maps each newspaper name to its fitted TopicModel.
+    """
+    files = NEWSPAPER_CSV_FILES if files is None else files
+    models = {}
+    for newspaper, file in files.items():
+        df = read_corpus(corpus_file(file), columns=['date', 'lemmatised_text'])
+        dtm = prune_dtm(df_to_dtm(df, min_docfreq, max_docfreq, metadata=('date',)), exclude)
+        logger.info(f"fitting {n_topics} topics for {newspaper}: {dtm.shape[0]} documents x {dtm.shape[1]} terms")
+        models[newspaper] = TopicModel(n_topics, **kwargs).fit(dtm)
+    return models